@@ -1,7 +1,14 @@
 from flask import Flask
-from .models import db, User
+from .models import db, Machine, Session, DailyRevenue, DailyAnalytics, Reservation, load_cached_user
+from .availability import AvailabilityIndex
+from .analytics import OccupancyAnalytics
+from .cache import TTLCache
+from .events import MachineFeed
+from .metrics import init_metrics
+from .database import engine_options, replica_binds, init_read_replica, RecentWrites, upgrade_schema
 from flask_login import LoginManager
 import os # <--- NOUVEL IMPORT IMPORTANT
+from datetime import timedelta
 
 def create_app():
     app = Flask(__name__)
@@ -17,10 +24,16 @@ def create_app():
 
     app.config['SQLALCHEMY_DATABASE_URI'] = db_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool de connexions (MySQL) / WAL et busy_timeout (SQLite) : variables DB_* et SQLITE_*, voir database.py
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(db_url)
+    # Réplica MySQL optionnel pour le dashboard, l'historique et l'export (DATABASE_READ_URL)
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_READ_URL'))
     app.config['SECRET_KEY'] = 'dev-cle-secrete'
 
     # ... Le reste du fichier ne change pas ...
     db.init_app(app)
+    # Après une action, le navigateur lit le primaire quelques secondes (échéance dans le cookie de session)
+    init_read_replica(app, RecentWrites())
     
     login_manager = LoginManager()
     login_manager.login_view = 'main.login'
@@ -28,12 +41,65 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Cache par processus : les requêtes ordinaires ne relisent pas la table User
+        return load_cached_user(int(user_id))
 
-    from .routes import main_bp
+    # Flux temps réel des PC pour les dashboards ouverts (/events/machines)
+    def load_machines():
+        with app.app_context():
+            rows = db.session.query(Machine.id, Machine.name, Machine.status).order_by(Machine.id).all()
+            return [{'id': id, 'name': name, 'status': status} for id, name, status in rows]
+
+    interval = float(os.environ.get('MACHINE_FEED_INTERVAL', 5))
+    app.extensions['machine_feed'] = MachineFeed(load_machines, interval=interval)
+
+    from .routes import main_bp, local_now
     app.register_blueprint(main_bp)
 
-    with app.app_context():
-        db.create_all()
+    # Index en mémoire des réservations (conflits, PC voisins libres), rechargé depuis la BDD par différences
+    app.extensions['availability'] = AvailabilityIndex(
+        lambda since: Reservation.changes(since, local_now()), now=local_now,
+        sync_interval=float(os.environ.get('RESERVATION_SYNC_INTERVAL', 2)))
+
+    # Statistiques d'occupation (/analytics) : sessions balayées en NumPy par paquets, chaque jour clos
+    # calculé une seule fois puis lu dans DailyAnalytics (et gardé ANALYTICS_CACHE_TTL secondes par worker)
+    chunk_size = int(os.environ.get('ANALYTICS_CHUNK_SIZE', 50000))
+    app.extensions['analytics'] = OccupancyAnalytics(
+        lambda start, end: Session.intervals(start, end, chunk_size), DailyAnalytics.load, DailyAnalytics.save,
+        now=local_now, cache=TTLCache(maxsize=4096, ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 3600))))
+
+    # Latence par route et requêtes SQL par requête (warning si N+1), exposées sur /metrics
+    init_metrics(app)
+
+    # Schéma créé une seule fois par `flask --app app init-db` (initContainer Kubernetes),
+    # plus à chaque démarrage de worker gunicorn (create_app ne touche plus à la BDD)
+    @app.cli.command('init-db')
+    def init_db():
+        """Crée les tables manquantes et ajoute les colonnes apparues depuis (sans effet si c'est déjà fait)."""
+        for change in upgrade_schema(db):
+            print(f"Schéma : {change}")
+        # Base d'avant le cumul journalier : l'historique ne lit que DailyRevenue, on le remplit une fois
+        if DailyRevenue.query.first() is None and Session.query.filter(Session.end_time != None).first() is not None:
+            DailyRevenue.rebuild()
+            db.session.commit()
+            print("Cumul du chiffre d'affaires reconstruit à partir des sessions existantes.")
+        print("✅ Base initialisée.")
+
+    @app.cli.command('rebuild-revenue')
+    def rebuild_revenue():
+        """Reconstruit la table DailyRevenue à partir des sessions existantes."""
+        DailyRevenue.rebuild()
+        db.session.commit()
+        print("✅ Cumul du chiffre d'affaires reconstruit.")
+
+    @app.cli.command('rebuild-analytics')
+    def rebuild_analytics():
+        """Recalcule et fige les statistiques d'occupation des 365 derniers jours (après un import de sessions)."""
+        DailyAnalytics.query.delete()
+        db.session.commit()
+        analytics = app.extensions['analytics']
+        now = local_now()
+        days = analytics.days(now.date() - timedelta(days=365), now.date() - timedelta(days=1), now)
+        print(f"✅ Statistiques d'occupation recalculées sur {len(days)} jours.")
 
     return app
\ No newline at end of file
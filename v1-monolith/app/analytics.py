@@ -0,0 +1,330 @@
+# Copie de v2-microservices/service-billing/analytics.py (référence) : modifier les deux, voir v2-microservices/tests
+"""Statistiques d'occupation du parc : heatmap par PC et par heure, sessions simultanées, CA par heure.
+
+    analytics = OccupancyAnalytics(load_sessions, load_days, save_days, now=local_now, cache=TTLCache(4096, 3600))
+    report = analytics.report(date(2025, 1, 1), date(2025, 12, 31))   # dict prêt pour jsonify / un template
+
+Les sessions sont lues par paquets de colonnes (jamais un objet Session par ligne) et balayées en NumPy :
+- occupation : chaque intervalle [début, fin) est découpé en morceaux d'une heure (np.repeat), secondes
+  cumulées par (heure, PC) avec np.unique + np.bincount ;
+- simultanéité : +1 / -1 aux bornes de chaque session (minute pleine suivante), np.cumsum = nombre de
+  sessions en cours au début de chaque minute ;
+- CA, nombre et durée des sessions : np.bincount sur l'heure / le jour de fin (une session est payée à sa fin).
+Chaque jour clos est calculé une seule fois puis gardé en BDD (save_days, quelques Ko par jour) et dans le
+cache du worker : un rapport sur un an relit ~365 blocs au lieu de millions de sessions. Les jours encore
+ouverts (aujourd'hui, et hier pendant les `settle` premières minutes) sont recalculés à chaque rapport.
+Les jours clos manquants sont calculés et enregistrés par paquets de `chunk_days` jours ; avec un budget
+(report(..., budget=10)), un premier rapport sur des années de sessions s'arrête après le paquet qui dépasse
+le budget et lève AnalyticsPending : la requête suivante reprend là où celle-ci s'est arrêtée.
+Heures locales naïves, comme Session.start_time / end_time.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 24 * HOUR_SECONDS
+DAY_MINUTES = 24 * 60
+_MACHINE_BITS = 32  # clé d'occupation = heure << 32 | machine_id
+
+
+def columns(rows):
+    """Paquet de lignes (machine_id, start_time, end_time, total_price) -> colonnes NumPy.
+    Dates en secondes depuis 1970 (int64), fin à -1 pour une session en cours."""
+    machine_ids, starts, ends, prices = zip(*rows)
+    ends = np.array(ends, dtype='datetime64[s]')  # None -> NaT
+    return (np.array(machine_ids, dtype=np.int64),
+            np.array(starts, dtype='datetime64[s]').astype(np.int64),
+            np.where(np.isnat(ends), -1, ends.astype(np.int64)),
+            np.nan_to_num(np.array(prices, dtype=np.float64)))
+
+
+def _seconds(day):
+    return int(np.datetime64(day, 'D').astype('datetime64[s]').astype(np.int64))
+
+
+class DayStats:
+    """Statistiques d'une journée, en heures locales 0-23"""
+    __slots__ = ('machine_ids', 'busy', 'concurrency', 'revenue', 'sessions', 'session_seconds')
+
+    def __init__(self, machine_ids, busy, concurrency, revenue, sessions, session_seconds):
+        self.machine_ids = machine_ids          # int64 [M] : PC utilisés ce jour-là, triés
+        self.busy = busy                        # float32 [M, 24] : secondes occupées par PC et par heure
+        self.concurrency = concurrency          # uint16 [1440] : sessions en cours au début de chaque minute
+        self.revenue = revenue                  # float64 [24] : CA des sessions terminées dans chaque heure
+        self.sessions = sessions                # sessions terminées ce jour-là
+        self.session_seconds = session_seconds  # leur durée cumulée
+
+    def to_bytes(self):
+        """Bloc binaire pour la BDD (~100 octets par PC utilisé + 3 Ko)"""
+        return b''.join([
+            np.array([len(self.machine_ids), self.sessions], dtype=np.int64).tobytes(),
+            np.concatenate([[self.session_seconds], self.revenue]).astype(np.float64).tobytes(),
+            self.machine_ids.astype(np.int64).tobytes(),
+            self.busy.astype(np.float32).tobytes(),
+            self.concurrency.astype(np.uint16).tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        count, sessions = np.frombuffer(data, dtype=np.int64, count=2).tolist()
+        offset = 16
+        floats = np.frombuffer(data, dtype=np.float64, count=25, offset=offset)
+        offset += 25 * 8
+        machine_ids = np.frombuffer(data, dtype=np.int64, count=count, offset=offset)
+        offset += count * 8
+        busy = np.frombuffer(data, dtype=np.float32, count=count * 24, offset=offset).reshape(count, 24)
+        offset += count * 24 * 4
+        concurrency = np.frombuffer(data, dtype=np.uint16, count=DAY_MINUTES, offset=offset)
+        return cls(machine_ids, busy, concurrency, floats[1:], sessions, float(floats[0]))
+
+
+def sweep(chunks, first_day, days, until=None):
+    """DayStats des `days` jours à partir de first_day.
+
+    chunks : paquets de colonnes (voir columns()) des sessions qui chevauchent la période.
+    until : instant (secondes depuis 1970) où s'arrête le calcul, fin des sessions encore ouvertes.
+    """
+    origin = _seconds(first_day)
+    limit = origin + days * DAY_SECONDS
+    if until is not None:
+        limit = min(limit, until)
+    hours = days * 24
+
+    keys, seconds = [], []  # occupation de chaque paquet, déjà regroupée par (heure, PC)
+    deltas = np.zeros(days * DAY_MINUTES + 1, dtype=np.int64)
+    revenue = np.zeros(hours)
+    ended = np.zeros(days, dtype=np.int64)
+    durations = np.zeros(days)
+
+    for machine_ids, starts, ends, prices in chunks:
+        # Sessions terminées dans la période : comptées à leur heure de fin
+        done = (ends >= origin) & (ends < limit)
+        end_hours = (ends[done] - origin) // HOUR_SECONDS
+        revenue += np.bincount(end_hours, weights=prices[done], minlength=hours)
+        ended += np.bincount(end_hours // 24, minlength=days)
+        durations += np.bincount(end_hours // 24, weights=ends[done] - starts[done], minlength=days)
+
+        # Intervalles ramenés à la période (une session en cours court jusqu'à `limit`)
+        s = np.maximum(starts, origin) - origin
+        e = np.minimum(np.where(ends < 0, limit, ends), limit) - origin
+        keep = e > s
+        machine_ids, s, e = machine_ids[keep], s[keep], e[keep]
+        if not len(s):
+            continue
+
+        # Simultanéité : présente au début de la minute m si début <= 60 m < fin
+        deltas += np.bincount(-(-s // 60), minlength=len(deltas))
+        deltas -= np.bincount(-(-e // 60), minlength=len(deltas))
+
+        # Occupation : un morceau par heure touchée, secondes de recouvrement avec cette heure
+        first = s // HOUR_SECONDS
+        pieces = (e - 1) // HOUR_SECONDS - first + 1
+        owner = np.repeat(np.arange(len(s)), pieces)
+        hour = first[owner] + np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        overlap = (np.minimum(e[owner], (hour + 1) * HOUR_SECONDS)
+                   - np.maximum(s[owner], hour * HOUR_SECONDS))
+        unique, inverse = np.unique((hour << _MACHINE_BITS) | machine_ids[owner], return_inverse=True)
+        keys.append(unique)
+        seconds.append(np.bincount(inverse, weights=overlap))
+
+    if keys:
+        unique, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        total = np.bincount(inverse, weights=np.concatenate(seconds))
+    else:
+        unique, total = np.zeros(0, dtype=np.int64), np.zeros(0)
+    hour = unique >> _MACHINE_BITS
+    machine = unique & ((1 << _MACHINE_BITS) - 1)
+    concurrency = np.cumsum(deltas)[:-1].reshape(days, DAY_MINUTES).clip(0, np.iinfo(np.uint16).max)
+
+    # Clés triées par heure, donc par jour : une tranche par jour
+    bounds = np.searchsorted(hour, np.arange(days + 1) * 24)
+    stats = []
+    for day in range(days):
+        lo, hi = bounds[day], bounds[day + 1]
+        machine_ids, rows = np.unique(machine[lo:hi], return_inverse=True)
+        busy = np.zeros((len(machine_ids), 24), dtype=np.float32)
+        busy[rows, hour[lo:hi] % 24] = total[lo:hi]
+        stats.append(DayStats(machine_ids, busy, concurrency[day].astype(np.uint16),
+                              revenue[day * 24:(day + 1) * 24], int(ended[day]), float(durations[day])))
+    return stats
+
+
+def summarize(days, now):
+    """Rapport d'une liste [(date, DayStats)] consécutive, jusqu'à `now` au plus"""
+    today = now.date()
+    stats = [day_stats for _, day_stats in days]
+
+    machine_ids, inverse = np.unique(np.concatenate([s.machine_ids for s in stats]), return_inverse=True)
+    cells = (inverse[:, None] * 24 + np.arange(24)).ravel()  # case (PC, heure) de chaque ligne de chaque jour
+    busy = np.bincount(cells, weights=np.concatenate([s.busy for s in stats]).ravel(),
+                       minlength=len(machine_ids) * 24).reshape(len(machine_ids), 24)
+
+    # Secondes écoulées de chaque heure de la journée sur la période (aujourd'hui : jusqu'à maintenant)
+    capacity = np.full(24, float(sum(1 for day, _ in days if day < today) * HOUR_SECONDS))
+    if any(day == today for day, _ in days):
+        elapsed = (now - datetime.combine(today, datetime.min.time())).total_seconds()
+        capacity += np.clip(elapsed - np.arange(24) * HOUR_SECONDS, 0, HOUR_SECONDS)
+    per_hour = np.maximum(capacity, 1.0)
+
+    curves = np.stack([s.concurrency for s in stats]).astype(np.int64)
+    peak_index = int(curves.argmax())
+    peak = int(curves.flat[peak_index])
+    peak_at = None
+    if peak:
+        day, minute = divmod(peak_index, DAY_MINUTES)
+        peak_at = (datetime.combine(days[day][0], datetime.min.time()) + timedelta(minutes=minute)).isoformat()
+
+    revenue = np.sum([s.revenue for s in stats], axis=0)
+    sessions = sum(s.sessions for s in stats)
+    session_seconds = sum(s.session_seconds for s in stats)
+    machine_capacity = max(len(machine_ids), 1) * capacity
+
+    return {
+        'from': days[0][0].isoformat(),
+        'to': days[-1][0].isoformat(),
+        'machines': [
+            {'machine_id': machine_id, 'busy_hours': round(hours, 1), 'utilization': utilization}
+            for machine_id, hours, utilization in zip(
+                machine_ids.tolist(), (busy.sum(axis=1) / HOUR_SECONDS).tolist(),
+                np.round(np.clip(busy / per_hour, 0, 1), 3).tolist())
+        ],
+        # Parc = PC utilisés au moins une fois sur la période
+        'utilization': round(min(float(busy.sum() / max(machine_capacity.sum(), 1.0)), 1.0), 3),
+        'utilization_by_hour': np.round(
+            np.clip(busy.sum(axis=0) / np.maximum(machine_capacity, 1.0), 0, 1), 3).tolist(),
+        'concurrency': {
+            'peak': peak,
+            'peak_at': peak_at,
+            'mean_by_hour': np.round(busy.sum(axis=0) / per_hour, 2).tolist(),
+            'peak_by_hour': curves.reshape(len(stats), 24, 60).max(axis=(0, 2)).tolist(),
+        },
+        'revenue': round(float(revenue.sum()), 2),
+        'revenue_by_hour': np.round(revenue, 2).tolist(),
+        'sessions': sessions,
+        'average_session_minutes': round(session_seconds / sessions / 60, 1) if sessions else 0.0,
+        'daily': [
+            {'day': day.isoformat(), 'sessions': s.sessions, 'revenue': round(float(s.revenue.sum()), 2),
+             'busy_hours': round(float(s.busy.sum()) / HOUR_SECONDS, 1), 'peak': int(s.concurrency.max())}
+            for day, s in days
+        ],
+    }
+
+
+class AnalyticsPending(Exception):
+    """Budget de temps épuisé avant d'avoir tous les jours clos : `done` jours prêts sur `total` à calculer.
+    Les jours déjà calculés sont enregistrés, le calcul reprend au prochain rapport."""
+
+    def __init__(self, done, total):
+        super().__init__(f"{done} jours calculés sur {total}")
+        self.done = done
+        self.total = total
+
+
+class OccupancyAnalytics:
+
+    def __init__(self, load_sessions, load_days, save_days, now, cache, settle=timedelta(minutes=5),
+                 chunk_days=31):
+        # load_sessions(start, end) : paquets de lignes (machine_id, start_time, end_time, total_price) des
+        #   sessions qui chevauchent [start, end), end_time None pour une session en cours ; end None : jusqu'à
+        #   maintenant (jours ouverts, aucune session ne commence après)
+        # load_days(first, last) -> {date: bytes} et save_days({date: bytes}) : jours clos gardés en BDD
+        # cache : TTLCache date -> DayStats du worker (un recalcul fait par un autre processus y entre après le TTL)
+        # settle : un jour n'est figé qu'après ce délai (sessions arrêtées juste avant minuit, retard du réplica)
+        # chunk_days : jours clos calculés puis enregistrés d'un coup (un calcul interrompu garde les paquets finis)
+        self.load_sessions = load_sessions
+        self.load_days = load_days
+        self.save_days = save_days
+        self.now = now
+        self.cache = cache
+        self.settle = settle
+        self.chunk_days = chunk_days
+        self._lock = threading.Lock()  # un seul calcul de jours clos à la fois par worker
+
+    def report(self, first, last, budget=None):
+        """Rapport des jours [first, last] (dates incluses), limité à aujourd'hui.
+        budget : secondes de calcul des jours clos manquants, au-delà AnalyticsPending (None : sans limite)"""
+        now = self.now()
+        last = min(last, now.date())
+        if last < first:
+            raise ValueError("période vide")
+        return summarize(self.days(first, last, now, budget), now)
+
+    def days(self, first, last, now, budget=None):
+        """[(date, DayStats)] de chaque jour de [first, last] : cache du worker, puis BDD, puis sessions"""
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        frozen = (now - self.settle).date()  # jours figés : strictement avant
+        found = {day: self.cache.get(day) for day in dates if day < frozen}
+        missing = [day for day, stats in found.items() if stats is None]
+        if missing:
+            deadline = None if budget is None else time.monotonic() + budget
+            found.update(self._closed_days(missing, deadline, len(found) - len(missing)))
+
+        live = [day for day in dates if day >= frozen]
+        if live:
+            found.update(zip(live, self._compute(live[0], len(live), now)))
+        return [(day, found[day]) for day in dates]
+
+    def _closed_days(self, missing, deadline, known=0):
+        """{date: DayStats} des jours clos `missing` (triés), lus en BDD ou calculés et enregistrés par paquets.
+        Au moins un paquet par appel, puis AnalyticsPending si `deadline` (time.monotonic()) est dépassée
+        (progression comptée sur les `known` jours clos déjà prêts + `missing`)."""
+        timeout = -1 if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self._lock.acquire(timeout=timeout):
+            # Une autre requête de ce worker calcule déjà : on ne l'attend pas au-delà du budget
+            done = sum(self.cache.get(day) is not None for day in missing)
+            raise AnalyticsPending(known + done, known + len(missing))
+        try:
+            ready = {day: self.cache.get(day) for day in missing}  # calculés entre-temps par une autre requête ?
+            todo = [day for day, stats in ready.items() if stats is None]
+            stored = self.load_days(todo[0], todo[-1]) if todo else {}
+            for day in todo:
+                if day in stored:
+                    ready[day] = DayStats.from_bytes(stored[day])
+                    self.cache.set(day, ready[day])
+            todo = [day for day in todo if day not in stored]
+            for offset in range(0, len(todo), self.chunk_days):
+                chunk = todo[offset:offset + self.chunk_days]
+                computed = {}
+                for start, count in _runs(chunk):
+                    computed.update(zip(_dates(start, count), self._compute(start, count)))
+                self.save_days({day: stats.to_bytes() for day, stats in computed.items()})
+                for day, stats in computed.items():
+                    ready[day] = stats
+                    self.cache.set(day, stats)
+                done = offset + len(chunk)
+                if deadline is not None and time.monotonic() >= deadline and done < len(todo):
+                    raise AnalyticsPending(known + len(missing) - len(todo) + done, known + len(missing))
+            return ready
+        finally:
+            self._lock.release()
+
+    def _compute(self, first, count, now=None):
+        start = datetime.combine(first, datetime.min.time())
+        if now is None:
+            rows = self.load_sessions(start, start + timedelta(days=count))
+        else:
+            rows = self.load_sessions(start, None)
+        return sweep((columns(chunk) for chunk in rows if chunk), first, count,
+                     None if now is None else _seconds_of(now))
+
+
+def _seconds_of(moment):
+    return int(np.datetime64(moment, 's').astype(np.int64))
+
+
+def _dates(first, count):
+    return [first + timedelta(days=i) for i in range(count)]
+
+
+def _runs(dates):
+    """Dates triées -> [(première date, nombre de jours)] des suites de jours consécutifs"""
+    runs = []
+    for day in dates:
+        if runs and runs[-1][0] + timedelta(days=runs[-1][1]) == day:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((day, 1))
+    return runs
@@ -0,0 +1,176 @@
+# Copie de v2-microservices/common/availability.py (référence) : modifier les deux, voir v2-microservices/tests
+"""Index en mémoire des réservations de PC : conflits et recherche de PC libres sans parcourir la BDD.
+
+    availability = AvailabilityIndex(load_reservations, now=lambda: datetime.now(TZ_QUEBEC).replace(tzinfo=None))
+    availability.sync()                                    # au début d'une requête (au plus toutes les 2 s)
+    availability.conflicts(machine_id, start, end)         # [] si le créneau est libre
+    availability.find_adjacent(machine_ids, 4, start, end) # 4 PC voisins libres, ou None
+
+Sur un PC, deux réservations ne se chevauchent jamais (vérifié en BDD à la création) : triées par début,
+elles sont donc aussi triées par fin, et des listes triées suffisent (pas besoin d'arbre d'intervalles) :
+- conflit sur [début, fin) : bisect sur les débuts puis on remonte tant que la fin dépasse le début demandé,
+  O(log n + k) avec k = réservations en conflit ;
+- N PC voisins libres : un test O(log n) par PC, dans l'ordre du parc.
+
+L'index est par processus (worker gunicorn) : les réservations faites ou annulées par les autres workers
+y entrent au prochain sync(), au plus tard après `sync_interval` secondes. La BDD reste la référence :
+l'index sert à répondre vite et à refuser tôt, l'écriture revérifie le créneau en BDD.
+"""
+import bisect
+import threading
+import time
+
+
+class MachineSchedule:
+    """Réservations d'un PC, triées par début (listes parallèles)"""
+    __slots__ = ('starts', 'ends', 'ids', 'users')
+
+    def __init__(self):
+        self.starts, self.ends, self.ids, self.users = [], [], [], []
+
+    def overlapping(self, start, end):
+        """Positions des réservations qui chevauchent [start, end), de la plus tardive à la plus tôt"""
+        i = bisect.bisect_left(self.starts, end)
+        found = []
+        while i > 0 and self.ends[i - 1] > start:
+            i -= 1
+            found.append(i)
+        return found
+
+    def add(self, reservation_id, user_id, start, end):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, reservation_id)
+        self.users.insert(i, user_id)
+
+    def remove(self, reservation_id, start):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ids[i] == reservation_id:
+                for column in (self.starts, self.ends, self.ids, self.users):
+                    del column[i]
+                return
+            i += 1
+
+    def prune(self, before):
+        """Oublie les réservations terminées avant `before`. Renvoie leurs ids."""
+        i = bisect.bisect_right(self.ends, before)
+        pruned = self.ids[:i]
+        for column in (self.starts, self.ends, self.ids, self.users):
+            del column[:i]
+        return pruned
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class AvailabilityIndex:
+
+    def __init__(self, load, now, sync_interval=2.0):
+        # load(since) -> (lignes, jeton) ; lignes = [(id, machine_id, user_id, début, fin, active)] modifiées depuis
+        # le jeton `since` renvoyé par l'appel précédent (None = toutes les réservations à venir)
+        self.load = load
+        self.now = now  # heure courante, dans le même fuseau que les réservations
+        self.sync_interval = sync_interval
+        self._schedules = {}
+        self._reservations = {}  # id -> (machine_id, début), pour retrouver une réservation modifiée
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._token = None
+        self._next_sync = 0.0
+
+    # --- SYNCHRONISATION AVEC LA BDD ---
+
+    def sync(self, force=False):
+        """Applique les réservations modifiées en BDD depuis la dernière synchro (au plus une fois par intervalle)"""
+        if not force and time.monotonic() < self._next_sync:
+            return
+        with self._sync_lock:
+            if not force and time.monotonic() < self._next_sync:
+                return  # un autre thread vient de le faire
+            rows, token = self.load(self._token)
+            cutoff = self.now()
+            with self._lock:
+                for row in rows:
+                    self._apply(row, cutoff)
+                for schedule in self._schedules.values():
+                    for reservation_id in schedule.prune(cutoff):
+                        self._reservations.pop(reservation_id, None)
+            self._token = token
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def reset(self):
+        """Oublie tout : la prochaine synchro recharge les réservations à venir (après une remise à zéro de la BDD)"""
+        with self._sync_lock, self._lock:
+            self._schedules.clear()
+            self._reservations.clear()
+            self._token = None
+            self._next_sync = 0.0
+
+    def add(self, reservation_id, machine_id, user_id, start, end):
+        """Réservation créée par ce worker (après son commit) : visible tout de suite, sans attendre sync()"""
+        with self._lock:
+            self._apply((reservation_id, machine_id, user_id, start, end, True), None)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            self._forget(reservation_id)
+
+    def _apply(self, row, cutoff):
+        reservation_id, machine_id, user_id, start, end, active = row
+        self._forget(reservation_id)
+        if not active or (cutoff is not None and end <= cutoff):
+            return
+        schedule = self._schedules.get(machine_id)
+        if schedule is None:
+            schedule = self._schedules[machine_id] = MachineSchedule()
+        schedule.add(reservation_id, user_id, start, end)
+        self._reservations[reservation_id] = (machine_id, start)
+
+    def _forget(self, reservation_id):
+        previous = self._reservations.pop(reservation_id, None)
+        if previous is not None:
+            machine_id, start = previous
+            self._schedules[machine_id].remove(reservation_id, start)
+
+    # --- REQUÊTES ---
+
+    def conflicts(self, machine_id, start, end, user_id=None):
+        """Réservations [(id, user_id, début, fin)] qui chevauchent [start, end) sur ce PC
+        (sauf celles de `user_id` : on ne se gêne pas soi-même)"""
+        with self._lock:
+            schedule = self._schedules.get(machine_id)
+            if schedule is None:
+                return []
+            return [(schedule.ids[i], schedule.users[i], schedule.starts[i], schedule.ends[i])
+                    for i in schedule.overlapping(start, end) if user_id is None or schedule.users[i] != user_id]
+
+    def is_free(self, machine_id, start, end):
+        with self._lock:
+            schedule = self._schedules.get(machine_id)
+            return schedule is None or not schedule.overlapping(start, end)
+
+    def free_machines(self, machine_ids, start, end):
+        """PC de `machine_ids` (dans cet ordre) sans réservation sur [start, end)"""
+        with self._lock:
+            return [machine_id for machine_id in machine_ids
+                    if machine_id not in self._schedules or not self._schedules[machine_id].overlapping(start, end)]
+
+    def find_adjacent(self, machine_ids, count, start, end, taken=()):
+        """Les `count` premiers PC consécutifs de `machine_ids` (ordre du parc) libres sur [start, end), ou None.
+        `taken` : PC à considérer comme pris quoi qu'il arrive (ex. session en cours)"""
+        run = []
+        with self._lock:
+            for machine_id in machine_ids:
+                schedule = self._schedules.get(machine_id)
+                if machine_id in taken or (schedule is not None and schedule.overlapping(start, end)):
+                    run = []
+                    continue
+                run.append(machine_id)
+                if len(run) == count:
+                    return run
+        return None
+
+    def __len__(self):
+        return len(self._reservations)
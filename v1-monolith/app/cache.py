@@ -0,0 +1,69 @@
+# Copie de v2-microservices/common/cache.py (référence) : modifier les deux, voir v2-microservices/tests
+"""Cache mémoire (par processus) avec expiration (TTL) et éviction LRU, plus un bus d'invalidation.
+
+    cache = TTLCache(maxsize=256, ttl=5)
+    invalidations = InvalidationBus()
+    invalidations.subscribe(cache.invalidate)
+    ...
+    invalidations.publish('machines')   # après un commit qui modifie les machines
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+
+    def __init__(self, maxsize=128, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # clé -> (expire_at, valeur), de la moins à la plus récemment utilisée
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expire_at, value = entry
+            if expire_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InvalidationBus:
+    """Pub/sub en mémoire : les abonnés reçoivent la clé modifiée (None = tout invalider).
+    Limité au processus : un autre worker gunicorn ne reçoit rien, seul le TTL de ses caches le rattrape."""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, key=None):
+        for callback in list(self._subscribers):
+            callback(key)
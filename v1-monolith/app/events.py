@@ -0,0 +1,107 @@
+# Copie de v2-microservices/common/feed.py (référence) : modifier les deux, voir v2-microservices/tests
+"""Flux des changements de statut des PC, partagé par tous les dashboards ouverts (SSE).
+
+Un seul thread par processus recharge la liste des PC (quand on le prévient via notify(),
+ou toutes les `interval` secondes pour voir les changements faits par d'autres workers),
+calcule les différences avec la version précédente et les pousse à tous les abonnés :
+N dashboards ouverts = 1 chargement + 1 diffusion, au lieu de N rechargements de page.
+"""
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 5000))
+
+
+class MachineFeed:
+
+    def __init__(self, fetch, interval=5.0):
+        self.fetch = fetch  # () -> liste de dicts {'id':..., 'name':..., 'status':...}
+        self.interval = interval
+        self._snapshot = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """callback(deltas) est appelé depuis le thread du flux. Renvoie l'état actuel (liste de PC),
+        ou None si la liste des PC est illisible (l'appelant se désabonne et renvoie sse_unavailable())."""
+        with self._lock:
+            self._subscribers.add(callback)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='machine-feed', daemon=True)
+                self._thread.start()
+            snapshot = self._snapshot
+
+        if snapshot is None:
+            try:
+                snapshot = {m['id']: m for m in self.fetch()}
+            except Exception as e:
+                # Surtout pas de liste vide : le dashboard croirait que tous les PC ont disparu
+                logger.warning("Rechargement des PC impossible : %s", e)
+                return None
+            with self._lock:
+                self._snapshot = self._snapshot if self._snapshot is not None else snapshot
+        return list(snapshot.values())
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.discard(callback)
+
+    def notify(self):
+        """À appeler après un commit qui change un PC : les abonnés reçoivent la différence tout de suite"""
+        self._wakeup.set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Plus personne n'écoute : on arrête le thread (il repartira au prochain abonné)
+                    self._thread = None
+                    self._snapshot = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Rechargement des PC impossible : %s", e)
+
+    def refresh(self):
+        current = {m['id']: m for m in self.fetch()}
+        with self._lock:
+            previous = self._snapshot or {}
+            self._snapshot = current
+            subscribers = list(self._subscribers)
+
+        deltas = [m for machine_id, m in current.items() if previous.get(machine_id) != m]
+        deltas += [{'id': machine_id, 'deleted': True} for machine_id in previous if machine_id not in current]
+        if not deltas:
+            return
+
+        for callback in subscribers:
+            try:
+                callback(deltas)
+            except Exception:
+                # Abonné trop lent (file pleine) ou déconnecté : on le retire
+                self.unsubscribe(callback)
+
+
+def sse_message(event, data, retry=None):
+    """Formate un message Server-Sent Events (data en JSON sur une ligne, retry : délai de reconnexion en ms)"""
+    prefix = f"retry: {int(retry)}\n" if retry is not None else ''
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_unavailable(retry=SSE_RETRY_MS):
+    """Dernier message d'un flux fermé faute d'état initial : le navigateur (EventSource) se reconnecte après
+    `retry` ms et reçoit alors un 'snapshot' complet"""
+    return sse_message('unavailable', {'error': 'Liste des PC indisponible, nouvel essai bientôt'}, retry=retry)
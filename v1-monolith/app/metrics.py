@@ -0,0 +1,213 @@
+# Copie de v2-microservices/common/metrics.py (référence) : modifier les deux, voir v2-microservices/tests
+"""Métriques Prometheus (format texte) : latence par route, requêtes SQL par requête HTTP,
+latence des appels vers les autres services.
+
+    init_metrics(app)             # hooks Flask + écouteurs SQLAlchemy + route /metrics
+    init_metrics(app, sql=False)  # Gateway (pas de base de données)
+
+- http_request_duration_seconds{method, route, status} : latence de chaque route (modèle de route,
+  ex. /machines/<int:machine_id>, pas l'URL : nombre de séries borné) ;
+- http_request_sql_queries / http_request_sql_duration_seconds{method, route} : nombre et durée
+  des requêtes SQL d'UNE requête HTTP. Au-delà de SQL_QUERY_THRESHOLD (20) requêtes, un warning
+  est loggé (signe d'un N+1 : une requête SQL par ligne au lieu d'une seule pour la liste) ;
+- sql_query_duration_seconds{context} : toutes les requêtes SQL, y compris celles des threads
+  de fond (dispatcher outbox, flux SSE) ;
+- downstream_request_duration_seconds{service, method, status} : chaque appel HTTP d'un
+  ServiceClient (chaque essai compte, status = code HTTP ou 'error').
+
+Séries enregistrées avec le client officiel (prometheus_client). Avec PROMETHEUS_MULTIPROC_DIR (posé par
+common/gunicorn_conf.py en v2, par le Dockerfile en v1), chaque worker gunicorn écrit ses compteurs dans ce dossier
+et /metrics renvoie la somme de tous les workers. Les jauges calculées au scrape (register_gauge) sont celles du worker qui répond.
+
+    HITS = Counter('cache_hits_total', 'Succès du cache.', ('cache',))
+    HITS.labels('machines').inc()
+    register_gauge('machines_offline', 'PC hors ligne.', lambda: [((), 3)])
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, \
+    disable_created_metrics, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+SQL_QUERY_THRESHOLD = int(os.environ.get('SQL_QUERY_THRESHOLD', 20))
+
+# Bornes par défaut du client Prometheus officiel (secondes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Pas de série *_created par compteur : rien ne les lit, et elles doublent la taille de /metrics
+disable_created_metrics()
+
+
+class _GaugeCollector:
+    """Jauge recalculée à chaque scrape : collect() renvoie [(valeurs des labels, valeur)]"""
+
+    def __init__(self, name, documentation, labels, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._collect = collect
+
+    def describe(self):
+        # Sans describe(), le registre appellerait collect() à l'enregistrement (requête SQL à l'import)
+        yield GaugeMetricFamily(self.name, self.documentation, labels=self.labels)
+
+    def collect(self):
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labels)
+        for label_values, value in self._collect():
+            family.add_metric([str(v) for v in label_values], value)
+        yield family
+
+
+_gauges = []
+
+
+def register_gauge(name, documentation, collect, labels=()):
+    """Jauge calculée au moment du scrape (ex. COUNT en BDD, état du pool de connexions)"""
+    gauge = _GaugeCollector(name, documentation, labels, collect)
+    _gauges.append(gauge)
+    if not _multiprocess():
+        REGISTRY.register(gauge)
+    return gauge
+
+
+def samples(metric):
+    """(nom, labels, valeur) de chaque série d'une métrique de ce processus (benchmarks)"""
+    for family in metric.collect():
+        for sample in family.samples:
+            yield sample.name, sample.labels, sample.value
+
+
+def render():
+    """Toutes les métriques au format texte Prometheus (somme des workers en multiprocess)"""
+    if not _multiprocess():
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for gauge in _gauges:
+        registry.register(gauge)
+    return generate_latest(registry)
+
+
+def _multiprocess():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Latence des requêtes HTTP par route.', ('method', 'route', 'status'),
+    buckets=LATENCY_BUCKETS)
+REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', 'Nombre de requêtes SQL par requête HTTP.', ('method', 'route'),
+    buckets=QUERY_COUNT_BUCKETS)
+REQUEST_SQL_DURATION = Histogram(
+    'http_request_sql_duration_seconds', 'Temps passé en SQL par requête HTTP.', ('method', 'route'),
+    buckets=LATENCY_BUCKETS)
+REQUESTS_OVER_THRESHOLD = Counter(
+    'http_requests_over_sql_threshold_total', 'Requêtes HTTP au-delà de SQL_QUERY_THRESHOLD requêtes SQL.',
+    ('method', 'route'))
+SQL_QUERY_DURATION = Histogram(
+    'sql_query_duration_seconds', 'Latence de chaque requête SQL (request = pendant une requête HTTP).',
+    ('context',), buckets=LATENCY_BUCKETS)
+DOWNSTREAM_DURATION = Histogram(
+    'downstream_request_duration_seconds', 'Latence des appels HTTP vers les autres services.',
+    ('service', 'method', 'status'), buckets=LATENCY_BUCKETS)
+
+
+# --- REQUÊTES HTTP ---
+
+def init_metrics(app, path='/metrics', sql=True):
+    """Instrumente une application Flask et expose les métriques sur `path` (sql=False : pas de BDD)"""
+    if sql:
+        instrument_sqlalchemy()
+
+    @app.before_request
+    def _start_request_metrics():
+        g._metrics = {'start': time.perf_counter(), 'status': 500}
+        if sql:
+            g._metrics.update(sql_queries=0, sql_time=0.0)
+
+    @app.after_request
+    def _record_status(response):
+        current = g.get('_metrics')
+        if current is not None:
+            current['status'] = response.status_code
+        return response
+
+    # teardown plutôt qu'after_request : un export en flux (stream_with_context) garde le contexte
+    # de requête jusqu'à la dernière ligne, donc ses requêtes SQL et sa durée complète sont comptées
+    @app.teardown_request
+    def _record_request_metrics(error=None):
+        current = g.pop('_metrics', None)
+        if current is None:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        record_request(request.method, route, current['status'], time.perf_counter() - current['start'],
+                       current.get('sql_queries'), current.get('sql_time'))
+
+    @app.route(path)
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE_LATEST)
+
+
+def record_request(method, route, status, duration, sql_queries=None, sql_time=None):
+    """Enregistre une requête HTTP terminée (appelé aussi par le Gateway asynchrone)"""
+    REQUEST_DURATION.labels(method, route, str(status)).observe(duration)
+    if sql_queries is None:
+        return
+    REQUEST_SQL_QUERIES.labels(method, route).observe(sql_queries)
+    REQUEST_SQL_DURATION.labels(method, route).observe(sql_time)
+    if sql_queries > SQL_QUERY_THRESHOLD:
+        REQUESTS_OVER_THRESHOLD.labels(method, route).inc()
+        logger.warning("%s %s : %d requêtes SQL (%.1f ms) pour une seule requête HTTP, N+1 probable",
+                       method, route, sql_queries, sql_time * 1000)
+
+
+# --- SQL ---
+
+_sql_instrumented = False
+_sql_lock = threading.Lock()
+
+
+def instrument_sqlalchemy():
+    """Écoute toutes les connexions SQLAlchemy du processus (une seule fois, quel que soit l'engine)"""
+    global _sql_instrumented
+    with _sql_lock:
+        if _sql_instrumented:
+            return
+        # Import ici : le Gateway n'a pas de base de données (ni SQLAlchemy)
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _sql_instrumented = True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    current = g.get('_metrics') if has_request_context() else None
+    if current is None or 'sql_queries' not in current:
+        SQL_QUERY_DURATION.labels('background').observe(elapsed)
+        return
+    SQL_QUERY_DURATION.labels('request').observe(elapsed)
+    current['sql_queries'] += 1
+    current['sql_time'] += elapsed
+
+
+# --- APPELS INTER-SERVICES ---
+
+def observe_downstream(service, method, status, duration):
+    DOWNSTREAM_DURATION.labels(service, method, str(status)).observe(duration)
+
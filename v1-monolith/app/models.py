@@ -1,18 +1,52 @@
 # v1-monolith/app/models.py
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import bindparam, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
 from flask_login import UserMixin
+import os
+from .cache import TTLCache
+from .database import RoutingSession
 
-# On initialise l'extension
-db = SQLAlchemy()
+# On initialise l'extension (lectures des routes @read_replica sur DATABASE_READ_URL, voir database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # 1. Table Admin (Modifiée pour Flask-Login)
 class User(UserMixin, db.Model): 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
+    password = db.Column(db.String(255), nullable=False) # Hachage : ~100 caractères en pbkdf2, ~160 en scrypt
     is_admin = db.Column(db.Boolean, default=False)
 
+# 1 bis. Identité gardée en cache pour current_user (pas de SELECT user à chaque requête)
+# Objet détaché de la BDD : seulement l'identité et le rôle, jamais le mot de passe
+class CachedUser(UserMixin):
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+user_cache = TTLCache(maxsize=4096, ttl=float(os.environ.get('USER_CACHE_TTL', 60)))
+
+def load_cached_user(user_id):
+    """Identité + rôle de l'utilisateur, depuis le cache du processus ou la BDD (None si inconnu)."""
+    user = user_cache.get(user_id)
+    if user is None:
+        row = db.session.query(User.id, User.username, User.is_admin).filter_by(id=user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        user_cache.set(user_id, user)
+    return user
+
+# Modification ou suppression d'un utilisateur : on l'oublie dans ce processus.
+# Les autres workers gunicorn le relisent au plus tard après USER_CACHE_TTL secondes.
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _forget_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
 # 2. Table Machines
 class Machine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +54,30 @@ class Machine(db.Model):
     status = db.Column(db.String(20), default='available') # available, occupied, maintenance
     sessions = db.relationship('Session', backref='machine', lazy=True)
 
+# 2 bis. Compteur persistant pour numéroter les PC (PC-1, PC-2...)
+# 1 UPDATE par création, la ligne reste verrouillée jusqu'au commit : pas de doublon entre workers
+class Counter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def next_machine_number(cls):
+        """Réserve le prochain numéro de PC (sans commit)"""
+        increment = {cls.value: cls.value + 1}
+        if not cls.query.filter_by(name='machine').update(increment):
+            # Premier appel : on démarre après le plus grand numéro existant
+            highest = 0
+            for (name,) in db.session.query(Machine.name).filter(Machine.name.like('PC-%')):
+                if name[3:].isdigit():
+                    highest = max(highest, int(name[3:]))
+            try:
+                with db.session.begin_nested():
+                    db.session.add(cls(name='machine', value=highest + 1))
+            except IntegrityError:
+                cls.query.filter_by(name='machine').update(increment)
+
+        return db.session.query(cls.value).filter_by(name='machine').scalar()
+
 # 3. Table Sessions
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,3 +87,203 @@ class Session(db.Model):
     start_time = db.Column(db.DateTime, default=datetime.utcnow)
     end_time = db.Column(db.DateTime, nullable=True)
     total_price = db.Column(db.Float, default=0.0)
+
+    # = machine_id tant que la session est ouverte, NULL une fois terminée.
+    # L'index unique dessus garantit au plus UNE session ouverte par machine
+    # (équivalent d'un index partiel "WHERE end_time IS NULL", qui n'existe pas en MySQL)
+    open_machine_id = db.Column(db.Integer, db.Computed("CASE WHEN end_time IS NULL THEN machine_id END"),
+                                unique=True)
+
+    # Index composites pour l'historique paginé (tri par start_time, filtre sur end_time)
+    # - admin : toutes les sessions terminées
+    # - utilisateur : uniquement ses sessions terminées
+    __table_args__ = (
+        db.Index('ix_session_end_start', 'end_time', 'start_time'),
+        db.Index('ix_session_user_end_start', 'user_id', 'end_time', 'start_time'),
+    )
+
+    @classmethod
+    def intervals(cls, start, end, chunk_size):
+        """Paquets de lignes (machine_id, start_time, end_time, total_price) des sessions qui chevauchent
+        [start, end) (end None : jusqu'à maintenant), en cours comprises (end_time None) :
+        entrée des statistiques d'occupation (app/analytics.py)"""
+        columns = (cls.machine_id, cls.start_time, cls.end_time, cls.total_price)
+        # Deux requêtes plutôt qu'un OR : chacune suit l'index (end_time, start_time)
+        for overlapping in (cls.end_time > start, cls.end_time == None):
+            query = select(*columns).where(overlapping)
+            if end is not None:
+                query = query.where(cls.start_time < end)
+            yield from db.session.execute(query.execution_options(yield_per=chunk_size)).partitions()
+
+# 3 bis. Réservations d'un PC sur un créneau (soirée, tournoi), en heure locale comme les sessions.
+# Jamais deux réservations actives qui se chevauchent sur un même PC (vérifié à la création)
+MAX_RESERVATION_DURATION = timedelta(hours=float(os.environ.get('MAX_RESERVATION_HOURS', 12)))
+
+class Reservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), nullable=False)
+    machine = db.relationship('Machine')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User')
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='booked', nullable=False) # booked, cancelled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Relu par l'index des disponibilités des autres workers (changements depuis leur dernière synchro)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False,
+                           index=True)
+
+    # Conflits sur un PC : parcours d'index borné (début entre start - durée max et end)
+    __table_args__ = (
+        db.Index('ix_reservation_machine_start', 'machine_id', 'start_time'),
+        db.Index('ix_reservation_user_start', 'user_id', 'start_time'),
+    )
+
+    # Une transaction commitée juste après la synchro précédente peut porter un updated_at un peu plus ancien
+    SYNC_MARGIN = timedelta(seconds=30)
+
+    @staticmethod
+    def lock_machines(machine_ids):
+        """Sérialise les réservations d'un même PC (sans commit) : UPDATE sans effet des lignes Machine, qui restent
+        verrouillées jusqu'au commit (verrou de ligne MySQL, verrou d'écriture de la base SQLite).
+        À appeler en début de transaction, avant de relire les réservations : une réservation concurrente sur l'un
+        de ces PC attend notre commit, puis voit notre créneau. Ids triés : pas d'interblocage entre deux lots."""
+        db.session.execute(update(Machine).where(Machine.id.in_(sorted(machine_ids)))
+                           .values(status=Machine.status))
+
+    @classmethod
+    def reserved_machine_ids(cls, machine_ids, start, end, except_user=None):
+        """PC de `machine_ids` dont une réservation active chevauche [start, end), lus en BDD"""
+        query = db.session.query(cls.machine_id).filter(
+            cls.machine_id.in_(machine_ids), cls.status == 'booked',
+            cls.start_time > start - MAX_RESERVATION_DURATION, cls.start_time < end, cls.end_time > start)
+        if except_user is not None:
+            query = query.filter(cls.user_id != except_user)
+        return {machine_id for (machine_id,) in query}
+
+    @classmethod
+    def changes(cls, since, now):
+        """Lignes pour l'index des disponibilités (app/availability.py) : réservations modifiées depuis `since`
+        (None = toutes celles à venir), plus le jeton de la prochaine synchro"""
+        token = datetime.utcnow()
+        query = db.session.query(cls.id, cls.machine_id, cls.user_id, cls.start_time, cls.end_time, cls.status)
+        if since is None:
+            query = query.filter(cls.status == 'booked', cls.end_time > now)
+        else:
+            query = query.filter(cls.updated_at >= since - cls.SYNC_MARGIN)
+        rows = [(reservation_id, machine_id, user_id, start, end, status == 'booked')
+                for reservation_id, machine_id, user_id, start, end, status in query]
+        return rows, token
+
+# 4. Table de cumul du chiffre d'affaires (1 ligne par jour / machine / utilisateur)
+# Mise à jour à chaque fin de session : les totaux se lisent en O(jours) au lieu de O(sessions)
+class DailyRevenue(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    machine_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    session_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'machine_id', 'user_id', name='uq_daily_revenue_day_machine_user'),
+        db.Index('ix_daily_revenue_user_day', 'user_id', 'day'),
+    )
+
+    @classmethod
+    def add_session(cls, session):
+        """Ajoute une session terminée au cumul de son jour de fin (sans commit)."""
+        key = {'day': session.end_time.date(), 'machine_id': session.machine_id, 'user_id': session.user_id}
+        increment = {
+            cls.session_count: cls.session_count + 1,
+            cls.revenue: cls.revenue + session.total_price,
+        }
+
+        if cls.query.filter_by(**key).update(increment, synchronize_session=False):
+            return
+
+        # Première session de la journée pour ce couple machine/utilisateur
+        # Si un autre worker insère la même ligne en même temps, on retombe sur l'UPDATE
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(session_count=1, revenue=session.total_price, **key))
+        except IntegrityError:
+            cls.query.filter_by(**key).update(increment, synchronize_session=False)
+
+    @classmethod
+    def add_sessions(cls, day, revenue_by_key):
+        """Cumul d'un arrêt groupé (sans commit) : 1 UPDATE multi-lignes + 1 INSERT au lieu de 2 requêtes par session.
+
+        revenue_by_key = {(machine_id, user_id): (nombre de sessions, chiffre d'affaires)}
+        """
+        existing = {(machine_id, user_id) for machine_id, user_id in db.session.query(cls.machine_id, cls.user_id)
+                    .filter(cls.day == day, cls.machine_id.in_({machine_id for machine_id, _ in revenue_by_key}))}
+        table = cls.__table__
+        if existing:
+            db.session.execute(
+                table.update().where(table.c.day == day, table.c.machine_id == bindparam('b_machine_id'),
+                                     table.c.user_id == bindparam('b_user_id'))
+                .values(session_count=table.c.session_count + bindparam('b_count'),
+                        revenue=table.c.revenue + bindparam('b_revenue')),
+                [{'b_machine_id': machine_id, 'b_user_id': user_id, 'b_count': count, 'b_revenue': revenue}
+                 for (machine_id, user_id), (count, revenue) in revenue_by_key.items() if (machine_id, user_id) in existing]
+            )
+
+        missing = [key for key in revenue_by_key if key not in existing]
+        if not missing:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(cls), [
+                    {'day': day, 'machine_id': machine_id, 'user_id': user_id,
+                     'session_count': revenue_by_key[(machine_id, user_id)][0],
+                     'revenue': revenue_by_key[(machine_id, user_id)][1]}
+                    for machine_id, user_id in missing
+                ])
+        except IntegrityError:
+            # Un autre worker a créé une de ces lignes entre-temps : on repasse ligne par ligne
+            for machine_id, user_id in missing:
+                count, revenue = revenue_by_key[(machine_id, user_id)]
+                increment = {cls.session_count: cls.session_count + count, cls.revenue: cls.revenue + revenue}
+                key = {'day': day, 'machine_id': machine_id, 'user_id': user_id}
+                if not cls.query.filter_by(**key).update(increment, synchronize_session=False):
+                    db.session.add(cls(session_count=count, revenue=revenue, **key))
+
+    @classmethod
+    def rebuild(cls):
+        """Recalcule toute la table à partir des sessions terminées (sans commit)."""
+        cls.query.delete()
+        day = func.date(Session.end_time)
+        rows = db.session.query(
+            day, Session.machine_id, Session.user_id,
+            func.count(Session.id), func.coalesce(func.sum(Session.total_price), 0.0)
+        ).filter(Session.end_time != None).group_by(day, Session.machine_id, Session.user_id)
+
+        for raw_day, machine_id, user_id, count, revenue in rows:
+            # SQLite renvoie la date sous forme de texte
+            if isinstance(raw_day, str):
+                raw_day = datetime.strptime(raw_day, '%Y-%m-%d').date()
+            db.session.add(cls(day=raw_day, machine_id=machine_id, user_id=user_id,
+                               session_count=count, revenue=revenue))
+
+# 5. Statistiques d'occupation d'un jour clos (app/analytics.py), calculées une seule fois à partir des sessions
+class DailyAnalytics(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    data = db.Column(db.LargeBinary(length=2 ** 24), nullable=False) # DayStats.to_bytes() (MEDIUMBLOB en MySQL)
+
+    @classmethod
+    def load(cls, first, last):
+        """{jour: bloc} des jours figés entre first et last inclus"""
+        rows = db.session.query(cls.day, cls.data).filter(cls.day >= first, cls.day <= last)
+        return {day: data for day, data in rows}
+
+    @classmethod
+    def save(cls, blocks):
+        """Fige des jours calculés ({jour: bloc}) et commit"""
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(cls), [{'day': day, 'data': data} for day, data in blocks.items()])
+            db.session.commit()
+        except IntegrityError:
+            # Un autre worker a figé ces jours en même temps : mêmes sessions, même résultat
+            db.session.rollback()
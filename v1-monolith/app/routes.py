@@ -1,17 +1,35 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from datetime import datetime
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, abort, \
+    current_app, stream_with_context
+import os
+import queue
+from datetime import datetime, timedelta
 import pytz
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
-from .models import db, Machine, Session, User
-from sqlalchemy import func # Ajoute cet import tout en haut si besoin, ou utilise sum() python
+from .models import db, Machine, Session, User, DailyRevenue, DailyAnalytics, Counter, Reservation, \
+    MAX_RESERVATION_DURATION
+from .security import hash_password, verify_password, needs_rehash, PasswordHashBusy
+from .events import sse_message, sse_unavailable
+from .analytics import AnalyticsPending
+from .database import read_replica
+from .export import EXPORT_FORMATS, parse_date_range, stream_rows, export_filename
+from sqlalchemy import case, func, insert, or_, and_, update
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 
 # Création du Blueprint
 main_bp = Blueprint('main', __name__)
 
 # Configuration
 PRIX_PAR_HEURE = 5.0
+HISTORY_PAGE_SIZE = 50
+MAX_BATCH_SESSIONS = int(os.environ.get('MAX_BATCH_SESSIONS', 500))
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
 TZ_QUEBEC = pytz.timezone('America/Montreal')
+# Délai avant une réservation pendant lequel le PC n'accepte plus de session sans réservation
+RESERVATION_GUARD = timedelta(minutes=float(os.environ.get('RESERVATION_GUARD_MINUTES', 30)))
+# Statistiques d'occupation : période maximale d'un rapport, secondes de calcul des jours manquants par requête
+MAX_ANALYTICS_DAYS = int(os.environ.get('MAX_ANALYTICS_DAYS', 3 * 366))
+ANALYTICS_BUDGET_SECONDS = float(os.environ.get('ANALYTICS_BUDGET_SECONDS', 10))
 
 # ==========================================
 # 1. ROUTES D'AUTHENTIFICATION (Publiques)
@@ -29,7 +47,17 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = user is not None and verify_password(user.password, password)
+            if valid and needs_rehash(user.password):
+                # Le coût configuré a changé : on en profite pour mettre le hachage à jour
+                user.password = hash_password(password)
+                db.session.commit()
+        except PasswordHashBusy:
+            flash('Trop de connexions en même temps, réessayez dans quelques secondes.', 'error')
+            return render_template('login.html'), 503
+
+        if valid:
             login_user(user)
             return redirect(url_for('main.index'))
         else:
@@ -53,7 +81,11 @@ def register():
             return redirect(url_for('main.register'))
         
         # Création du nouvel utilisateur (Admin = False par défaut)
-        hashed_pw = generate_password_hash(password, method='pbkdf2:sha256')
+        try:
+            hashed_pw = hash_password(password)
+        except PasswordHashBusy:
+            flash('Trop de demandes en même temps, réessayez dans quelques secondes.', 'error')
+            return render_template('register.html'), 503
         new_user = User(username=username, password=hashed_pw, is_admin=False)
         
         db.session.add(new_user)
@@ -76,7 +108,7 @@ def logout():
 def init_admin():
     existing = User.query.filter_by(username='admin').first()
     if not existing:
-        hashed_pw = generate_password_hash('admin123', method='pbkdf2:sha256')
+        hashed_pw = hash_password('admin123')
         new_admin = User(username='admin', password=hashed_pw, is_admin=True)
         db.session.add(new_admin)
         db.session.commit()
@@ -89,6 +121,7 @@ def init_admin():
 
 @main_bp.route('/')
 @login_required 
+@read_replica
 def index():
     machines = Machine.query.all()
     return render_template('index.html', machines=machines, user=current_user)
@@ -100,11 +133,12 @@ def add_machine():
         flash("Action non autorisée. Réservé aux administrateurs.", "error")
         return redirect(url_for('main.index'))
     
-    count = Machine.query.count()
-    new_machine = Machine(name=f"PC-{count + 1}", status="available")
+    # Numéro tiré du compteur persistant (plus de conflit entre deux ajouts simultanés)
+    new_machine = Machine(name=f"PC-{Counter.next_machine_number()}", status="available")
     
     db.session.add(new_machine)
     db.session.commit()
+    _notify_dashboards()
     flash('Nouvelle machine ajoutée.', 'success')
     return redirect(url_for('main.index'))
 
@@ -116,78 +150,492 @@ def reset_db():
         return redirect(url_for('main.index'))
     
     # Attention : On ne supprime pas les Users pour ne pas tuer ton compte admin !
+    Reservation.query.delete()
     Machine.query.delete()
     Session.query.delete()
+    DailyRevenue.query.delete()
+    DailyAnalytics.query.delete()
+    Counter.query.filter_by(name='machine').delete()
     
     # On recrée 5 PC
     for i in range(1, 6):
         pc = Machine(name=f"PC-{i:02d}")
         db.session.add(pc)
     db.session.commit()
+    current_app.extensions['availability'].reset()
+    current_app.extensions['analytics'].cache.clear()
+    _notify_dashboards()
     flash('Base de données machines réinitialisée.', 'warning')
     return redirect(url_for('main.index'))
 
 @main_bp.route('/session/start/<int:machine_id>', methods=['POST'])
 @login_required
 def start_session(machine_id):
-    machine = Machine.query.get_or_404(machine_id)
-    
-    if machine.status == 'occupied':
+    # Un PC réservé par quelqu'un d'autre (en cours ou bientôt) reste libre pour sa réservation
+    now = local_now()
+    if Reservation.reserved_machine_ids([machine_id], now, now + RESERVATION_GUARD, except_user=current_user.id):
+        flash('Ce PC est réservé par un autre client sur ce créneau.', 'error')
+        return redirect(url_for('main.index'))
+
+    # UPDATE conditionnel : seul le premier clic passe la machine en 'occupied'
+    # (pas de SELECT puis UPDATE qui laisserait deux workers démarrer le même PC)
+    occupied = Machine.query.filter_by(id=machine_id, status='available') \
+        .update({'status': 'occupied'}, synchronize_session=False)
+
+    if not occupied:
+        db.session.rollback()
+        if db.session.get(Machine, machine_id) is None:
+            abort(404)
         flash('Cette machine est déjà prise !', 'error')
         return redirect(url_for('main.index'))
 
-    machine.status = 'occupied' 
     now_quebec = datetime.now(TZ_QUEBEC)
     start_time_db = now_quebec.replace(tzinfo=None)
     
-    new_session = Session(machine_id=machine.id, user_id=current_user.id, start_time=start_time_db)
+    new_session = Session(machine_id=machine_id, user_id=current_user.id, start_time=start_time_db)
     
     db.session.add(new_session)
-    db.session.commit()
+    try:
+        db.session.commit()
+        _notify_dashboards()
+    except IntegrityError:
+        # L'index unique garantit une seule session ouverte par machine
+        db.session.rollback()
+        flash('Cette machine est déjà prise !', 'error')
     
     return redirect(url_for('main.index'))
 
 @main_bp.route('/session/stop/<int:machine_id>', methods=['POST'])
 @login_required # Sécurité ajoutée
 def stop_session(machine_id):
-    machine = Machine.query.get_or_404(machine_id)
-    
-    active_session = Session.query.filter_by(machine_id=machine.id, end_time=None).first()
+    active_session = Session.query.filter_by(machine_id=machine_id, end_time=None).first()
     
-    if active_session:
-        now_quebec = datetime.now(TZ_QUEBEC)
-        active_session.end_time = now_quebec.replace(tzinfo=None)
-        
-        duration = active_session.end_time - active_session.start_time
-        hours = duration.total_seconds() / 3600
-        price = round(hours * PRIX_PAR_HEURE, 2)
-        
-        active_session.total_price = price
-        machine.status = 'available'
+    if not active_session:
+        if db.session.get(Machine, machine_id) is None:
+            abort(404)
+        return redirect(url_for('main.index'))
+
+    now_quebec = datetime.now(TZ_QUEBEC)
+    end_time = now_quebec.replace(tzinfo=None)
+
+    duration = end_time - active_session.start_time
+    hours = duration.total_seconds() / 3600
+    price = round(hours * PRIX_PAR_HEURE, 2)
+
+    # UPDATE conditionnel : si deux clics arrivent en même temps, un seul ferme (et facture) la session
+    closed = Session.query.filter_by(id=active_session.id, end_time=None) \
+        .update({'end_time': end_time, 'total_price': price}, synchronize_session='evaluate')
+
+    if closed:
+        Machine.query.filter_by(id=machine_id).update({'status': 'available'}, synchronize_session=False)
+        DailyRevenue.add_session(active_session)
         db.session.commit()
-        
+        _notify_dashboards()
         flash(f"Session terminée ! Prix : {price} €", 'success')
+    else:
+        db.session.rollback()
         
     return redirect(url_for('main.index'))
 
+# --- DÉMARRAGE / ARRÊT GROUPÉ (tournoi, fermeture de la salle) ---
+# PC cochés sur le dashboard : 1 requête et 1 commit pour tout le groupe, au lieu d'un POST par PC
+
+@main_bp.route('/sessions/start-batch', methods=['POST'])
+@login_required
+def start_sessions_batch():
+    machine_ids = _batch_machine_ids()
+    if machine_ids is None:
+        return redirect(url_for('main.index'))
+
+    # PC réservés par d'autres clients : laissés libres pour leur réservation
+    now = local_now()
+    reserved = Reservation.reserved_machine_ids(machine_ids, now, now + RESERVATION_GUARD, except_user=current_user.id)
+
+    # Lecture verrouillée (MySQL) des PC libres, puis UN UPDATE conditionnel pour tous
+    free = [machine_id for (machine_id,) in db.session.query(Machine.id)
+            .filter(Machine.id.in_([i for i in machine_ids if i not in reserved]), Machine.status == 'available')
+            .with_for_update()]
+    occupy = {'status': 'occupied'}
+    occupied = Machine.query.filter(Machine.id.in_(free), Machine.status == 'available') \
+        .update(occupy, synchronize_session=False) if free else 0
+    if occupied != len(free):
+        # Un autre worker a pris un de ces PC entre la lecture et l'UPDATE : on repasse PC par PC
+        db.session.rollback()
+        free = [machine_id for machine_id in free if Machine.query.filter_by(id=machine_id, status='available')
+                .update(occupy, synchronize_session=False)]
+
+    # INSERT multi-lignes (add_all ferait un INSERT par session, à cause de la colonne calculée)
+    start_time = datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+    try:
+        if free:
+            db.session.execute(insert(Session), [
+                {'machine_id': machine_id, 'user_id': current_user.id, 'start_time': start_time} for machine_id in free
+            ])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('Un des PC a déjà une session en cours, aucune session démarrée.', 'error')
+        return redirect(url_for('main.index'))
+
+    _notify_dashboards()
+    flash(f"{len(free)} sessions démarrées.", 'success')
+    busy = [machine_id for machine_id in machine_ids if machine_id not in free]
+    if busy:
+        flash(f"PC déjà pris, réservés ou introuvables : {', '.join(map(str, busy))}", 'warning')
+    return redirect(url_for('main.index'))
+
+@main_bp.route('/sessions/stop-batch', methods=['POST'])
+@login_required
+def stop_sessions_batch():
+    machine_ids = _batch_machine_ids()
+    if machine_ids is None:
+        return redirect(url_for('main.index'))
+    _flash_stopped(_stop_sessions(Session.query.filter(Session.machine_id.in_(machine_ids))))
+    return redirect(url_for('main.index'))
+
+@main_bp.route('/sessions/stop-all', methods=['POST'])
+@login_required
+def stop_all_sessions():
+    if not current_user.is_admin:
+        flash("Action non autorisée. Réservé aux administrateurs.", "error")
+        return redirect(url_for('main.index'))
+    _flash_stopped(_stop_sessions(Session.query))
+    return redirect(url_for('main.index'))
+
+def _batch_machine_ids():
+    """PC cochés (sans doublons), ou None après un message d'erreur"""
+    machine_ids = list(dict.fromkeys(request.form.getlist('machine_ids', type=int)))
+    if not machine_ids:
+        flash('Cochez au moins un PC.', 'error')
+        return None
+    if len(machine_ids) > MAX_BATCH_SESSIONS:
+        flash(f'{MAX_BATCH_SESSIONS} PC au maximum à la fois.', 'error')
+        return None
+    return machine_ids
+
+def _stop_sessions(query):
+    """Termine et facture les sessions ouvertes de `query` : prix calculés en un passage, 1 UPDATE des sessions,
+    1 UPDATE des PC, cumul journalier groupé, 1 commit. Renvoie [(machine_id, prix)]."""
+    rows = query.filter(Session.end_time == None) \
+        .with_entities(Session.id, Session.machine_id, Session.user_id, Session.start_time) \
+        .with_for_update().all()
+    if not rows:
+        return []
+
+    end_time = datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+    prices = {session_id: round((end_time - start_time).total_seconds() / 3600 * PRIX_PAR_HEURE, 2)
+              for session_id, _, _, start_time in rows}
+
+    # UPDATE conditionnel (end_time IS NULL) : une session arrêtée au même moment par un clic seul
+    # n'est ni refermée ni facturée deux fois
+    closed = db.session.execute(
+        update(Session).where(Session.id.in_(prices), Session.end_time == None)
+        .values(end_time=end_time, total_price=case(prices, value=Session.id)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if closed != len(rows):
+        ours = {session_id for (session_id,) in db.session.query(Session.id)
+                .filter(Session.id.in_(prices), Session.end_time == end_time)}
+        rows = [row for row in rows if row[0] in ours]
+    if not rows:
+        db.session.rollback()
+        return []
+
+    Machine.query.filter(Machine.id.in_([machine_id for _, machine_id, _, _ in rows])) \
+        .update({'status': 'available'}, synchronize_session=False)
+    revenue = {}
+    for session_id, machine_id, user_id, _ in rows:
+        count, total = revenue.get((machine_id, user_id), (0, 0.0))
+        revenue[(machine_id, user_id)] = (count + 1, total + prices[session_id])
+    DailyRevenue.add_sessions(end_time.date(), revenue)
+    db.session.commit()
+    _notify_dashboards()
+    return [(machine_id, prices[session_id]) for session_id, machine_id, _, _ in rows]
+
+def _flash_stopped(stopped):
+    if not stopped:
+        flash('Aucune session en cours sur ces PC.', 'info')
+        return
+    total = round(sum(price for _, price in stopped), 2)
+    flash(f"{len(stopped)} sessions terminées ! Total : {total} €", 'success')
+
+# --- RÉSERVATIONS ---
+# Index en mémoire des créneaux réservés (availability.py) : conflits et PC libres en O(log n) par PC, sans SQL.
+# Il peut avoir quelques secondes de retard sur les autres workers : toute écriture revérifie le créneau en BDD.
+
+def local_now():
+    return datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+
+def _reservation_window(source):
+    """(début, fin) depuis les champs start / end (AAAA-MM-JJTHH:MM, heure locale), ou ValueError"""
+    try:
+        start, end = datetime.fromisoformat(source.get('start')), datetime.fromisoformat(source.get('end'))
+    except (TypeError, ValueError):
+        raise ValueError('Début et fin du créneau attendus (AAAA-MM-JJ HH:MM).')
+    if end <= start:
+        raise ValueError('La fin du créneau doit être après le début.')
+    if end - start > MAX_RESERVATION_DURATION:
+        raise ValueError(f'Créneau de {MAX_RESERVATION_DURATION.total_seconds() / 3600:g} h au maximum.')
+    if end <= local_now():
+        raise ValueError('Ce créneau est déjà passé.')
+    return start, end
+
+def _in_session(machine_ids, start):
+    """PC occupés, si le créneau commence tout de suite (sinon la session sera finie d'ici là)"""
+    if start >= local_now() + RESERVATION_GUARD:
+        return set()
+    return {machine_id for (machine_id,) in db.session.query(Machine.id)
+            .filter(Machine.id.in_(machine_ids), Machine.status == 'occupied')}
+
+@main_bp.route('/reservations')
+@login_required
+def reservations():
+    """Réservations à venir, formulaire de réservation et recherche de N PC voisins libres (?start=&end=&count=)"""
+    availability = current_app.extensions['availability']
+    availability.sync()
+
+    query = Reservation.query.options(joinedload(Reservation.user), joinedload(Reservation.machine)) \
+        .filter(Reservation.status == 'booked', Reservation.end_time > local_now())
+    if not current_user.is_admin:
+        query = query.filter(Reservation.user_id == current_user.id)
+    upcoming = query.order_by(Reservation.start_time, Reservation.machine_id).all()
+    machines = db.session.query(Machine.id, Machine.name).order_by(Machine.id).all()
+
+    suggestion = None
+    if request.args.get('count'):
+        try:
+            start, end = _reservation_window(request.args)
+        except ValueError as e:
+            flash(str(e), 'error')
+        else:
+            machine_ids = [machine_id for machine_id, _ in machines]
+            count = request.args.get('count', type=int) or 1
+            found = availability.find_adjacent(machine_ids, count, start, end, _in_session(machine_ids, start))
+            if found is None:
+                flash(f"Pas de {count} PC voisins libres sur ce créneau.", 'warning')
+            else:
+                names = dict(machines)
+                suggestion = {'machines': [(machine_id, names[machine_id]) for machine_id in found],
+                              'start': request.args['start'], 'end': request.args['end']}
+
+    return render_template('reservations.html', reservations=upcoming, machines=machines, suggestion=suggestion)
+
+@main_bp.route('/reservations', methods=['POST'])
+@login_required
+def create_reservation():
+    """Réserve un créneau sur un ou plusieurs PC (tout ou rien)"""
+    machine_ids = _batch_machine_ids()
+    if machine_ids is None:
+        return redirect(url_for('main.reservations'))
+    try:
+        start, end = _reservation_window(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.reservations'))
+
+    # 1. Refus immédiat d'après l'index (pas de SQL), 2. PC verrouillés jusqu'au commit puis créneau revérifié en BDD
+    # (la transaction de lecture de l'index est close d'abord : la relecture voit les réservations commitées entre-temps)
+    availability = current_app.extensions['availability']
+    availability.sync()
+    conflicts = {machine_id for machine_id in machine_ids if not availability.is_free(machine_id, start, end)}
+    if not conflicts:
+        db.session.commit()
+        Reservation.lock_machines(machine_ids)
+        conflicts = Reservation.reserved_machine_ids(machine_ids, start, end) | _in_session(machine_ids, start)
+    if conflicts:
+        db.session.rollback()
+        flash(f"Créneau déjà pris sur les PC : {', '.join(map(str, sorted(conflicts)))}", 'error')
+        return redirect(url_for('main.reservations'))
+
+    reservations = [Reservation(machine_id=machine_id, user_id=current_user.id, start_time=start, end_time=end)
+                    for machine_id in machine_ids]
+    db.session.add_all(reservations)
+    try:
+        db.session.flush()
+        created = [(r.id, r.machine_id) for r in reservations]
+        db.session.commit()
+    except IntegrityError:
+        # PC supprimé entre-temps
+        db.session.rollback()
+        flash('PC introuvable, aucune réservation enregistrée.', 'error')
+        return redirect(url_for('main.reservations'))
+
+    for reservation_id, machine_id in created:
+        availability.add(reservation_id, machine_id, current_user.id, start, end)
+    flash(f"{len(created)} PC réservés du {start.strftime('%d/%m %H:%M')} au {end.strftime('%d/%m %H:%M')}.", 'success')
+    return redirect(url_for('main.reservations'))
+
+@main_bp.route('/reservations/<int:reservation_id>/cancel', methods=['POST'])
+@login_required
+def cancel_reservation(reservation_id):
+    reservation = db.session.get(Reservation, reservation_id)
+    if reservation is None or reservation.status != 'booked':
+        abort(404)
+    if reservation.user_id != current_user.id and not current_user.is_admin:
+        abort(403)
+
+    Reservation.query.filter_by(id=reservation_id, status='booked') \
+        .update({'status': 'cancelled'}, synchronize_session=False)
+    db.session.commit()
+    current_app.extensions['availability'].remove(reservation_id)
+    flash('Réservation annulée.', 'info')
+    return redirect(url_for('main.reservations'))
+
+@main_bp.route('/events/machines')
+@login_required
+def machine_events():
+    """Flux SSE : l'état des PC au départ, puis uniquement les PC qui changent"""
+    feed = current_app.extensions['machine_feed']
+    events = queue.Queue(maxsize=100)
+    push = events.put_nowait
+    snapshot = feed.subscribe(push)
+    if snapshot is None:
+        feed.unsubscribe(push)
+        return Response(sse_unavailable(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    # Le flux reste ouvert longtemps : on rend tout de suite la connexion BDD au pool
+    db.session.close()
+
+    def stream():
+        try:
+            yield sse_message('snapshot', snapshot)
+            while True:
+                try:
+                    deltas = events.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_message('machines', deltas)
+        finally:
+            feed.unsubscribe(push)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _notify_dashboards():
+    # Les dashboards ouverts reçoivent le changement via /events/machines
+    current_app.extensions['machine_feed'].notify()
+
 @main_bp.route('/history')
 @login_required
+@read_replica
 def history():
-    # Récupérer toutes les sessions terminées (celles qui ont une date de fin)
+    # Récupérer les sessions terminées (celles qui ont une date de fin)
     # On les trie par date décroissante (du plus récent au plus vieux)
-    if current_user.is_admin:
-        # L'admin voit TOUT
-        finished_sessions = Session.query.filter(Session.end_time != None).order_by(Session.start_time.desc()).all()
-    
-    else: 
+    # Pagination par curseur (keyset) : on ne charge qu'une page à la fois
+    query = Session.query.filter(Session.end_time != None)
+
+    if not current_user.is_admin:
         # L'utilisateur normal ne voit que SES sessions
-        finished_sessions = Session.query.filter(
-            Session.end_time != None, 
-            Session.user_id == current_user.id
-        ).order_by(Session.start_time.desc()).all()
-        
-    # Calcul du chiffre d'affaires total
-    raw_income = sum(session.total_price for session in finished_sessions)
-    total_income = round(raw_income, 2)
-    
-    return render_template('history.html', sessions=finished_sessions, total_income=total_income)
+        query = query.filter(Session.user_id == current_user.id)
+
+    # Calcul du chiffre d'affaires total à partir du cumul journalier (1 ligne par jour, pas par session)
+    income_query = db.session.query(func.coalesce(func.sum(DailyRevenue.revenue), 0.0))
+    if not current_user.is_admin:
+        income_query = income_query.filter(DailyRevenue.user_id == current_user.id)
+    total_income = round(income_query.scalar(), 2)
+
+    # Curseur = (start_time, id) de la dernière ligne de la page précédente
+    cursor = _decode_cursor(request.args.get('cursor'))
+    if cursor:
+        cursor_time, cursor_id = cursor
+        query = query.filter(or_(
+            Session.start_time < cursor_time,
+            and_(Session.start_time == cursor_time, Session.id < cursor_id)
+        ))
+
+    # On charge user et machine dans la même requête (sinon 2 requêtes par ligne dans le template)
+    # On demande une ligne de plus pour savoir s'il existe une page suivante
+    rows = query.options(joinedload(Session.user), joinedload(Session.machine)) \
+        .order_by(Session.start_time.desc(), Session.id.desc()) \
+        .limit(HISTORY_PAGE_SIZE + 1).all()
+
+    finished_sessions = rows[:HISTORY_PAGE_SIZE]
+    next_cursor = None
+    if len(rows) > HISTORY_PAGE_SIZE:
+        next_cursor = _encode_cursor(finished_sessions[-1])
+
+    return render_template('history.html', sessions=finished_sessions, total_income=total_income,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
+
+@main_bp.route('/sessions/export')
+@login_required
+@read_replica
+def export_sessions():
+    """Export comptable des sessions terminées, en flux : ?from=&to=&format=csv|ndjson&gzip=1"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    try:
+        start, end = parse_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        abort(400)
+
+    columns = ['id', 'user', 'machine', 'start_time', 'end_time', 'total_price']
+    query = db.session.query(Session.id, User.username, Machine.name, Session.start_time, Session.end_time,
+                             Session.total_price) \
+        .join(User, Session.user_id == User.id) \
+        .join(Machine, Session.machine_id == Machine.id) \
+        .filter(Session.end_time != None)
+
+    # L'utilisateur normal n'exporte que SES sessions
+    if not current_user.is_admin:
+        query = query.filter(Session.user_id == current_user.id)
+    if start:
+        query = query.filter(Session.end_time >= start)
+    if end:
+        query = query.filter(Session.end_time <= end)
+
+    # Curseur côté serveur, lu par paquets de 1000 : mémoire constante même sur des millions de lignes
+    rows = query.order_by(Session.end_time, Session.id).execution_options(yield_per=1000)
+
+    filename = export_filename('sessions', start, end, fmt, compress)
+    return Response(
+        stream_with_context(stream_rows(rows, columns, fmt, compress)),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def _encode_cursor(session):
+    return f"{session.start_time.isoformat()}_{session.id}"
+
+def _decode_cursor(raw):
+    """Transforme '2024-01-31T18:00:00_42' en (datetime, 42). Curseur invalide = première page."""
+    if not raw:
+        return None
+    try:
+        raw_time, raw_id = raw.rsplit('_', 1)
+        return datetime.fromisoformat(raw_time), int(raw_id)
+    except ValueError:
+        return None
+
+@main_bp.route('/analytics')
+@login_required
+@read_replica
+def analytics():
+    """Occupation du parc (?from=AAAA-MM-JJ&to=AAAA-MM-JJ, défaut : les 30 derniers jours) : heatmap par PC
+    et par heure, sessions simultanées, CA par heure de fin, durée moyenne des sessions"""
+    if not current_user.is_admin:
+        flash("Action non autorisée. Réservé aux administrateurs.", "error")
+        return redirect(url_for('main.index'))
+
+    today = local_now().date()
+    try:
+        last = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else today
+        first = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') \
+            else last - timedelta(days=29)
+    except ValueError:
+        abort(400)
+    if first > min(last, today) or (last - first).days >= MAX_ANALYTICS_DAYS:
+        abort(400)
+
+    # Jours clos lus dans DailyAnalytics (ou le cache du worker), seul aujourd'hui est recalculé.
+    # Jours clos manquants : ANALYTICS_BUDGET_SECONDS de calcul par requête, la page se recharge pour la suite
+    try:
+        report = current_app.extensions['analytics'].report(first, last, budget=ANALYTICS_BUDGET_SECONDS)
+    except AnalyticsPending as e:
+        return render_template('analytics_pending.html', done=e.done, total=e.total, retry_after=1), 202
+    names = dict(db.session.query(Machine.id, Machine.name))
+    return render_template('analytics.html', report=report, names=names)
@@ -0,0 +1,51 @@
+"""Hachage des mots de passe dans un pool de threads borné.
+
+pbkdf2 coûte plusieurs centaines de ms de CPU par appel : à l'ouverture, une rafale de connexions
+occupait tous les threads gunicorn et bloquait le dashboard. Le calcul se fait maintenant dans un
+pool de PASSWORD_HASH_WORKERS threads (hashlib libère le GIL pendant le calcul), avec au plus
+PASSWORD_HASH_QUEUE demandes en attente ; au-delà, PasswordHashBusy (la route répond 503).
+
+Le coût est réglable avec PASSWORD_HASH_METHOD (ex. 'pbkdf2:sha256:600000', 'scrypt:32768:8:1') ;
+les anciens hachages sont recalculés avec la nouvelle méthode à la prochaine connexion réussie.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+PASSWORD_HASH_WAIT = float(os.environ.get('PASSWORD_HASH_WAIT', 5))
+
+_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+
+class PasswordHashBusy(RuntimeError):
+    """Trop de hachages en attente : on refuse plutôt que de bloquer le worker indéfiniment."""
+
+
+def _run(func, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_WAIT):
+        raise PasswordHashBusy("file de hachage pleine")
+    try:
+        return _pool.submit(func, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(hashed, password):
+    return _run(check_password_hash, hashed, password)
+
+
+def needs_rehash(hashed):
+    """Vrai si le hachage a été fait avec une autre méthode / un autre coût que la configuration."""
+    wanted = PASSWORD_HASH_METHOD.split(':')
+    # 'pbkdf2:sha256' sans coût explicite = coût par défaut de werkzeug : on ne compare que les parties données
+    return hashed.split('$', 1)[0].split(':')[:len(wanted)] != wanted
@@ -0,0 +1,47 @@
+"""Démarrage à froid du monolithe : temps de create_app() et absence de DDL au démarrage d'un worker.
+
+Chaque essai tourne dans un interpréteur neuf, sur une base SQLite qui n'existe pas encore :
+create_app() ne doit pas la créer (les tables viennent de `flask --app app init-db`).
+Code de sortie 1 si le budget est dépassé ou si la base a été touchée.
+Lancer depuis le dossier v1-monolith :
+    python -m benchmarks.bench_cold_start --budget 1.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SNIPPET = ("import time; started = time.perf_counter(); from app import create_app; create_app(); "
+           "print(time.perf_counter() - started)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.5, help="temps maximum d'import + create_app() (s)")
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    database = os.path.join(tempfile.mkdtemp(), 'cold.db')
+    env = {**os.environ, 'DATABASE_URL': f"sqlite:///{database}"}
+
+    timings = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', SNIPPET], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    median = statistics.median(timings)
+    touched_db = os.path.exists(database)
+
+    print(f"create_app() à froid : médiane {median * 1000:.0f} ms (min {min(timings) * 1000:.0f} ms), "
+          f"base touchée : {'oui' if touched_db else 'non'}")
+    if median > args.budget or touched_db:
+        print("❌ Démarrage trop lent ou DDL au démarrage d'un worker")
+        sys.exit(1)
+    print("✅ Aucun accès BDD au démarrage d'un worker")
+
+
+if __name__ == '__main__':
+    main()
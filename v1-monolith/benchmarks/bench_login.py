@@ -0,0 +1,77 @@
+"""Rafale de connexions pendant que des dashboards sont ouverts : logins/s et requêtes dashboard/s.
+
+Sans pool de hachage ni cache utilisateur, chaque login monopolise un thread pendant le calcul pbkdf2
+et chaque page relit la table User ; le dashboard ralentit pendant la rafale.
+Lancer depuis le dossier v1-monolith (les variables PASSWORD_HASH_* / USER_CACHE_TTL sont lues à l'import) :
+    python -m benchmarks.bench_login --logins 8 --dashboards 8 --duration 10
+    USER_CACHE_TTL=0 PASSWORD_HASH_WORKERS=8 python -m benchmarks.bench_login   # comparaison
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=8, help="threads qui se connectent en boucle")
+    parser.add_argument('--dashboards', type=int, default=8, help="threads qui rechargent le dashboard")
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+    from app import create_app
+    from app.models import db, User, Machine
+    from app.security import hash_password, PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS
+
+    app = create_app()
+    users = args.logins + args.dashboards
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password = hash_password('bench')
+        db.session.add_all([User(username=f"bench-{i}", password=password) for i in range(users)])
+        db.session.add_all([Machine(name=f"PC-{i:02d}") for i in range(1, 21)])
+        db.session.commit()
+
+    stop = threading.Event()
+    logins, dashboards = [], []
+
+    def login_loop(i):
+        client = app.test_client()
+        while not stop.is_set():
+            response = client.post('/login', data={'username': f"bench-{i}", 'password': 'bench'})
+            if response.status_code == 302:
+                logins.append(1)
+            client.get('/logout')
+
+    def dashboard_loop(i):
+        client = app.test_client()
+        client.post('/login', data={'username': f"bench-{i}", 'password': 'bench'})
+        while not stop.is_set():
+            started = time.perf_counter()
+            if client.get('/').status_code == 200:
+                dashboards.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(args.logins)]
+    threads += [threading.Thread(target=dashboard_loop, args=(args.logins + i,)) for i in range(args.dashboards)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    dashboards.sort()
+    p95 = dashboards[int(len(dashboards) * 0.95)] * 1000 if dashboards else float('nan')
+    print(f"hachage {PASSWORD_HASH_METHOD} ({PASSWORD_HASH_WORKERS} threads), "
+          f"cache utilisateur {os.environ.get('USER_CACHE_TTL', 60)}s")
+    print(f"  logins    : {len(logins) / args.duration:7.1f} /s")
+    print(f"  dashboard : {len(dashboards) / args.duration:7.1f} req/s  p95={p95:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Statistiques d'occupation (GET /sessions/analytics du Billing) : rapport sur un an, à froid puis depuis les caches.
+
+Base SQLite temporaire remplie de --sessions sessions réparties sur --machines PC et les --days derniers jours
+(sessions d'un même PC sans chevauchement, la dernière éventuellement en cours), puis :
+  1. vérification : 3 jours recalculés en Python pur, session par session (occupation par PC et par heure,
+     sessions en cours à quelques minutes, CA, nombre de sessions), comparés au balayage NumPy
+  2. rapport à froid : tous les jours calculés depuis les sessions puis figés dans DailyAnalytics, en autant de
+     requêtes que nécessaire (202 tant que le calcul dépasse ANALYTICS_BUDGET_SECONDS, chaque requête reprend)
+  3. rapport depuis la BDD : cache du worker vidé (autre worker, ou après ANALYTICS_CACHE_TTL)
+  4. rapport depuis le cache du worker : jours clos en mémoire, seul aujourd'hui est recalculé
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_analytics --sessions 10000000 --days 365
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BILLING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-billing')
+HOURLY_RATE = 5.0
+
+
+def fill(path, now, sessions, machines, days, seed=42):
+    """Sessions qui se suivent sur chaque PC : une par créneau de durée fixe, occupée de 20 à 90 %"""
+    rng = np.random.default_rng(seed)
+    per_machine = max(1, sessions // machines)
+    slot = days * 86400 / per_machine
+    end_of_span = np.datetime64(now, 's')
+    origin = end_of_span - np.timedelta64(days * 86400, 's')
+
+    connection = sqlite3.connect(path)
+    inserted = 0
+    for machine_ids in np.array_split(np.arange(1, machines + 1), max(1, sessions // 500000)):
+        count = len(machine_ids) * per_machine
+        machine_column = np.repeat(machine_ids, per_machine)
+        slot_start = np.tile(np.arange(per_machine) * slot, len(machine_ids))
+        duration = np.maximum(slot * rng.uniform(0.2, 0.9, count), 60)
+        start = slot_start + rng.uniform(0, 1, count) * np.maximum(slot - duration, 0)
+        starts = origin + start.astype('timedelta64[s]')
+        ends = starts + duration.astype('timedelta64[s]')
+        keep = starts < end_of_span
+        running = ends >= end_of_span  # au plus une par PC : toujours en cours
+        prices = np.where(running, 0.0, np.round(duration / 3600 * HOURLY_RATE, 2))
+
+        start_text = np.char.replace(np.datetime_as_string(starts, unit='s'), 'T', ' ')
+        end_text = np.char.replace(np.datetime_as_string(ends, unit='s'), 'T', ' ').astype(object)
+        end_text[running] = None
+        connection.executemany(
+            "INSERT INTO session (machine_id, user_id, start_time, end_time, total_price) VALUES (?, 1, ?, ?, ?)",
+            zip(machine_column[keep].tolist(), start_text[keep].tolist(), end_text[keep].tolist(),
+                prices[keep].tolist()))
+        inserted += int(keep.sum())
+    connection.commit()
+    connection.close()
+    return inserted
+
+
+def brute_force(billing, day):
+    """Statistiques d'un jour, session par session (référence)"""
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    now = billing.local_now()
+    busy, revenue, sessions = {}, 0.0, 0
+    minutes = [0, 361, 720, 1081, 1439]
+    running = dict.fromkeys(minutes, 0)
+    for chunk in billing.load_analytics_sessions(start, end):
+        for machine_id, session_start, session_end, price in chunk:
+            session_start = session_start.replace(microsecond=0)
+            stop = min(session_end or now, end, now)
+            if session_end is not None and start <= session_end < end:
+                revenue += price
+                sessions += 1
+            for minute in minutes:
+                if session_start <= start + timedelta(minutes=minute) < stop:
+                    running[minute] += 1
+            hour = max(session_start, start).replace(minute=0, second=0)
+            while hour < stop:
+                overlap = (min(stop, hour + timedelta(hours=1)) - max(session_start, hour)).total_seconds()
+                busy[(machine_id, hour.hour)] = busy.get((machine_id, hour.hour), 0) + overlap
+                hour += timedelta(hours=1)
+    return busy, running, revenue, sessions
+
+
+def check(billing, day, stats):
+    busy, running, revenue, sessions = brute_force(billing, day)
+    swept = {(machine_id, hour): float(stats.busy[row, hour])
+             for row, machine_id in enumerate(stats.machine_ids.tolist()) for hour in range(24)
+             if stats.busy[row, hour]}
+    ok = (swept.keys() == busy.keys() and all(abs(swept[key] - busy[key]) < 1 for key in busy)
+          and all(int(stats.concurrency[minute]) == count for minute, count in running.items())
+          and abs(float(stats.revenue.sum()) - revenue) < 0.01 and stats.sessions == sessions)
+    print(f"  {'✅' if ok else '❌'} {day} : {sessions} sessions terminées, {len(busy)} cases PC x heure, "
+          f"CA {revenue:.2f}")
+    return ok
+
+
+def timed(function, repeat=1):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - started)
+    return result, statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--machines', type=int, default=100)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'billing.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    os.environ['MAX_ANALYTICS_DAYS'] = str(max(args.days, 366))
+    os.environ['OUTBOX_POLL_INTERVAL'] = '3600'
+    os.environ['IDLE_STOP_MINUTES'] = '0'
+    sys.path.insert(0, BILLING_DIR)
+    import app as billing
+    from common.auth import issue_token, auth_headers
+
+    with billing.app.app_context():
+        billing.db.create_all()
+    now = billing.local_now()
+    started = time.perf_counter()
+    inserted = fill(path, now, args.sessions, args.machines, args.days)
+    print(f"{inserted} sessions sur {args.machines} PC et {args.days} jours "
+          f"(insertion : {time.perf_counter() - started:.0f}s)\n")
+
+    today = now.date()
+    first = today - timedelta(days=args.days - 1)
+    analytics = billing.analytics
+    with billing.app.app_context():
+        print("Vérification :")
+        samples = [first + timedelta(days=1), first + timedelta(days=args.days // 2), today - timedelta(days=1)]
+        ok = all([check(billing, day, stats) for day, stats in analytics.days(samples[0], samples[-1], now)
+                  if day in samples])
+        billing.forget_analytics()
+        billing.db.session.commit()
+
+    client = billing.app.test_client()
+    headers = auth_headers(issue_token(1, 'admin', is_admin=True))
+    url = f'/sessions/analytics?from={first.isoformat()}&to={today.isoformat()}'
+
+    def report():
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    def cold_report():
+        durations = []
+        while True:
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            durations.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                return response.get_json(), durations
+            assert response.status_code == 202, response.get_json()
+
+    def from_database():
+        analytics.cache.clear()
+        return report()
+
+    print(f"\nRapport du {first} au {today} ({args.days} jours) :")
+    result, durations = cold_report()
+    cold = sum(durations)
+    _, stored = timed(from_database, args.repeat)
+    _, warm = timed(report, args.repeat)
+    with billing.app.app_context():
+        size = sum(len(data) for (data,) in billing.db.session.query(billing.DailyAnalytics.data))
+    print(f"  à froid (balayage des sessions)  : {cold:8.3f}s  ({inserted / cold:,.0f} sessions/s, "
+          f"{len(durations)} requêtes, la plus longue {max(durations):.1f}s)")
+    print(f"  jours clos lus en BDD            : {stored:8.3f}s  (DailyAnalytics : {size / 1e6:.1f} Mo)")
+    print(f"  jours clos en cache du worker    : {warm:8.3f}s")
+    print(f"\n  utilisation {result['utilization']:.1%}, pic {result['concurrency']['peak']} sessions "
+          f"le {result['concurrency']['peak_at']}, {result['sessions']} sessions terminées "
+          f"({result['average_session_minutes']} min en moyenne), CA {result['revenue']:,.2f}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Coût de la vérification du jeton signé, par requête.
+
+Compare : vérification seule (HMAC + JSON), une route Flask protégée par @require_auth vs la même
+route sans contrôle, et ce que coûterait une recherche de session en BDD à chaque requête.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_auth --iterations 20000
+"""
+import argparse
+import time
+
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+
+from common.auth import auth_headers, issue_token, require_auth, verify_token
+
+
+def per_call_us(func, iterations):
+    func()  # échauffement
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    token = issue_token(42, 'alice', is_admin=True)
+    headers = auth_headers(token)
+
+    app = Flask(__name__)
+
+    @app.route('/open')
+    def open_route():
+        return jsonify({'ok': True})
+
+    @app.route('/protected')
+    @require_auth
+    def protected_route():
+        return jsonify({'ok': True})
+
+    client = app.test_client()
+
+    # Alternative écartée : une table de sessions consultée à chaque requête (ici SQLite en mémoire)
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE user_session (token VARCHAR(255) PRIMARY KEY, user_id INT, is_admin BOOL)"))
+        conn.execute(text("INSERT INTO user_session VALUES (:t, 42, 1)"), {'t': token})
+
+    def session_lookup():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT user_id, is_admin FROM user_session WHERE token = :t"), {'t': token}).one()
+
+    results = [
+        ('verify_token', per_call_us(lambda: verify_token(token), args.iterations)),
+        ('session en BDD (SQLite mémoire)', per_call_us(session_lookup, args.iterations)),
+        ('requête Flask sans auth', per_call_us(lambda: client.get('/open'), args.iterations // 10)),
+        ('requête Flask @require_auth', per_call_us(lambda: client.get('/protected', headers=headers),
+                                                     args.iterations // 10)),
+    ]
+    for label, cost in results:
+        print(f"{label:<34} {cost:8.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Disponibilités des PC réservés : index en mémoire (common/availability.py) contre requêtes SQL.
+
+Génère --reservations réservations sans chevauchement réparties sur --machines PC (Billing, SQLite temporaire),
+charge l'index depuis la BDD puis mesure, sur des créneaux tirés au hasard :
+  - conflit sur un PC : index (bisect) / SQL borné (reserved_machine_ids) / parcours de toutes les réservations
+  - PC libres sur tout le parc et N PC voisins libres : index / une requête SQL par créneau
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_availability --reservations 100000 --machines 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from benchmarks.bench_export import load_billing_app
+
+
+def generate_reservations(machines, count, now, rng):
+    """Réservations de 1 à 6 h par PC, séparées de 0 à 24 h, à partir de maintenant (jamais de chevauchement)"""
+    per_machine = count // machines
+    for machine_id in range(1, machines + 1):
+        at = now + timedelta(minutes=rng.randint(0, 600))
+        for _ in range(per_machine):
+            start = at + timedelta(minutes=rng.randint(0, 24 * 60))
+            end = start + timedelta(minutes=rng.randint(60, 360))
+            yield {'machine_id': machine_id, 'user_id': rng.randint(1, 5000), 'start_time': start, 'end_time': end,
+                   'status': 'booked'}
+            at = end
+
+
+def rate(fn, windows):
+    """Appels par seconde de fn(machine_id, début, fin) sur ces créneaux"""
+    started = time.perf_counter()
+    for window in windows:
+        fn(*window)
+    return len(windows) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reservations', type=int, default=100000)
+    parser.add_argument('--machines', type=int, default=1000)
+    parser.add_argument('--checks', type=int, default=20000,
+                        help="tests de conflit par méthode (100x moins pour le parcours complet)")
+    parser.add_argument('--adjacent', type=int, default=10, help="PC voisins cherchés")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    billing = load_billing_app(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'billing.db')}")
+    Reservation, availability = billing.Reservation, billing.availability
+    now = billing.local_now()
+    machine_ids = list(range(1, args.machines + 1))
+
+    with billing.app.app_context():
+        billing.db.create_all()
+        rows = list(generate_reservations(args.machines, args.reservations, now, rng))
+        started = time.perf_counter()
+        billing.db.session.execute(insert(Reservation), rows)
+        billing.db.session.commit()
+        print(f"{len(rows)} réservations sur {args.machines} PC insérées en {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        availability.sync(force=True)
+        print(f"index chargé en {time.perf_counter() - started:.2f}s ({len(availability)} réservations)")
+
+        horizon = max(row['end_time'] for row in rows) - now
+        windows = []
+        for _ in range(args.checks):
+            start = now + timedelta(minutes=rng.randint(0, int(horizon.total_seconds() // 60)))
+            windows.append((rng.choice(machine_ids), start, start + timedelta(minutes=rng.randint(30, 300))))
+
+        # Les deux méthodes doivent donner la même réponse
+        for machine_id, start, end in windows[:1000]:
+            assert availability.is_free(machine_id, start, end) == \
+                (not billing.reserved_machine_ids([machine_id], start, end)), "index et BDD en désaccord"
+
+        index_rate = rate(availability.is_free, windows)
+        sql_rate = rate(lambda m, s, e: billing.reserved_machine_ids([m], s, e), windows)
+        scan_rate = rate(lambda m, s, e: [r for r in rows if r['machine_id'] == m
+                                          and r['start_time'] < e and r['end_time'] > s],
+                         windows[:max(1, args.checks // 100)])
+
+        print(f"\nConflit sur un PC ({args.checks} créneaux) :")
+        print(f"  index (bisect)         : {index_rate:12,.0f} tests/s")
+        print(f"  SQL borné (index BDD)  : {sql_rate:12,.0f} tests/s")
+        print(f"  parcours complet       : {scan_rate:12,.0f} tests/s")
+
+        park_windows = windows[:200]
+        free_rate = rate(lambda m, s, e: availability.free_machines(machine_ids, s, e), park_windows)
+        adjacent_rate = rate(lambda m, s, e: availability.find_adjacent(machine_ids, args.adjacent, s, e), park_windows)
+        sql_park_rate = rate(lambda m, s, e: billing.reserved_machine_ids(machine_ids, s, e), park_windows)
+
+        print(f"\nTout le parc ({args.machines} PC, {len(park_windows)} créneaux) :")
+        print(f"  PC libres, index       : {free_rate:12,.0f} créneaux/s")
+        print(f"  {args.adjacent} PC voisins, index  : {adjacent_rate:12,.0f} créneaux/s")
+        print(f"  PC réservés, SQL       : {sql_park_rate:12,.0f} créneaux/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Démarrage à froid des services v2 : temps d'import, absence de DDL à l'import, temps avant la 1re réponse.
+
+Pour chaque service :
+  - import de app.py dans un interpréteur neuf (médiane de --runs essais), sur une base SQLite vide :
+    la base ne doit PAS être créée (ni create_all, ni seed, ni connexion pendant l'import) ;
+  - gunicorn avec le profil du service : temps entre le lancement et le premier 200 sur /healthz.
+Code de sortie 1 si un import dépasse --budget secondes ou touche à la base (utilisable en CI).
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_cold_start --budget 1.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.stubs import free_port
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONFIG = os.path.join(ROOT, 'common', 'gunicorn_conf.py')
+SERVICES = ('gateway', 'inventory', 'billing', 'auth')
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def import_time(service_dir, env):
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=service_dir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_response_time(service, service_dir, env, timeout=30.0):
+    port = free_port()
+    env = {**env, 'SERVICE_PROFILE': service, 'PORT': str(port), 'WEB_CONCURRENCY': '2',
+           'GUNICORN_LOG_LEVEL': 'warning'}
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', CONFIG], cwd=service_dir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/healthz", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.02)
+        return float('nan')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.5, help="temps d'import maximum par service (s)")
+    args = parser.parse_args()
+
+    failures = []
+    for service in SERVICES:
+        service_dir = os.path.join(ROOT, f'service-{service}')
+        database = os.path.join(tempfile.mkdtemp(), f'{service}.db')
+        env = {**os.environ, 'DATABASE_URL': f"sqlite:///{database}"}
+
+        median = statistics.median(import_time(service_dir, env) for _ in range(args.runs))
+        touched_db = os.path.exists(database)
+        boot = first_response_time(service, service_dir, env)
+
+        status = '✅'
+        if median > args.budget:
+            status = '❌'
+            failures.append(f"{service} : import en {median:.2f}s (budget {args.budget}s)")
+        if touched_db:
+            status = '❌'
+            failures.append(f"{service} : la base a été ouverte pendant l'import")
+        print(f"{status} {service:<10} import {median * 1000:7.0f} ms   1re réponse gunicorn {boot * 1000:7.0f} ms   "
+              f"base touchée à l'import : {'oui' if touched_db else 'non'}")
+
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Export en flux des sessions (/sessions/export du Billing) : lignes/s et pic mémoire (RSS).
+
+Génère une table de sessions synthétique, puis lance l'export dans un processus neuf pour que
+le pic mémoire mesuré ne concerne que l'export. Le pic doit rester stable quand --rows augmente.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_export --rows 1000000 --format csv
+    python -m benchmarks.bench_export --rows 1000000 --format ndjson --gzip
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BILLING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-billing')
+
+
+def load_billing_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, BILLING_DIR)
+    import app as billing
+    return billing
+
+
+def generate(database_url, rows, machines=200, batch=10000):
+    billing = load_billing_app(database_url)
+    table = billing.Session.__table__
+    start = datetime(2024, 1, 1)
+
+    with billing.app.app_context():
+        billing.db.create_all()
+        for offset in range(0, rows, batch):
+            values = []
+            for i in range(offset, min(rows, offset + batch)):
+                begin = start + timedelta(seconds=i * 30)
+                values.append({
+                    'machine_id': random.randint(1, machines),
+                    'start_time': begin,
+                    'end_time': begin + timedelta(minutes=random.randint(10, 240)),
+                    'total_price': round(random.uniform(1, 20), 2),
+                })
+            billing.db.session.execute(table.insert(), values)
+            billing.db.session.commit()
+
+
+def export_worker(database_url, query_string, results):
+    billing = load_billing_app(database_url)
+    client = billing.app.test_client()
+
+    started = time.perf_counter()
+    response = client.get(f"/sessions/export?{query_string}", buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss est en Ko sous Linux
+    results.put((elapsed, size, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--database-url', help="base existante (sinon SQLite temporaire générée)")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'billing.db')}"
+        started = time.perf_counter()
+        generate(database_url, args.rows)
+        print(f"{args.rows} sessions générées en {time.perf_counter() - started:.1f}s")
+
+    query_string = f"format={args.format}" + ('&gzip=1' if args.gzip else '')
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    worker = ctx.Process(target=export_worker, args=(database_url, query_string, results))
+    worker.start()
+    elapsed, size, peak_rss = results.get()
+    worker.join()
+
+    print(f"export {args.format}{' + gzip' if args.gzip else ''} : {args.rows / elapsed:,.0f} lignes/s, "
+          f"{size / 1024 / 1024:.1f} Mo envoyés en {elapsed:.1f}s, pic RSS {peak_rss:.1f} Mo")
+
+
+if __name__ == '__main__':
+    main()
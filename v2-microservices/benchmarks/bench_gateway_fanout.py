@@ -0,0 +1,110 @@
+"""Débit du Gateway : mode synchrone (Flask, comme app.run) vs mode asynchrone (ASGI + uvicorn).
+
+Inventory et Billing sont remplacés par des faux services locaux avec une latence simulée.
+Chaque serveur tourne dans son propre processus (pour ne pas partager le GIL avec le générateur de charge).
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_gateway_fanout --delay 0.02 --clients 16 --duration 10
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.stubs import admin_cookies, free_port, percentile, start_stub_server, wait_for_port
+
+GATEWAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-gateway')
+
+MACHINES = [{'id': i, 'name': f"PC-{i}", 'status': 'occupied' if i % 3 else 'available'} for i in range(1, 41)]
+ACTIVE = [{'id': i, 'machine_id': m['id'], 'start_time': datetime(2024, 1, 1, 18).isoformat()}
+          for i, m in enumerate(MACHINES) if m['status'] == 'occupied']
+HISTORY = {
+    'total_income': 1234.5,
+    'sessions': [{'id': i, 'machine_id': i % 40 + 1, 'start_time': datetime(2024, 1, 1, 10).isoformat(),
+                  'end_time': datetime(2024, 1, 1, 12).isoformat(), 'total_price': 10.0} for i in range(50)],
+}
+
+
+def serve_stub(routes, delay, port):
+    start_stub_server(routes, delay=delay, port=port)
+    threading.Event().wait()
+
+
+def serve_gateway(mode, port):
+    sys.path.insert(0, GATEWAY_DIR)
+    if mode == 'sync':
+        # Équivalent de app.run() (serveur Werkzeug multi-thread), sans les logs de requêtes
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        from werkzeug.serving import run_simple
+        import app as gateway
+        run_simple('127.0.0.1', port, gateway.app, threaded=True)
+    else:
+        import uvicorn
+        import async_app
+        uvicorn.run(async_app.asgi_app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def load(url, path, clients, duration, headers=None):
+    deadline = time.perf_counter() + duration
+
+    def worker(_):
+        session = requests.Session()
+        session.cookies.update(admin_cookies())
+        session.headers.update(headers or {})  # appel direct d'un service (bench_serving)
+        latencies = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            session.get(f"{url}{path}").raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return [lat for chunk in pool.map(worker, range(clients)) for lat in chunk]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.02, help="latence simulée de chaque service (s)")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('fork')
+    inventory_port, billing_port = free_port(), free_port()
+    stubs = [
+        ctx.Process(target=serve_stub, args=({'/machines': MACHINES}, args.delay, inventory_port), daemon=True),
+        ctx.Process(target=serve_stub, args=({'/sessions/active': ACTIVE, '/sessions/history': HISTORY},
+                                             args.delay, billing_port), daemon=True),
+    ]
+    for process in stubs:
+        process.start()
+    os.environ['INVENTORY_API_URL'] = f"http://127.0.0.1:{inventory_port}"
+    os.environ['BILLING_API_URL'] = f"http://127.0.0.1:{billing_port}"
+
+    try:
+        for mode in ('sync', 'async'):
+            port = free_port()
+            gateway = ctx.Process(target=serve_gateway, args=(mode, port), daemon=True)
+            gateway.start()
+            wait_for_port(port)
+            try:
+                for path in ('/', '/history'):
+                    latencies = load(f"http://127.0.0.1:{port}", path, args.clients, args.duration)
+                    print(f"{mode:<6} {path:<9} {len(latencies) / args.duration:8.1f} req/s  "
+                          f"p50={percentile(latencies, 50) * 1000:7.1f} ms  "
+                          f"p99={percentile(latencies, 99) * 1000:7.1f} ms")
+            finally:
+                gateway.terminate()
+    finally:
+        for process in stubs:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Battements des PC (POST /machines/heartbeat de l'Inventory) : débit soutenu et durée des écritures groupées.
+
+Chaque configuration tourne dans un processus neuf (SQLite temporaire, --machines PC) : --threads threads
+envoient des battements en boucle, PC après PC, pendant --duration secondes.
+  - "par lots"    : état en mémoire, un upsert groupé toutes les HEARTBEAT_FLUSH_INTERVAL secondes
+  - "par requête" : HEARTBEAT_FLUSH_INTERVAL=0, un upsert + commit par battement (l'ancien style)
+Objectif : 1 000 PC x 1 battement / 5 s = 200 battements/s.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_heartbeat --machines 1000 --threads 8 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.stubs import percentile
+
+INVENTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-inventory')
+
+
+def run_setting(flush_interval, machines, threads, duration, results):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'inventory.db')}"
+    os.environ['HEARTBEAT_FLUSH_INTERVAL'] = str(flush_interval)
+    sys.path.insert(0, INVENTORY_DIR)
+    import app as inventory
+    from common.auth import issue_token, auth_headers, service_auth_headers
+
+    with inventory.app.app_context():
+        inventory.db.create_all()
+    inventory.app.test_client().post('/machines/bulk', json={'count': machines},
+                                     headers=auth_headers(issue_token(1, 'admin', is_admin=True)))
+    headers = service_auth_headers('agent')
+
+    flushes = []  # (durée, lignes)
+    upsert = inventory.upsert_heartbeats
+
+    def timed_upsert(rows):
+        started = time.perf_counter()
+        upsert(rows)
+        flushes.append((time.perf_counter() - started, len(rows)))
+    inventory.heartbeats.flush = timed_upsert
+
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    deadline = time.monotonic() + duration
+
+    def agent(index):
+        client = inventory.app.test_client()
+        machine_id = index
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.post('/machines/heartbeat', headers=headers, json={
+                'machine_id': machine_id % machines + 1, 'logged_in': True, 'idle_seconds': 3, 'cpu': 0.4})
+            latencies[index].append(time.perf_counter() - started)
+            if response.status_code != 202:
+                errors[index] += 1
+            machine_id += threads
+
+    workers = [threading.Thread(target=agent, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    inventory.heartbeats.flush_now()  # dernier lot (compté dans les écritures, pas dans le débit)
+
+    with inventory.app.app_context():
+        stored = inventory.Heartbeat.query.count()
+    all_latencies = [latency for per_thread in latencies for latency in per_thread]
+    durations = [duration for duration, _ in flushes]
+    results.put((len(all_latencies) / elapsed, percentile(all_latencies, 50), percentile(all_latencies, 95),
+                 sum(errors), len(flushes), sum(rows for _, rows in flushes) / max(1, len(flushes)),
+                 percentile(durations, 50), percentile(durations, 95), max(durations, default=0.0), stored))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--machines', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--flush-interval', type=float, default=2.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    print(f"{args.machines} PC, {args.threads} threads, {args.duration:.0f}s par configuration "
+          f"(objectif : {args.machines / 5:.0f} battements/s)\n")
+    print(f"{'écriture':<12} {'batt./s':>9} {'p50':>8} {'p95':>8} {'erreurs':>8} {'lots':>6} {'lignes/lot':>11} "
+          f"{'lot p50':>9} {'lot p95':>9} {'lot max':>9} {'PC en BDD':>10}")
+    for name, interval in (('par lots', args.flush_interval), ('par requête', 0)):
+        results = ctx.Queue()
+        process = ctx.Process(target=run_setting, args=(interval, args.machines, args.threads, args.duration,
+                                                        results))
+        process.start()
+        rate, p50, p95, errors, flushes, rows, flush_p50, flush_p95, flush_max, stored = results.get()
+        process.join()
+        print(f"{name:<12} {rate:9.0f} {p50 * 1000:6.2f}ms {p95 * 1000:6.2f}ms {errors:8d} {flushes:6d} "
+              f"{rows:11.0f} {flush_p50 * 1000:7.1f}ms {flush_p95 * 1000:7.1f}ms {flush_max * 1000:7.1f}ms "
+              f"{stored:10d}")
+
+
+if __name__ == '__main__':
+    main()
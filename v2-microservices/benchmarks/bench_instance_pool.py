@@ -0,0 +1,172 @@
+"""Pool de PC virtuels (cloud gaming) : attente des clients et coût des instances, selon la politique du pool.
+
+Simulation accélérée sur un SQLite temporaire, avec le fournisseur simulé (provisioning.FakeProvisioner) :
+1 "minute" de l'autoscaler = --bucket secondes réelles. Les clients arrivent selon un processus de Poisson
+(creux -> montée en charge -> pic -> creux), demandent un PC (POST /instances/acquire), rappellent après
+Retry-After tant que le pool est vide, jouent --session secondes en moyenne puis libèrent le PC.
+Politiques comparées :
+  - à la demande : pas de pool, une instance démarre pour chaque demande non servie
+  - pool fixe    : --fixed instances chaudes en permanence
+  - prédictif    : WarmPoolAutoscaler (Holt + marge de Poisson) sur les démarrages récents
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_instance_pool --duration 40 --boot 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from benchmarks.stubs import percentile
+
+INVENTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-inventory')
+
+
+def load_inventory_app(reconcile_interval):
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'inventory.db')}")
+    os.environ['POOL_RECONCILE_INTERVAL'] = str(reconcile_interval)
+    sys.path.insert(0, INVENTORY_DIR)
+    import app as inventory
+    return inventory
+
+
+def arrival_rate(elapsed, duration, base, peak):
+    """Arrivées par seconde : creux, montée linéaire, pic, redescente (chaque phase = 1/4 de la durée)"""
+    phase = elapsed / duration * 4
+    if phase < 1:
+        return base
+    if phase < 2:
+        return base + (peak - base) * (phase - 1)
+    if phase < 3:
+        return peak
+    return base
+
+
+class Demand:
+    """Démarrages de session par intervalle (ce que renvoie GET /sessions/start-rate du Billing)"""
+
+    def __init__(self, bucket_seconds, history):
+        self.bucket_seconds = bucket_seconds
+        self.history = history
+        self.started = time.monotonic()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self):
+        bucket = int((time.monotonic() - self.started) // self.bucket_seconds)
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+    def __call__(self):
+        current = int((time.monotonic() - self.started) // self.bucket_seconds)  # intervalle en cours : exclu
+        with self.lock:
+            return [self.counts.get(b, 0) for b in range(max(0, current - self.history), current)]
+
+
+def run_policy(inventory, name, min_size, max_size, args, seed):
+    from autoscaler import WarmPoolAutoscaler
+    from provisioning import FakeProvisioner
+    from common.auth import service_auth_headers
+
+    with inventory.app.app_context():
+        inventory.db.drop_all()
+        inventory.db.create_all()
+
+    provisioner = FakeProvisioner(boot_seconds=args.boot, recycle_seconds=args.recycle, jitter=0.2)
+    autoscaler = WarmPoolAutoscaler(args.boot, bucket_seconds=args.bucket, min_size=min_size, max_size=max_size)
+    demand = Demand(args.bucket, args.history)
+    pool = inventory.InstancePool(provisioner, autoscaler, demand, workers=32,
+                                  scale_down_delay=timedelta(seconds=args.scale_down))
+    headers = service_auth_headers('billing')  # les joueurs passent par le Billing
+    stop = threading.Event()
+    targets = []
+
+    def manager():
+        with inventory.app.app_context():
+            pool.recover()
+        while not stop.is_set():
+            with inventory.app.app_context():
+                targets.append(pool.reconcile())
+            stop.wait(args.interval)
+
+    waits, outcomes, busy = [], {'hit': 0, 'miss': 0}, []
+    lock = threading.Lock()
+
+    def player(rng):
+        client = inventory.app.test_client()
+        arrived = time.monotonic()
+        first = True
+        while True:
+            response = client.post('/instances/acquire', headers=headers)
+            if response.status_code == 200:
+                break
+            first = False
+            time.sleep(float(response.headers.get('Retry-After', 1)))
+        demand.record()
+        waited = time.monotonic() - arrived
+        session = rng.expovariate(1 / args.session)
+        with lock:
+            waits.append(waited)
+            outcomes['hit' if first else 'miss'] += 1
+            busy.append(session)
+        time.sleep(session)
+        client.post(f"/machines/{response.get_json()['machine_id']}/release", headers=headers)
+
+    manager_thread = threading.Thread(target=manager, daemon=True)
+    manager_thread.start()
+    rng = random.Random(seed)
+    players = []
+    started = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= args.duration:
+            break
+        time.sleep(rng.expovariate(arrival_rate(elapsed, args.duration, args.base, args.peak)))
+        thread = threading.Thread(target=player, args=(random.Random(rng.random()),), daemon=True)
+        thread.start()
+        players.append(thread)
+    for thread in players:
+        thread.join()
+    stop.set()
+    manager_thread.join()
+    pool._executor.shutdown(wait=True)
+
+    instance_seconds = provisioner.instance_seconds()
+    idle = instance_seconds - sum(busy)
+    served = len(waits)
+    print(f"{name:<14} {served:>7} {outcomes['hit'] / served:>8.0%} {percentile(waits, 50):>8.2f}s "
+          f"{percentile(waits, 95):>8.2f}s {max(waits):>8.2f}s {instance_seconds:>10.0f} {idle:>10.0f} "
+          f"{max(targets):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=40, help="durée de chaque simulation (s)")
+    parser.add_argument('--boot', type=float, default=3, help="démarrage d'une instance (s)")
+    parser.add_argument('--recycle', type=float, default=0.5, help="remise à zéro entre deux clients (s)")
+    parser.add_argument('--session', type=float, default=4, help="durée moyenne d'une session (s)")
+    parser.add_argument('--base', type=float, default=0.5, help="arrivées par seconde en creux")
+    parser.add_argument('--peak', type=float, default=4, help="arrivées par seconde au pic")
+    parser.add_argument('--fixed', type=int, default=12, help="taille du pool fixe")
+    parser.add_argument('--bucket', type=float, default=2, help="durée d'un intervalle de l'autoscaler (s)")
+    parser.add_argument('--history', type=int, default=15, help="intervalles lus par l'autoscaler")
+    parser.add_argument('--interval', type=float, default=0.5, help="une passe du gestionnaire toutes les N s")
+    parser.add_argument('--scale-down', type=float, default=3, help="instance chaude en trop détruite après N s")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    inventory = load_inventory_app(args.interval)
+    print(f"{args.duration:g}s par politique, démarrage {args.boot:g}s, "
+          f"{args.base:g} -> {args.peak:g} arrivées/s, sessions de {args.session:g}s en moyenne\n")
+    print(f"{'politique':<14} {'clients':>7} {'sans att.':>8} {'p50':>9} {'p95':>9} {'max':>9} "
+          f"{'inst.-s':>10} {'inactif':>10} {'cible max':>8}")
+    run_policy(inventory, 'à la demande', 0, 0, args, args.seed)
+    run_policy(inventory, 'pool fixe', args.fixed, args.fixed, args, args.seed)
+    run_policy(inventory, 'prédictif', 1, 50, args, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Lectures sur réplica (DATABASE_READ_URL) : vérifie le routage du Billing puis mesure les requêtes déchargées.
+
+Par défaut deux fichiers SQLite : le primaire est rempli (--sessions sessions terminées) puis copié vers le
+"réplica" (copie figée : sans réplication, une session écrite ensuite n'existe que sur le primaire, ce qui
+permet de voir d'où vient chaque lecture). Pour un vrai couple MySQL, définir DATABASE_URL et DATABASE_READ_URL.
+  1. routage : historique -> réplica ; juste après sa propre écriture -> primaire (et les autres clients
+     restent sur le réplica) ; header X-Read-Your-Writes -> primaire ; fenêtre écoulée -> réplica
+  2. charge : --threads threads, --writes % de démarrages/arrêts, le reste en lectures d'historique ;
+     instructions SQL servies par chaque base
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_read_replica --threads 8 --duration 10
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from benchmarks.stubs import start_stub_server
+
+BILLING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-billing')
+
+
+def routed():
+    from common.database import STATEMENTS_ROUTED
+    from common.metrics import samples
+    counts = {'primary': 0, 'replica': 0}
+    for _, labels, value in samples(STATEMENTS_ROUTED):
+        counts[labels['target']] = value
+    return counts
+
+
+def reads_from(billing, path, headers):
+    """Base lue par cette requête ('primary' / 'replica') et la réponse"""
+    before = routed()
+    response = billing.app.test_client().get(path, headers=headers)
+    after = routed()
+    if after['replica'] > before['replica'] and after['primary'] == before['primary']:
+        return 'replica', response
+    if after['primary'] > before['primary'] and after['replica'] == before['replica']:
+        return 'primary', response
+    return 'mixte', response
+
+
+def check(label, ok):
+    print(f"  {'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def check_routing(billing, headers, window):
+    print("Routage :")
+    user1, user2 = headers(1), headers(2)
+    billing.app.test_client().get('/sessions/history', headers=headers(3))  # démarre les threads de fond du worker
+    time.sleep(0.3)
+    ok = check("historique -> réplica", reads_from(billing, '/sessions/history', user1)[0] == 'replica')
+
+    client = billing.app.test_client()
+    client.post('/sessions/start', json={'machine_id': 9001}, headers=user1)
+    client.post('/sessions/stop/9001', headers=user1)
+    time.sleep(0.3)  # livraison de l'outbox (primaire) terminée
+    target, response = reads_from(billing, '/sessions/history', user1)
+    mine = any(s['machine_id'] == 9001 for s in response.get_json()['sessions'])
+    ok &= check(f"après sa propre écriture -> primaire (lu : {target}, voit sa session : {mine})",
+                target == 'primary' and mine)
+    ok &= check("un autre client -> réplica", reads_from(billing, '/sessions/history', user2)[0] == 'replica')
+    ok &= check("header X-Read-Your-Writes -> primaire",
+                reads_from(billing, '/sessions/history', {**user2, 'X-Read-Your-Writes': '1'})[0] == 'primary')
+    time.sleep(window + 0.2)
+    ok &= check(f"{window:g}s plus tard -> réplica", reads_from(billing, '/sessions/history', user1)[0] == 'replica')
+    return ok
+
+
+def run_load(billing, headers, users, threads, duration, write_share):
+    print(f"\nCharge : {threads} threads, {duration:g}s, {write_share:.0%} d'écritures")
+    before = routed()
+    done = [[0, 0] for _ in range(threads)]  # (lectures, écritures)
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        rng = random.Random(index)
+        client = billing.app.test_client()
+        machine_id = 10000 + index
+        while time.monotonic() < deadline:
+            user = headers(rng.randint(1, users))
+            if rng.random() < write_share:
+                client.post('/sessions/start', json={'machine_id': machine_id}, headers=user)
+                client.post(f'/sessions/stop/{machine_id}', headers=user)
+                done[index][1] += 1
+            else:
+                client.get('/sessions/history', headers=user)
+                done[index][0] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    after = routed()
+    primary, replica = after['primary'] - before['primary'], after['replica'] - before['replica']
+    reads, writes = sum(r for r, _ in done), sum(w for _, w in done)
+    print(f"  requêtes HTTP     : {(reads + writes) / elapsed:8.0f}/s ({reads} historiques, {writes} démarrages+arrêts)")
+    print(f"  SQL sur primaire  : {primary / elapsed:8.0f}/s")
+    print(f"  SQL sur réplica   : {replica / elapsed:8.0f}/s ({replica / max(1, primary + replica):.0%} déchargé)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--writes', type=float, default=0.1, help="part des opérations qui écrivent")
+    parser.add_argument('--window', type=float, default=1.0, help="READ_YOUR_WRITES_SECONDS")
+    args = parser.parse_args()
+
+    local = 'DATABASE_URL' not in os.environ
+    if local:
+        folder = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(folder, 'primary.db')}"
+        os.environ['DATABASE_READ_URL'] = f"sqlite:///{os.path.join(folder, 'replica.db')}"
+    os.environ['READ_YOUR_WRITES_SECONDS'] = str(args.window)
+    # Pas de passage périodique de l'outbox ni de balayage des sessions inactives pendant les vérifications
+    os.environ['OUTBOX_POLL_INTERVAL'] = '3600'
+    os.environ['IDLE_STOP_MINUTES'] = '0'
+    inventory = start_stub_server({'/machines/status': {'occupied': [], 'released': [], 'conflicts': [],
+                                                        'not_found': []}})
+    os.environ['INVENTORY_API_URL'] = inventory.url
+    sys.path.insert(0, BILLING_DIR)
+    import app as billing
+    from common.auth import issue_token, auth_headers
+
+    tokens = {}
+
+    def headers(user_id):
+        if user_id not in tokens:
+            tokens[user_id] = auth_headers(issue_token(user_id, f'client{user_id}'))
+        return tokens[user_id]
+
+    with billing.app.app_context():
+        billing.db.create_all()
+        rng = random.Random(42)
+        now = billing.local_now()
+        rows = []
+        for _ in range(args.sessions):
+            start = now - timedelta(minutes=rng.randint(60, 60 * 24 * 90))
+            rows.append({'machine_id': rng.randint(1, 100), 'user_id': rng.randint(1, args.users),
+                         'start_time': start, 'end_time': start + timedelta(minutes=rng.randint(15, 240)),
+                         'total_price': round(rng.uniform(1, 20), 2)})
+        billing.db.session.execute(insert(billing.Session), rows)
+        billing.db.session.commit()
+    if local:
+        # Le réplica part d'une copie du primaire
+        source = sqlite3.connect(os.environ['DATABASE_URL'][len('sqlite:///'):])
+        target = sqlite3.connect(os.environ['DATABASE_READ_URL'][len('sqlite:///'):])
+        source.backup(target)
+        source.close()
+        target.close()
+    print(f"{args.sessions} sessions, primaire {os.environ['DATABASE_URL'].split(':')[0]}, "
+          f"réplica {os.environ['DATABASE_READ_URL'].split(':')[0]}\n")
+
+    ok = check_routing(billing, headers, args.window)
+    run_load(billing, headers, args.users, args.threads, args.duration, args.writes)
+    inventory.shutdown()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Re-tarification en masse des sessions du Billing : sessions re-tarifées par seconde.
+
+Génère une table de sessions synthétique (tarif par défaut), puis applique une grille avec catégories
+de PC et happy hours : calcul seul (NumPy vs une session à la fois), puis reprice_sessions complet
+(SELECT par paquets + calcul + UPDATE groupé) et reconstruction du cumul journalier.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_reprice --rows 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_export import generate, load_billing_app
+
+CORRECTED_TARIFF = {
+    'rounding_minutes': 5,
+    'default_class': 'standard',
+    'classes': {'standard': {'hourly_rate': 5.5, 'minimum_charge': 1.0},
+                'gaming': {'hourly_rate': 8.0, 'minimum_charge': 2.0}},
+    'machines': {str(i): 'gaming' for i in range(1, 41)},
+    'happy_hours': [{'days': [0, 1, 2, 3, 4], 'start': '14:00', 'end': '17:00', 'discount': 0.5},
+                    {'days': [5, 6], 'start': '22:00', 'end': '02:00', 'discount': 0.25}],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--scalar-rows', type=int, default=20000, help="sessions tarifées une par une (comparaison)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    tariff_file = os.path.join(workdir, 'tariff.json')
+    with open(tariff_file, 'w') as f:
+        json.dump(CORRECTED_TARIFF, f)
+    os.environ['TARIFF_FILE'] = tariff_file
+
+    database_url = f"sqlite:///{os.path.join(workdir, 'billing.db')}"
+    started = time.perf_counter()
+    generate(database_url, args.rows)
+    print(f"{args.rows} sessions générées en {time.perf_counter() - started:.1f}s")
+
+    billing = load_billing_app(database_url)
+    Session = billing.Session
+    with billing.app.app_context():
+        rows = billing.db.session.query(Session.machine_id, Session.start_time, Session.end_time).all()
+        machine_ids, starts, ends = zip(*rows)
+
+        started = time.perf_counter()
+        billing.tariff.price_batch(machine_ids, starts, ends)
+        vectorized = time.perf_counter() - started
+
+        sample = rows[:args.scalar_rows]
+        started = time.perf_counter()
+        for machine_id, start, end in sample:
+            billing.tariff.price(machine_id, start, end)
+        scalar = time.perf_counter() - started
+
+        started = time.perf_counter()
+        seen, changed = billing.reprice_sessions()
+        repriced = time.perf_counter() - started
+        billing.rebuild_daily_revenue()
+        billing.db.session.commit()
+        total = time.perf_counter() - started
+
+        check = np.array([p for (p,) in billing.db.session.query(Session.total_price).order_by(Session.id).limit(1000)])
+        expected = billing.tariff.price_batch(machine_ids[:1000], starts[:1000], ends[:1000])
+        assert np.allclose(check, expected), "prix écrits différents du calcul"
+
+    print(f"calcul NumPy        : {len(rows) / vectorized:12,.0f} sessions/s")
+    print(f"calcul une par une  : {len(sample) / scalar:12,.0f} sessions/s")
+    print(f"reprice_sessions    : {seen / repriced:12,.0f} sessions/s ({changed} prix modifiés)")
+    print(f"  + cumul + commit  : {seen / total:12,.0f} sessions/s ({total:.1f}s au total)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Latence p50/p99 des appels inter-services : requests.get direct vs ServiceClient (pool keep-alive).
+
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_service_client --calls 2000 --threads 8
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stubs import percentile, start_stub_server
+from common.service_client import ServiceClient
+
+MACHINES = [{'id': i, 'name': f"PC-{i}", 'status': 'available'} for i in range(1, 51)]
+
+
+def run(label, call, calls, threads):
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{label:<28} p50={percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p99={percentile(latencies, 99) * 1000:7.2f} ms  {calls / elapsed:8.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.0, help="latence simulée du service (s)")
+    args = parser.parse_args()
+
+    server = start_stub_server({'/machines': MACHINES}, delay=args.delay)
+    client = ServiceClient(server.url, 'Stub', pool_size=args.threads)
+
+    try:
+        run("avant : requests.get", lambda: requests.get(f"{server.url}/machines").json(), args.calls, args.threads)
+        run("après : ServiceClient", lambda: client.get('/machines').json(), args.calls, args.threads)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Test de charge local des configurations de service : requêtes/s selon le serveur utilisé.
+
+Compare, pour un même service et une même route :
+  - flask-dev      : serveur de développement Flask (ce que lançait `python app.py`)
+  - gunicorn-sync  : gunicorn par défaut (1 worker sync, sans preload)
+  - profil         : common/gunicorn_conf.py avec le profil du service (SERVICE_PROFILE)
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_serving --service inventory --path /machines --clients 16
+    python -m benchmarks.bench_serving --service billing --path /sessions/active --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_gateway_fanout import load
+from benchmarks.stubs import free_port, percentile, wait_for_port
+from common.auth import service_auth_headers
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONFIG = os.path.join(ROOT, 'common', 'gunicorn_conf.py')
+
+
+CONFIGURATIONS = ('flask-dev', 'gunicorn-sync', 'profil')
+
+
+def command_for(configuration, service, port, workers):
+    """(commande, variables d'environnement en plus) pour lancer le service sur `port`"""
+    if configuration == 'flask-dev':
+        return [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port)], {}
+    if configuration == 'gunicorn-sync':
+        return [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}", '--log-level', 'warning',
+                'app:app'], {}
+    env = {'SERVICE_PROFILE': service, 'PORT': str(port), 'GUNICORN_LOG_LEVEL': 'warning'}
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    return [sys.executable, '-m', 'gunicorn', '-c', CONFIG], env
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--service', choices=['inventory', 'billing', 'auth'], default='inventory')
+    parser.add_argument('--path', default='/machines')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=0, help="force WEB_CONCURRENCY pour le profil")
+    args = parser.parse_args()
+
+    service_dir = os.path.join(ROOT, f'service-{args.service}')
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), f'{args.service}.db')}"
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=service_dir, check=True,
+                   env={**os.environ, 'DATABASE_URL': database_url}, stdout=subprocess.DEVNULL)
+
+    for configuration in CONFIGURATIONS:
+        port = free_port()
+        command, extra_env = command_for(configuration, args.service, port, args.workers)
+        env = {**os.environ, 'DATABASE_URL': database_url, **extra_env}
+        server = subprocess.Popen(command, cwd=service_dir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            # Jeton de service : les routes authentifiées (ex. /sessions/active) se mesurent aussi
+            load(f"http://127.0.0.1:{port}", args.path, args.clients, 1.0, service_auth_headers('gateway'))  # échauffement
+            latencies = load(f"http://127.0.0.1:{port}", args.path, args.clients, args.duration,
+                             service_auth_headers('gateway'))
+            print(f"{configuration:<14} {len(latencies) / args.duration:8.1f} req/s  "
+                  f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p99={percentile(latencies, 99) * 1000:7.1f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Diffusion SSE : N dashboards connectés à /events/machines, latence de livraison et mémoire du Gateway.
+
+Un faux Inventory change le statut d'un PC à chaque "Ajouter un PC" ; on mesure le temps entre
+l'action et la réception de la différence par chaque client, et la mémoire (RSS) du processus Gateway.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.bench_sse_fanout --clients 300 --changes 10 --mode async
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+import requests
+
+from benchmarks.bench_gateway_fanout import serve_gateway
+from benchmarks.stubs import admin_cookies, free_port, percentile, start_stub_server, wait_for_port
+
+
+def serve_inventory(port):
+    machines = [{'id': i, 'name': f"PC-{i}", 'status': 'available'} for i in range(1, 21)]
+
+    def toggle(handler):
+        machines[0]['status'] = 'occupied' if machines[0]['status'] == 'available' else 'available'
+        return 201, {'id': 1, 'name': 'PC-1'}
+
+    def machines_route(handler):
+        if handler.command == 'POST':
+            return toggle(handler)
+        return 200, machines
+
+    start_stub_server({'/machines': machines_route}, port=port)
+    threading.Event().wait()
+
+
+def serve_billing(port):
+    start_stub_server({'/sessions/active': []}, port=port)
+    threading.Event().wait()
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def client(port, received, ready):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    cookie = '; '.join(f"{name}={value}" for name, value in admin_cookies().items())
+    writer.write(f"GET /events/machines HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n".encode())
+    await writer.drain()
+    ready.release()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b'event: machines'):
+                received.append(time.perf_counter())
+    finally:
+        writer.close()
+
+
+async def run(port, clients, changes, pause):
+    received = []
+    ready = asyncio.Semaphore(0)
+    tasks = [asyncio.create_task(client(port, received, ready)) for _ in range(clients)]
+    for _ in range(clients):
+        await ready.acquire()
+    await asyncio.sleep(1.0)  # laisser les abonnements s'enregistrer
+
+    latencies = []
+    loop = asyncio.get_running_loop()
+    for _ in range(changes):
+        received.clear()
+        started = time.perf_counter()
+        await loop.run_in_executor(None, lambda: requests.post(f"http://127.0.0.1:{port}/machines/add",
+                                                               cookies=admin_cookies(), allow_redirects=False))
+        deadline = time.perf_counter() + 10
+        while len(received) < clients and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        latencies += [t - started for t in received]
+        await asyncio.sleep(pause)
+
+    for task in tasks:
+        task.cancel()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--changes', type=int, default=10)
+    parser.add_argument('--pause', type=float, default=0.5)
+    parser.add_argument('--mode', choices=['sync', 'async'], default='async')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('fork')
+    inventory_port, billing_port, gateway_port = free_port(), free_port(), free_port()
+    os.environ['INVENTORY_API_URL'] = f"http://127.0.0.1:{inventory_port}"
+    os.environ['BILLING_API_URL'] = f"http://127.0.0.1:{billing_port}"
+    processes = [
+        ctx.Process(target=serve_inventory, args=(inventory_port,), daemon=True),
+        ctx.Process(target=serve_billing, args=(billing_port,), daemon=True),
+        ctx.Process(target=serve_gateway, args=(args.mode, gateway_port), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    wait_for_port(gateway_port)
+    gateway_pid = processes[-1].pid
+
+    try:
+        idle_rss = rss_mb(gateway_pid)
+        latencies = asyncio.run(run(gateway_port, args.clients, args.changes, args.pause))
+        loaded_rss = rss_mb(gateway_pid)
+    finally:
+        for process in processes:
+            process.terminate()
+
+    expected = args.clients * args.changes
+    print(f"mode {args.mode} : {args.clients} clients, {args.changes} changements")
+    print(f"  messages reçus : {len(latencies)}/{expected}")
+    print(f"  latence de livraison p50={percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p99={percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  mémoire Gateway : {idle_rss:.1f} Mo au repos -> {loaded_rss:.1f} Mo "
+          f"({(loaded_rss - idle_rss) * 1024 / args.clients:.1f} Ko par client)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Générateur de charge par scénarios et résultats JSON comparables d'un commit à l'autre.
+
+    samples = run_load(make_client, SCENARIOS, clients=16, duration=30)
+    results = summarize(samples, duration=30, meta={...})
+    write_results('results.json', results)
+    compare(load_results('baseline.json'), results)     # nombre de routes en régression
+
+Un scénario est une fonction (client, rng) qui enchaîne des appels `client.call(route, method, url)` ;
+chaque appel est chronométré et rangé sous son nom de route (ex. 'GET /history').
+"""
+import json
+import os
+import random
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.stubs import percentile
+
+
+class Client:
+    """Session HTTP d'un utilisateur virtuel, qui chronomètre chaque appel"""
+
+    def __init__(self, base_url, index, samples, session=None):
+        self.base_url = base_url
+        self.index = index
+        self.http = session or requests.Session()
+        self.samples = samples
+
+    def call(self, route, method, url, ok=(200, 302), stream=False, http=None, **kwargs):
+        """Appel chronométré (réponse lue jusqu'au bout) ; renvoie la réponse ou None si erreur réseau.
+        http : autre session à utiliser (ex. un compte admin)"""
+        if not url.startswith('http'):
+            url = self.base_url + url
+        started = time.perf_counter()
+        try:
+            response = (http or self.http).request(method, url, allow_redirects=False, stream=stream, timeout=60,
+                                                   **kwargs)
+            if stream:
+                for _ in response.iter_content(64 * 1024):
+                    pass
+            else:
+                response.content  # corps lu en entier
+        except requests.RequestException:
+            self.samples[route].append((time.perf_counter() - started, False))
+            return None
+        self.samples[route].append((time.perf_counter() - started, response.status_code in ok))
+        return response
+
+
+def run_load(make_client, scenarios, clients, duration, seed=0):
+    """Chaque client tire un scénario au hasard (pondéré) en boucle pendant `duration` secondes.
+
+    make_client(index, samples) -> Client ; scenarios = {nom: (poids, fonction)}.
+    Renvoie {route: [(durée, succès)]}.
+    """
+    names = list(scenarios)
+    weights = [scenarios[name][0] for name in names]
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        samples = defaultdict(list)
+        client = make_client(index, samples)
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            scenarios[rng.choices(names, weights)[0]][1](client, rng)
+        return samples
+
+    merged = defaultdict(list)
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for samples in pool.map(worker, range(clients)):
+            for route, values in samples.items():
+                merged[route].extend(values)
+    return merged
+
+
+def summarize(samples, duration, meta):
+    routes = {}
+    for route, values in sorted(samples.items()):
+        latencies = [latency for latency, _ in values]
+        routes[route] = {
+            'count': len(values),
+            'errors': sum(1 for _, ok in values if not ok),
+            'rps': round(len(values) / duration, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+        }
+    total = sum(route['count'] for route in routes.values())
+    return {
+        'meta': {**meta, 'date': datetime.now().isoformat(timespec='seconds'), **git_revision()},
+        'routes': routes,
+        'total': {'count': total, 'errors': sum(route['errors'] for route in routes.values()),
+                  'rps': round(total / duration, 2)},
+    }
+
+
+def git_revision():
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def print_results(results):
+    print(f"{'route':<40} {'req':>7} {'err':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, stats in results['routes'].items():
+        print(f"{route[:40]:<40} {stats['count']:7d} {stats['errors']:5d} {stats['rps']:8.1f} "
+              f"{stats['p50_ms']:7.1f}ms {stats['p95_ms']:7.1f}ms {stats['p99_ms']:7.1f}ms")
+    total = results['total']
+    print(f"{'total':<40} {total['count']:7d} {total['errors']:5d} {total['rps']:8.1f}")
+
+
+def compare(baseline, results, threshold=0.2):
+    """Affiche l'écart avec une exécution de référence ; renvoie le nombre de routes en régression
+    (p95 plus lent ou débit plus bas de plus de `threshold`)"""
+    print(f"\nComparaison avec {baseline['meta'].get('commit')} ({baseline['meta'].get('date')}) :")
+    regressions = 0
+    for route, stats in results['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            print(f"  {route[:40]:<40} (nouvelle route)")
+            continue
+        p95_change = stats['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rps_change = stats['rps'] / before['rps'] - 1 if before['rps'] else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold
+        regressions += regressed
+        print(f"  {route[:40]:<40} p95 {before['p95_ms']:7.1f} -> {stats['p95_ms']:7.1f} ms ({p95_change:+6.1%})  "
+              f"req/s {before['rps']:7.1f} -> {stats['rps']:7.1f} ({rps_change:+6.1%}){'  ⚠️' if regressed else ''}")
+    return regressions
@@ -0,0 +1,55 @@
+"""Test de charge concurrente : N threads appellent /machines/<id>/occupy sur LE MÊME PC.
+
+À chaque vague, exactement UN appel doit réussir (200), tous les autres doivent recevoir 400.
+Par défaut sur une base SQLite temporaire ; pour MySQL, définir DATABASE_URL avant de lancer.
+Lancer depuis le dossier v2-microservices :
+    python -m benchmarks.stress_occupy --threads 32 --rounds 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+INVENTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'service-inventory')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'inventory.db')}"
+    sys.path.insert(0, INVENTORY_DIR)
+    import app as inventory
+    from common.auth import issue_token, auth_headers, service_auth_headers
+
+    with inventory.app.app_context():
+        inventory.init_db()
+    headers = auth_headers(issue_token(1, 'stress', is_admin=True))
+    client = inventory.app.test_client()
+    machine_id = client.post('/machines', headers=headers).get_json()['id']
+    headers = service_auth_headers('billing')  # occupy / release : réservés au Billing
+    barrier = threading.Barrier(args.threads)
+
+    def hammer(path):
+        barrier.wait()  # tout le monde appelle au même moment
+        return inventory.app.test_client().post(path, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for round_number in range(1, args.rounds + 1):
+            codes = Counter(pool.map(hammer, [f"/machines/{machine_id}/occupy"] * args.threads))
+            if codes != Counter({200: 1, 400: args.threads - 1}):
+                print(f"❌ Vague {round_number} : réponses {dict(codes)} (attendu 1 x 200)")
+                sys.exit(1)
+            client.post(f"/machines/{machine_id}/release", headers=headers)
+
+    print(f"✅ {args.rounds} vagues x {args.threads} threads : un seul occupy accepté à chaque fois")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Faux services HTTP locaux pour les benchmarks (aucune BDD, réponses JSON fixes).
+
+    server = start_stub_server({'/machines': [...]}, delay=0.005)
+    ...
+    server.shutdown()
+"""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def start_stub_server(routes, delay=0.0, port=0):
+    """Démarre un serveur dans un thread. routes = {chemin: payload JSON ou callable(handler) -> (statut, corps)}."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True
+
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.body = self.rfile.read(length) if length else b''  # lisible par une route callable
+            if delay:
+                time.sleep(delay)
+
+            payload = routes.get(self.path.split('?')[0])
+            if payload is None:
+                status, body = 404, {'error': 'not found'}
+            elif callable(payload):
+                status, body = payload(self)
+            else:
+                status, body = 200, payload
+
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_DELETE = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15.0):
+    """Attend qu'un serveur (lancé dans un autre processus) accepte les connexions."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Le serveur sur le port {port} n'a pas démarré")
+
+
+def admin_cookies():
+    """Cookie de connexion admin du Gateway (jeton signé avec la même clé que le Gateway)."""
+    from common.auth import issue_token
+    return {'cybermanager_token': issue_token(1, 'bench', is_admin=True)}
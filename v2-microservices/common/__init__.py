@@ -0,0 +1,4 @@
+"""Code partagé entre les microservices (Gateway, Billing, Inventory).
+
+Dans les images Docker, ce dossier est copié à côté de app.py (voir les Dockerfile).
+"""
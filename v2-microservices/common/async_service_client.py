@@ -0,0 +1,83 @@
+"""Version asyncio de ServiceClient (httpx), pour le mode asynchrone du Gateway.
+
+Mêmes réglages (variables d'environnement) et même disjoncteur que common.service_client,
+avec un httpx.AsyncClient par service qui réutilise ses connexions keep-alive.
+Le client doit être créé et fermé dans la boucle asyncio du serveur (voir async_app.py).
+"""
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from common.metrics import observe_downstream
+from common.tracing import inject_headers, start_span
+from common.service_client import (
+    IDEMPOTENT_METHODS, RETRYABLE_STATUS, CircuitBreaker, CircuitOpenError, _env_float,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncServiceClient:
+
+    def __init__(self, base_url, name=None, pool_size=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or base_url
+        self.retries = int(_env_float('SERVICE_RETRIES', 2))
+        self.backoff = _env_float('SERVICE_BACKOFF', 0.1)
+        self.breaker = CircuitBreaker(
+            int(_env_float('BREAKER_FAILURE_THRESHOLD', 5)),
+            _env_float('BREAKER_RESET_TIMEOUT', 30.0),
+        )
+
+        pool_size = int(_env_float('SERVICE_POOL_SIZE', 20)) if pool_size is None else pool_size
+        read_timeout = _env_float('SERVICE_READ_TIMEOUT', 5.0)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(read_timeout, connect=_env_float('SERVICE_CONNECT_TIMEOUT', 2.0)),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def request(self, method, path, **kwargs):
+        method = method.upper()
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Service {self.name} indisponible (circuit ouvert)")
+
+            call_span = start_span(f"{method} {self.name}{path}", 'client', activate=False,
+                                   peer_service=self.name, attempt=attempt + 1)
+            kwargs['headers'] = inject_headers(kwargs.get('headers'), call_span)
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.HTTPError as e:
+                observe_downstream(self.name, method, 'error', time.perf_counter() - started)
+                call_span.set('error', str(e)[:200])
+                call_span.finish('error')
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                observe_downstream(self.name, method, response.status_code, time.perf_counter() - started)
+                call_span.set('status_code', response.status_code)
+                call_span.finish('error' if response.status_code >= 500 else 'ok')
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if response.status_code not in RETRYABLE_STATUS or attempt + 1 >= attempts:
+                    return response
+
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            logger.warning("%s %s vers %s échoué, nouvel essai dans %.2fs", method, path, self.name, delay)
+            await asyncio.sleep(delay)
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
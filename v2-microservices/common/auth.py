@@ -0,0 +1,150 @@
+"""Jetons signés (format JWT HS256) : le service Auth les émet au login, les autres services les
+vérifient localement avec la clé partagée AUTH_SECRET_KEY — ni BDD ni appel réseau par requête.
+
+    token = issue_token(3, 'alice', is_admin=False)
+    claims = verify_token(token)   # {'sub': 3, 'name': 'alice', 'adm': False, 'iat': ..., 'exp': ...}
+
+Côté Flask, le jeton arrive dans le header "Authorization: Bearer <jeton>" :
+
+    @app.route('/reset', methods=['POST'])
+    @require_admin
+    def reset(): ...   # g.claims contient les claims du jeton
+
+Un jeton ne se révoque pas : sa durée de vie (AUTH_TOKEN_TTL) est donc courte.
+
+Les services s'appellent entre eux avec un jeton de service (service_auth_headers, claim sub = "service:<nom>").
+Les routes qui ne doivent pas être ouvertes aux clients (battements des agents des PC...) exigent ce jeton :
+
+    @require_service('agent')
+    def machine_heartbeat(): ...
+"""
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from flask import g, jsonify, request
+
+# En production la clé vient d'un Secret Kubernetes (la même pour tous les services)
+AUTH_SECRET_KEY = os.environ.get('AUTH_SECRET_KEY', 'dev-auth-key')
+AUTH_TOKEN_TTL = float(os.environ.get('AUTH_TOKEN_TTL', 8 * 3600))  # une journée d'ouverture
+SERVICE_TOKEN_TTL = float(os.environ.get('SERVICE_TOKEN_TTL', 3600))
+
+
+class InvalidToken(ValueError):
+    """Jeton mal formé, mal signé ou expiré."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+_HEADER = _b64encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}, separators=(',', ':')).encode())
+
+# HMAC initialisé une seule fois avec la clé : chaque signature ne coûte plus qu'un copy() + update()
+_mac = hmac.new(AUTH_SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
+
+def _sign(signing_input):
+    mac = _mac.copy()
+    mac.update(signing_input)
+    return mac.digest()
+
+
+def issue_token(user_id, username, is_admin=False, ttl=None):
+    now = int(time.time())
+    claims = {'sub': user_id, 'name': username, 'adm': bool(is_admin),
+              'iat': now, 'exp': now + int(ttl or AUTH_TOKEN_TTL)}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    signing_input = _HEADER + b'.' + payload
+    return (signing_input + b'.' + _b64encode(_sign(signing_input))).decode('ascii')
+
+
+def verify_token(token):
+    """Claims du jeton, ou InvalidToken. Aucun accès BDD ni réseau."""
+    try:
+        signing_input, signature = token.encode('ascii').rsplit(b'.', 1)
+        header, payload = signing_input.split(b'.')
+        signature = _b64decode(signature)
+    except (ValueError, UnicodeError):
+        raise InvalidToken("jeton mal formé") from None
+
+    # En-tête comparé tel quel : seul HS256 est accepté (pas de "alg": "none")
+    if header != _HEADER or not hmac.compare_digest(_sign(signing_input), signature):
+        raise InvalidToken("signature invalide")
+
+    # Signé avec notre clé : le contenu est forcément du JSON émis par issue_token
+    claims = json.loads(_b64decode(payload))
+    if claims.get('exp', 0) <= time.time():
+        raise InvalidToken("jeton expiré")
+    return claims
+
+
+def auth_headers(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+_service_tokens = {}
+
+
+def service_auth_headers(name):
+    """Headers d'un service pour appeler les autres services (jeton renouvelé avant expiration)."""
+    token, expires_at = _service_tokens.get(name, (None, 0))
+    if expires_at - time.time() < 60:
+        expires_at = time.time() + SERVICE_TOKEN_TTL
+        token = issue_token(f"service:{name}", name, ttl=SERVICE_TOKEN_TTL)
+        _service_tokens[name] = (token, expires_at)
+    return auth_headers(token)
+
+
+# --- DÉCORATEURS FLASK ---
+
+def require_auth(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return jsonify({'error': 'Authentification requise'}), 401
+        try:
+            g.claims = verify_token(header[7:])
+        except InvalidToken as e:
+            return jsonify({'error': f'Jeton refusé : {e}'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def service_name(claims):
+    """Nom du service d'un jeton de service, None pour un jeton client"""
+    sub = claims.get('sub')
+    return sub[len('service:'):] if isinstance(sub, str) and sub.startswith('service:') else None
+
+
+def require_service(*names):
+    """Route réservée aux jetons de service (tous les services, ou seulement `names`) : 403 pour un client, même admin"""
+    def decorator(view):
+        @functools.wraps(view)
+        @require_auth
+        def wrapper(*args, **kwargs):
+            name = service_name(g.claims)
+            if name is None or (names and name not in names):
+                return jsonify({'error': 'Réservé aux services internes'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def require_admin(view):
+    @functools.wraps(view)
+    @require_auth
+    def wrapper(*args, **kwargs):
+        if not g.claims.get('adm'):
+            return jsonify({'error': 'Réservé aux administrateurs'}), 403
+        return view(*args, **kwargs)
+    return wrapper
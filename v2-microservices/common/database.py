@@ -0,0 +1,326 @@
+"""Options du moteur SQLAlchemy lues dans l'environnement : pool de connexions (MySQL) et pragmas (SQLite).
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    db = SQLAlchemy(app)
+
+Pool (un par worker gunicorn) :
+- DB_POOL_SIZE (5 ; v2 : gunicorn_conf.py le fixe à threads + 2) : connexions gardées ouvertes ;
+- DB_MAX_OVERFLOW (5) : connexions temporaires en plus (fermées au retour : trop de débordement = "tempête"
+  de connexions). Au pire, le serveur MySQL voit workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connexions ;
+- DB_POOL_TIMEOUT (10 s) : attente maximale d'une connexion libre, puis erreur (plutôt qu'un thread bloqué) ;
+- DB_POOL_RECYCLE (1800 s) : une connexion plus ancienne est rouverte, avant le wait_timeout de MySQL ;
+- DB_POOL_PRE_PING (1 sauf SQLite) : connexion vérifiée avant d'être prêtée, plus de
+  "MySQL server has gone away" après un redémarrage de MySQL ou une coupure réseau ;
+- DB_ISOLATION_LEVEL (défaut du serveur), ex. "READ COMMITTED" ; DB_CONNECT_TIMEOUT (10 s, MySQL).
+
+Réplica en lecture (optionnel) : DATABASE_READ_URL. Les routes marquées @read_replica (historique, rapports,
+liste des PC) lisent le réplica, tout le reste (écritures, SELECT ... FOR UPDATE, autres routes) va au primaire :
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_READ_URL'))
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    init_read_replica(app, RecentWrites(key=...))
+Lecture de ses propres écritures : un client qui vient d'écrire lit le primaire pendant READ_YOUR_WRITES_SECONDS (5),
+le temps que le réplica rattrape son retard.
+
+Schéma : init-db appelle upgrade_schema(db), qui crée les tables et ajoute les colonnes apparues depuis.
+
+SQLite : SQLITE_WAL (1) passe la base en journal WAL (les lectures ne bloquent plus pendant une écriture)
+et SQLITE_BUSY_TIMEOUT (5000 ms) fait attendre un écrivain au lieu de "database is locked".
+
+Métriques (/metrics) : db_pool_connections{state="in_use"|"idle"}, db_pool_checkout_waiting (threads en
+attente d'une connexion), db_pool_checkout_wait_seconds, db_pool_checkout_timeouts_total,
+db_statements_routed_total{target="primary"|"replica"} (avec un réplica).
+"""
+import functools
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, literal, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
+
+from common.cache import TTLCache
+from common.metrics import Counter, Histogram, register_gauge
+
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+
+# Pools vivants du processus (engine.dispose() en crée un nouveau, l'ancien disparaît tout seul)
+_pools = weakref.WeakSet()
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS pour cette URL, d'après les variables DB_* / SQLITE_*"""
+    url = make_url(uri)
+    sqlite = url.get_backend_name() == 'sqlite'
+    if sqlite:
+        enable_sqlite_pragmas()
+        if url.database in (None, '', ':memory:'):
+            return {}  # base en mémoire : Flask-SQLAlchemy impose un pool à connexion unique
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '0' if sqlite else '1') == '1',
+    }
+    if os.environ.get('DB_ISOLATION_LEVEL'):
+        options['isolation_level'] = os.environ['DB_ISOLATION_LEVEL'].upper()
+    if url.get_backend_name() == 'mysql':
+        options['connect_args'] = {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10))}
+    return options
+
+
+# --- POOL ---
+
+class TimedQueuePool(QueuePool):
+    """QueuePool qui mesure le temps pour obtenir une connexion (attente d'une connexion libre ou ouverture)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        _pools.add(self)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+            CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def _connection_states():
+    in_use = idle = 0
+    for pool in list(_pools):
+        in_use += pool.checkedout()
+        idle += pool.checkedin()
+    return [(('in_use',), in_use), (('idle',), idle)]
+
+
+def _waiting_threads():
+    return [((), sum(pool._waiting for pool in list(_pools)))]
+
+
+CONNECTIONS = register_gauge(
+    'db_pool_connections', 'Connexions du pool SQLAlchemy (in_use = prêtées à un thread).', _connection_states,
+    labels=('state',))
+CHECKOUT_WAITING = register_gauge(
+    'db_pool_checkout_waiting', "Threads en train d'attendre une connexion du pool.", _waiting_threads)
+CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', "Temps pour obtenir une connexion du pool (attente ou ouverture).")
+CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total', "Connexions refusées après DB_POOL_TIMEOUT secondes d'attente.")
+
+
+# --- SQLITE ---
+
+_sqlite_enabled = False
+_sqlite_lock = threading.Lock()
+
+
+def enable_sqlite_pragmas():
+    """Pragmas appliqués à chaque nouvelle connexion SQLite du processus (une seule fois)"""
+    global _sqlite_enabled
+    with _sqlite_lock:
+        if _sqlite_enabled:
+            return
+        event.listen(Engine, 'connect', _on_connect)
+        _sqlite_enabled = True
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+    if SQLITE_WAL:
+        # WAL est mémorisé dans le fichier ; synchronous=NORMAL suffit en WAL (pas de corruption possible)
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+    cursor.close()
+
+
+# --- SCHÉMA ---
+
+def upgrade_schema(db):
+    """Crée les tables manquantes et met à niveau les tables existantes (appelé par init-db). Renvoie les changements.
+
+    db.create_all() ne touche pas à une table qui existe déjà : une colonne ajoutée au modèle après coup
+    (ex. OutboxCommand.traceparent) manquerait sur une base en service. On ajoute donc les colonnes manquantes
+    (ALTER TABLE ... ADD COLUMN), les index manquants et, sur MySQL, on élargit les VARCHAR devenus trop courts.
+    Renommer ou supprimer une colonne reste une migration à écrire à la main.
+    """
+    db.create_all()
+    engine = db.engine
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    changes = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name']: column for column in inspector.get_columns(table.name)}
+            added = set()
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text(
+                        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {_column_ddl(engine.dialect, column)}"))
+                    added.add(column.name)
+                    changes.append(f"{table.name}.{column.name} ajoutée")
+                elif _too_short(engine.dialect, existing[column.name]['type'], column.type):
+                    connection.execute(text(
+                        f"ALTER TABLE {preparer.format_table(table)} MODIFY COLUMN {_column_ddl(engine.dialect, column)}"))
+                    changes.append(f"{table.name}.{column.name} élargie à {column.type.length}")
+            # Index ajoutés au modèle depuis (sur des colonnes nouvelles OU déjà là, ex. ix_session_end_start)
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection, checkfirst=True)
+                    changes.append(f"index {index.name} créé")
+            for column in table.columns:
+                if column.name in added and column.unique:
+                    # ADD COLUMN ... UNIQUE est refusé par SQLite : index unique à part
+                    connection.execute(text(
+                        f"CREATE UNIQUE INDEX {preparer.quote(f'uq_{table.name}_{column.name}')} "
+                        f"ON {preparer.format_table(table)} ({preparer.format_column(column)})"))
+    return changes
+
+
+def _column_ddl(dialect, column):
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    if not column.nullable and column.server_default is None:
+        # Les lignes existantes ont besoin d'une valeur : le défaut Python du modèle, s'il est fixe
+        if column.default is None or not column.default.is_scalar:
+            raise RuntimeError(f"{column.table.name}.{column.name} : colonne obligatoire sans défaut fixe, "
+                               "migration à écrire à la main")
+        ddl += ' DEFAULT ' + str(literal(column.default.arg).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}))
+    return ddl
+
+
+def _too_short(dialect, current, wanted):
+    # SQLite ignore la longueur des VARCHAR
+    length = getattr(wanted, 'length', None)
+    return (dialect.name == 'mysql' and length is not None
+            and getattr(current, 'length', None) is not None and current.length < length)
+
+
+# --- RÉPLICA EN LECTURE ---
+
+REPLICA_BIND = 'replica'
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+# Posé par le Gateway pendant READ_YOUR_WRITES_SECONDS après une action de l'utilisateur (il a le cookie du navigateur)
+READ_YOUR_WRITES_HEADER = 'X-Read-Your-Writes'
+READ_YOUR_WRITES_COOKIE = '_wrote_until'
+
+STATEMENTS_ROUTED = Counter(
+    'db_statements_routed_total', "Instructions SQL par destination, quand un réplica est configuré.", ('target',))
+
+
+def replica_binds(read_uri):
+    """SQLALCHEMY_BINDS : moteur 'replica' pour DATABASE_READ_URL ({} sans réplica : tout va au primaire)"""
+    if not read_uri:
+        return {}
+    read_uri = read_uri.replace("mysql://", "mysql+pymysql://")
+    return {REPLICA_BIND: {'url': read_uri, **engine_options(read_uri)}}
+
+
+class RoutingSession(Session):
+    """Session Flask-SQLAlchemy qui envoie au réplica les lectures des routes @read_replica.
+
+    Restent sur le primaire : les écritures (flush, INSERT/UPDATE/DELETE), les SELECT ... FOR UPDATE et, dans la
+    même requête, toutes les lectures qui suivent une écriture (elles doivent voir ce qui vient d'être écrit).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if self._reads_replica(clause):
+                    STATEMENTS_ROUTED.labels('replica').inc()
+                    return replica
+                STATEMENTS_ROUTED.labels('primary').inc()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_replica(self, clause):
+        if clause is not None and (clause.is_dml or getattr(clause, '_for_update_arg', None) is not None):
+            self.info['wrote'] = True
+            return False
+        return (not self._flushing and not self.info.get('wrote')
+                and has_app_context() and g.get('read_replica', False))
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    # Le client lira le primaire pendant READ_YOUR_WRITES_SECONDS (une fois par requête suffit)
+    if db_session.info.get('wrote') and not db_session.info.get('write_marked') and has_request_context():
+        recent_writes = current_app.extensions.get('recent_writes')
+        if recent_writes is not None:
+            recent_writes.mark()
+            db_session.info['write_marked'] = True
+
+
+class RecentWrites:
+    """Clients qui viennent d'écrire : leurs lectures restent sur le primaire pendant `window` secondes.
+
+    Sans `key` : l'échéance est dans le cookie de session Flask (navigateur, valable sur tous les workers).
+    Avec `key` (ex. claim 'sub' du jeton, pour un service derrière le Gateway) : en mémoire, par worker ;
+    le header X-Read-Your-Writes du Gateway couvre les requêtes qui arrivent sur un autre worker.
+    """
+
+    def __init__(self, window=READ_YOUR_WRITES_SECONDS, key=None, maxsize=100000):
+        self.window = window
+        self.key = key
+        self._recent = TTLCache(maxsize=maxsize, ttl=window) if key is not None else None
+
+    def mark(self):
+        if self.key is None:
+            session[READ_YOUR_WRITES_COOKIE] = time.time() + self.window
+            return
+        client = self.key()
+        if client is not None:
+            self._recent.set(client, True)
+
+    def recent(self):
+        if request.headers.get(READ_YOUR_WRITES_HEADER):
+            return True
+        if self.key is None:
+            return session.get(READ_YOUR_WRITES_COOKIE, 0) > time.time()
+        client = self.key()
+        return client is not None and self._recent.get(client) is not None
+
+
+def init_read_replica(app, recent_writes):
+    app.extensions['recent_writes'] = recent_writes
+
+
+def read_replica(view):
+    """Route en lecture seule : ses requêtes SQL vont au réplica, sauf si le client vient d'écrire.
+    À placer sous les décorateurs d'authentification (le client doit être connu)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        recent_writes = current_app.extensions.get('recent_writes')
+        g.read_replica = recent_writes is None or not recent_writes.recent()
+        return view(*args, **kwargs)
+    return wrapper
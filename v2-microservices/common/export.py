@@ -0,0 +1,72 @@
+"""Export en flux (CSV ou NDJSON, gzip en option) de lignes lues par paquets depuis la BDD.
+
+Les lignes ne sont jamais toutes en mémoire : on lit avec yield_per (curseur côté serveur),
+on formate par blocs et on envoie chaque bloc dès qu'il est prêt.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_date_range(raw_from, raw_to):
+    """?from=AAAA-MM-JJ&to=AAAA-MM-JJ -> (début à 00:00, fin à 23:59:59.999999), bornes incluses. ValueError si invalide."""
+    start = datetime.strptime(raw_from, '%Y-%m-%d') if raw_from else None
+    end = datetime.strptime(raw_to, '%Y-%m-%d') if raw_to else None
+    if end is not None:
+        end = datetime.combine(end.date(), datetime.max.time())
+    return start, end
+
+
+def stream_rows(rows, columns, fmt='csv', compress=False, chunk_rows=1000):
+    """Générateur de blocs (bytes) : `rows` est un itérable de tuples dans l'ordre de `columns`"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 : format gzip
+
+    def emit(text):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        values = [_serialize(value) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values))))
+            buffer.write('\n')
+
+        count += 1
+        if count % chunk_rows == 0:
+            chunk = emit(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            if chunk:
+                yield chunk
+
+    tail = emit(buffer.getvalue())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+def export_filename(prefix, start, end, fmt, compress):
+    period = '_'.join(d.strftime('%Y-%m-%d') for d in (start, end) if d) or 'complet'
+    return f"{prefix}_{period}.{fmt}" + ('.gz' if compress else '')
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
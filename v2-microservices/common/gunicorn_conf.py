@@ -0,0 +1,93 @@
+"""Configuration gunicorn commune aux services v2, réglée par service (SERVICE_PROFILE).
+
+Point d'entrée unique des images Docker (le profil est fixé par ENV dans chaque Dockerfile) :
+    SERVICE_PROFILE=billing gunicorn -c common/gunicorn_conf.py
+
+- nombre de workers calculé sur la limite CPU du conteneur (pas sur les cœurs de la machine hôte) ;
+- preload : le code est importé une fois dans le master puis partagé par fork (démarrage et mémoire) ;
+- keep-alive entre le Gateway et les services (les clients HTTP gardent leurs connexions ouvertes) ;
+- max_requests : chaque worker est recyclé régulièrement (fuites mémoire), avec un jitter pour éviter
+  qu'ils redémarrent tous en même temps.
+
+Variables d'environnement : SERVICE_PROFILE, PORT, WEB_CONCURRENCY (force le nombre de workers),
+GUNICORN_THREADS, CPU_LIMIT (millicores, fourni par Kubernetes), GUNICORN_MAX_REQUESTS, GUNICORN_KEEPALIVE,
+PROMETHEUS_MULTIPROC_DIR.
+"""
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+# Par service : application, type de worker, workers par CPU, threads par worker
+PROFILES = {
+    # Pages + flux SSE longs : workers asyncio (une coroutine par dashboard, pas un thread)
+    'gateway': {'wsgi_app': 'async_app:asgi_app', 'worker_class': 'uvicorn.workers.UvicornWorker',
+                'workers_per_cpu': 1, 'threads': 1},
+    # Requêtes courtes, surtout de la BDD : quelques threads par worker couvrent les attentes réseau
+    'inventory': {'wsgi_app': 'app:app', 'worker_class': 'gthread', 'workers_per_cpu': 2, 'threads': 4},
+    # Exports en flux (longs) et dispatcher outbox dans chaque worker : plus de threads
+    'billing': {'wsgi_app': 'app:app', 'worker_class': 'gthread', 'workers_per_cpu': 2, 'threads': 8},
+    # Hachage des mots de passe = CPU : peu de threads, un worker par CPU en plus
+    'auth': {'wsgi_app': 'app:app', 'worker_class': 'gthread', 'workers_per_cpu': 2, 'threads': 2},
+}
+
+
+def cpu_limit():
+    """CPU disponibles pour le conteneur : CPU_LIMIT (millicores), sinon quota cgroup, sinon cœurs de la machine"""
+    if os.environ.get('CPU_LIMIT'):
+        return max(1, math.ceil(int(os.environ['CPU_LIMIT']) / 1000))
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:  # cgroup v2 : "200000 100000" ou "max 100000"
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return os.cpu_count() or 1
+
+
+profile_name = os.environ.get('SERVICE_PROFILE', 'inventory')
+if profile_name not in PROFILES:
+    sys.exit(f"SERVICE_PROFILE inconnu : {profile_name} (attendu : {', '.join(PROFILES)})")
+profile = PROFILES[profile_name]
+
+wsgi_app = profile['wsgi_app']
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = profile['worker_class']
+workers = int(os.environ.get('WEB_CONCURRENCY', 0)) or profile['workers_per_cpu'] * cpu_limit() + 1
+threads = int(os.environ.get('GUNICORN_THREADS', profile['threads']))
+# Pool SQLAlchemy à la taille du worker (lu par common/database.py à l'import de l'app, donc après ce fichier) :
+# une connexion par thread + 2 pour les threads de fond (dispatcher outbox, flux SSE)
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 2))
+# Métriques (common/metrics.py) : chaque worker écrit ses compteurs dans ce dossier, /metrics additionne tous les
+# workers. Vidé au démarrage du master : les fichiers d'une exécution précédente fausseraient les totaux
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f'prometheus-{profile_name}'))
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+preload_app = True
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 20
+
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Avec preload, si le master a ouvert une connexion BDD pendant l'import, chaque worker
+    # repart avec un pool vide au lieu de partager les mêmes sockets que ses frères
+    service = sys.modules.get('app')
+    if service is not None and hasattr(service, 'db'):
+        with service.app.app_context():
+            service.db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    # Worker arrêté (recyclage max_requests, crash) : ses compteurs restent dans le total, ses jauges en sortent
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
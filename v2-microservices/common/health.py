@@ -0,0 +1,31 @@
+"""Routes de santé pour les sondes Kubernetes.
+
+    register_health_routes(app, ready_check=lambda: db.session.execute(text('SELECT 1')))
+
+- /healthz (liveness) : le processus répond. Aucune dépendance vérifiée, sinon une panne de la BDD
+  ferait redémarrer en boucle tous les pods qui n'y sont pour rien.
+- /readyz (readiness) : ready_check() passe (ex. la BDD répond) ; sinon 503 et Kubernetes
+  retire le pod du Service le temps que ça revienne.
+"""
+import logging
+
+from flask import jsonify
+
+logger = logging.getLogger(__name__)
+
+
+def register_health_routes(app, ready_check=None):
+
+    @app.route('/healthz')
+    def healthz():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/readyz')
+    def readyz():
+        if ready_check is not None:
+            try:
+                ready_check()
+            except Exception as e:
+                logger.warning("Service pas prêt : %s", e)
+                return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+        return jsonify({'status': 'ready'})
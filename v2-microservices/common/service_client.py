@@ -0,0 +1,177 @@
+"""Client HTTP partagé pour les appels inter-services.
+
+Un ServiceClient par service distant (Inventory, Billing) :
+- une requests.Session avec pool de connexions keep-alive (pas de nouvelle connexion TCP par appel)
+- timeouts de connexion et de lecture (un pod lent ne bloque plus un worker indéfiniment)
+- retries bornés avec jitter, uniquement pour les méthodes idempotentes
+- disjoncteur (circuit breaker) : après N échecs, on échoue tout de suite pendant un moment
+- en-tête traceparent sur chaque appel (voir common/tracing.py)
+
+Configuration par variables d'environnement (valeurs par défaut entre parenthèses) :
+SERVICE_CONNECT_TIMEOUT (2), SERVICE_READ_TIMEOUT (5), SERVICE_RETRIES (2),
+SERVICE_BACKOFF (0.1), SERVICE_POOL_SIZE (20),
+BREAKER_FAILURE_THRESHOLD (5), BREAKER_RESET_TIMEOUT (30).
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.metrics import observe_downstream
+from common.tracing import inject_headers, start_span
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRYABLE_STATUS = frozenset([502, 503, 504])
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Levée sans appel réseau quand le disjoncteur du service est ouvert."""
+
+
+class CircuitBreaker:
+    """Disjoncteur simple : fermé -> ouvert après N échecs d'affilée -> semi-ouvert après le délai."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                # Une seule requête d'essai passe, les autres échouent vite
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """Client HTTP vers un service (ex: ServiceClient('http://inventory-service:5000', 'Inventory'))."""
+
+    def __init__(self, base_url, name=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff=None, pool_size=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or base_url
+        self.timeout = (
+            _env_float('SERVICE_CONNECT_TIMEOUT', 2.0) if connect_timeout is None else connect_timeout,
+            _env_float('SERVICE_READ_TIMEOUT', 5.0) if read_timeout is None else read_timeout,
+        )
+        self.retries = int(_env_float('SERVICE_RETRIES', 2)) if retries is None else retries
+        self.backoff = _env_float('SERVICE_BACKOFF', 0.1) if backoff is None else backoff
+        self.breaker = CircuitBreaker(
+            int(_env_float('BREAKER_FAILURE_THRESHOLD', 5)) if failure_threshold is None else failure_threshold,
+            _env_float('BREAKER_RESET_TIMEOUT', 30.0) if reset_timeout is None else reset_timeout,
+        )
+
+        pool_size = int(_env_float('SERVICE_POOL_SIZE', 20)) if pool_size is None else pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, **kwargs):
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        url = f"{self.base_url}{path}"
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Service {self.name} indisponible (circuit ouvert)")
+
+            # Un span 'client' par essai ; le service appelé continue la trace grâce à traceparent
+            call_span = start_span(f"{method} {self.name}{path}", 'client', activate=False,
+                                   peer_service=self.name, attempt=attempt + 1)
+            kwargs['headers'] = inject_headers(kwargs.get('headers'), call_span)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                observe_downstream(self.name, method, 'error', time.perf_counter() - started)
+                call_span.set('error', str(e)[:200])
+                call_span.finish('error')
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                observe_downstream(self.name, method, response.status_code, time.perf_counter() - started)
+                call_span.set('status_code', response.status_code)
+                call_span.finish('error' if response.status_code >= 500 else 'ok')
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if response.status_code not in RETRYABLE_STATUS or attempt + 1 >= attempts:
+                    return response
+
+            # "Full jitter" : attente aléatoire entre 0 et backoff * 2^tentative
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            logger.warning("%s %s vers %s échoué, nouvel essai dans %.2fs", method, path, self.name, delay)
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, name=None):
+    """Renvoie le client partagé pour cette URL (un seul pool par service et par processus)."""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = ServiceClient(base_url, name)
+        return client
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
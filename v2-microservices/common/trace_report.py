@@ -0,0 +1,160 @@
+"""Outils pour les traces écrites par common/tracing.py.
+
+Collecteur local (remplace un vrai collecteur : reçoit les lots POSTés par TRACE_COLLECTOR_URL) :
+    python -m common.trace_report collect --port 4318 --out traces.jsonl
+
+Chemin critique des traces les plus lentes (quel service / quelle étape fait attendre l'utilisateur) :
+    python -m common.trace_report critical-path traces.jsonl --top 5
+    python -m common.trace_report critical-path traces.jsonl --name "POST /session/start/<int:machine_id>"
+
+Le chemin critique part de la fin de la trace et remonte le temps : à chaque niveau, l'enfant qui se
+termine le plus tard est celui qu'on attendait ; le temps non couvert par un enfant est du temps propre
+du span (code Python, sérialisation...). Les étapes asynchrones (livraison outbox) comptent aussi :
+la trace se termine quand le PC est réellement occupé dans l'Inventory.
+"""
+import argparse
+import json
+import sys
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def load_traces(paths):
+    """{trace id: [spans]} à partir de fichiers JSONL (lignes illisibles ignorées : fichier en cours d'écriture)"""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                traces[item['trace_id']].append(item)
+    return traces
+
+
+def trace_bounds(spans):
+    start = min(s['start'] for s in spans)
+    return start, max(s['start'] + s['duration'] for s in spans)
+
+
+def find_root(spans):
+    ids = {s['span_id'] for s in spans}
+    # Vraie racine (sans parent), sinon le plus ancien span dont le parent manque (trace incomplète)
+    roots = [s for s in spans if s['parent_id'] is None] or [s for s in spans if s['parent_id'] not in ids]
+    return min(roots, key=lambda s: s['start'])
+
+
+def critical_path(root, children):
+    """[(profondeur, span, temps propre sur le chemin en secondes)] depuis la racine"""
+    # Fin effective d'un span = la plus tardive de ses descendants (un enfant asynchrone finit après son parent)
+    ends = {}
+
+    def effective_end(node):
+        end = node['start'] + node['duration']
+        for child in children.get(node['span_id'], ()):
+            end = max(end, effective_end(child))
+        ends[node['span_id']] = end
+        return end
+
+    effective_end(root)
+    path = []
+
+    def walk(node, depth):
+        entry = [depth, node, 0.0]
+        path.append(entry)
+        end = cursor = ends[node['span_id']]
+        chosen = []
+        for child in sorted(children.get(node['span_id'], ()), key=lambda c: ends[c['span_id']], reverse=True):
+            if ends[child['span_id']] <= cursor:
+                chosen.append(child)
+                cursor = child['start']
+        covered = sum(ends[child['span_id']] - child['start'] for child in chosen)
+        entry[2] = max(0.0, end - node['start'] - covered)
+        for child in reversed(chosen):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return path
+
+
+def report(traces, top, name=None):
+    candidates = []
+    for trace_id, spans in traces.items():
+        root = find_root(spans)
+        if name and root['name'] != name:
+            continue
+        start, end = trace_bounds(spans)
+        candidates.append((end - start, trace_id, root, spans))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    if not candidates:
+        print("Aucune trace trouvée.")
+        return
+
+    blame = defaultdict(float)
+    for duration, trace_id, root, spans in candidates[:top]:
+        children = defaultdict(list)
+        for s in spans:
+            if s is not root:
+                children[s['parent_id']].append(s)
+        print(f"\nTrace {trace_id} : {duration * 1000:.1f} ms, {len(spans)} spans ({root['service']} {root['name']})")
+        for depth, node, self_time in critical_path(root, children):
+            blame[(node['service'], node['kind'], node['name'])] += self_time
+            marker = ' !' if node['status'] != 'ok' else ''
+            print(f"  {'  ' * depth}{node['service']:<10} {node['name'][:60]:<60} "
+                  f"{node['duration'] * 1000:8.1f} ms  (propre {self_time * 1000:7.1f} ms){marker}")
+
+    total = sum(blame.values()) or 1.0
+    print(f"\nTemps propre sur le chemin critique ({min(top, len(candidates))} traces les plus lentes) :")
+    for (service, kind, span_name), seconds in sorted(blame.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f"  {seconds / total:6.1%}  {seconds * 1000:9.1f} ms  {service:<10} {kind:<7} {span_name[:60]}")
+
+
+def collect(port, out):
+    """Reçoit les lots de spans en POST JSON et les ajoute au fichier JSONL"""
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            batch = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'[]')
+            with lock, open(out, 'a') as f:
+                for item in batch:
+                    f.write(json.dumps(item, separators=(',', ':')) + '\n')
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    print(f"Collecteur de traces sur :{port} -> {out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m common.trace_report')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    collect_parser = commands.add_parser('collect', help='collecteur HTTP local (TRACE_COLLECTOR_URL)')
+    collect_parser.add_argument('--port', type=int, default=4318)
+    collect_parser.add_argument('--out', default='traces.jsonl')
+
+    path_parser = commands.add_parser('critical-path', help='chemin critique des traces les plus lentes')
+    path_parser.add_argument('files', nargs='+')
+    path_parser.add_argument('--top', type=int, default=5)
+    path_parser.add_argument('--name', help='seulement les traces dont la racine porte ce nom')
+
+    args = parser.parse_args(argv)
+    if args.command == 'collect':
+        collect(args.port, args.out)
+    else:
+        report(load_traces(args.files), args.top, args.name)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
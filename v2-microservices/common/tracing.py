@@ -0,0 +1,317 @@
+"""Traces distribuées : une action du dashboard suivie de bout en bout (Gateway -> Billing -> Inventory).
+
+    init_tracing(app, 'billing')                 # span par requête entrante + span par requête SQL
+    init_tracing(app, 'gateway', sql=False)
+
+    with span('recalcul', machine_id=12):        # span applicatif (enfant du span courant)
+        ...
+
+- propagation W3C : chaque appel d'un ServiceClient envoie l'en-tête `traceparent`
+  (00-<trace id>-<span id>-<flags>), le service appelé continue la même trace ;
+- échantillonnage à la racine (TRACE_SAMPLE_RATE, 0.1) : les services suivants respectent la décision
+  (flag 01 / 00), une trace est donc complète ou absente. Les ids circulent même sans échantillonnage ;
+- export en arrière-plan, par lots : TRACE_FILE (JSONL, une ligne par span) ou TRACE_COLLECTOR_URL
+  (POST JSON, ex. `python -m common.trace_report collect`). Sans l'un ni l'autre, rien n'est enregistré.
+
+Analyse : python -m common.trace_report critical-path traces.jsonl
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.1))
+TRACE_FILE = os.environ.get('TRACE_FILE')
+TRACE_COLLECTOR_URL = os.environ.get('TRACE_COLLECTOR_URL')
+TRACE_QUEUE_SIZE = int(os.environ.get('TRACE_QUEUE_SIZE', 10000))
+EXPORT_BATCH_SIZE = 512
+SQL_STATEMENT_MAX_LENGTH = 200
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_service_name = os.environ.get('SERVICE_PROFILE', 'unknown')
+
+
+class Span:
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'sampled', 'name', 'kind', 'service',
+                 'start', 'duration', 'status', 'attributes', '_started', '_previous')
+
+    def __init__(self, name, kind, trace_id, parent_id, sampled, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.service = _service_name
+        self.start = time.time()
+        self.duration = None
+        self.status = 'ok'
+        self.attributes = attributes or {}
+        self._started = time.perf_counter()
+        self._previous = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, status=None):
+        """Termine le span, rend la main au span parent et l'exporte s'il est échantillonné"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if status is not None:
+            self.status = status
+        if _current_span.get() is self:
+            _current_span.set(self._previous)
+        if self.sampled:
+            _export(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+            'service': self.service, 'name': self.name, 'kind': self.kind,
+            'start': self.start, 'duration': self.duration, 'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+def parse_traceparent(header):
+    """(trace id, span id parent, échantillonné) ou None si l'en-tête est absent / invalide"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def start_span(name, kind='internal', traceparent=None, activate=True, **attributes):
+    """Démarre un span, enfant de `traceparent` s'il est fourni, sinon du span courant (ou racine).
+
+    activate=True : le span devient le span courant (parent des suivants) jusqu'à finish().
+    """
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        trace_id, parent_id = f'{random.getrandbits(128):032x}', None
+        sampled = _exporting() and random.random() < TRACE_SAMPLE_RATE
+    # Sans exporteur, même une trace échantillonnée en amont n'est pas enregistrée ici (ids propagés quand même)
+    span_ = Span(name, kind, trace_id, parent_id, sampled and _exporting(), attributes)
+    if activate:
+        span_._previous = parent
+        _current_span.set(span_)
+    return span_
+
+
+@contextmanager
+def span(name, kind='internal', traceparent=None, **attributes):
+    current = start_span(name, kind, traceparent, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.set('error', repr(e)[:200])
+        current.finish('error')
+        raise
+    current.finish()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    """traceparent du span courant (à stocker avec un travail différé, ex. l'outbox du Billing)"""
+    current = _current_span.get()
+    return current.traceparent if current is not None else None
+
+
+def inject_headers(headers, current=None):
+    """Copie des en-têtes avec le traceparent du span courant (ou de `current`)"""
+    current = current or _current_span.get()
+    if current is None:
+        return headers
+    return {**(headers or {}), 'traceparent': current.traceparent}
+
+
+# --- FLASK ---
+
+def init_tracing(app, service, sql=True):
+    """Un span 'server' par requête entrante (suite de la trace de l'appelant s'il envoie traceparent)"""
+    global _service_name
+    _service_name = service
+    if sql:
+        instrument_sqlalchemy()
+
+    @app.before_request
+    def _start_server_span():
+        g._trace_span = start_span(f'{request.method} {request.path}', 'server',
+                                   request.headers.get('traceparent'), method=request.method)
+
+    @app.after_request
+    def _record_status(response):
+        current = g.get('_trace_span')
+        if current is not None:
+            current.set('status_code', response.status_code)
+        return response
+
+    # teardown : comme pour les métriques, un export en flux garde son span jusqu'à la dernière ligne
+    @app.teardown_request
+    def _finish_server_span(error=None):
+        current = g.pop('_trace_span', None)
+        if current is None:
+            return
+        if request.url_rule is not None:
+            current.name = f'{request.method} {request.url_rule.rule}'
+        failed = error is not None or current.attributes.get('status_code', 500) >= 500
+        current.finish('error' if failed else 'ok')
+
+
+# --- SQL ---
+
+_sql_instrumented = False
+_sql_lock = threading.Lock()
+
+
+def instrument_sqlalchemy():
+    """Un span 'sql' par requête SQL, seulement pendant un span échantillonné (sinon aucun coût)"""
+    global _sql_instrumented
+    with _sql_lock:
+        if _sql_instrumented:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _sql_instrumented = True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = _current_span.get()
+    sql_span = None
+    if current is not None and current.sampled:
+        sql_span = start_span(statement.split(None, 1)[0].upper() if statement else 'SQL', 'sql', activate=False,
+                              statement=statement[:SQL_STATEMENT_MAX_LENGTH], executemany=executemany)
+    conn.info.setdefault('_trace_sql', []).append(sql_span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get('_trace_sql')
+    sql_span = stack.pop() if stack else None
+    if sql_span is not None:
+        sql_span.finish()
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    stack = connection.info.get('_trace_sql') if connection is not None else None
+    sql_span = stack.pop() if stack else None
+    if sql_span is not None:
+        sql_span.set('error', str(exception_context.original_exception)[:200])
+        sql_span.finish('error')
+
+
+# --- EXPORT ---
+
+_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_export_thread = None
+_export_lock = threading.Lock()
+_dropped = 0
+
+
+def _exporting():
+    return bool(TRACE_FILE or TRACE_COLLECTOR_URL)
+
+
+def _export(finished):
+    global _dropped
+    _start_export_thread()
+    try:
+        _queue.put_nowait(finished.to_dict())
+    except queue.Full:
+        # Exporteur en retard (collecteur lent...) : on perd des spans plutôt que de ralentir les requêtes
+        _dropped += 1
+
+
+def _start_export_thread():
+    # Démarré au premier span, donc dans chaque worker gunicorn après le fork (comme le dispatcher outbox)
+    global _export_thread
+    if _export_thread is None or not _export_thread.is_alive():
+        with _export_lock:
+            if _export_thread is None or not _export_thread.is_alive():
+                _export_thread = threading.Thread(target=_export_loop, name='trace-exporter', daemon=True)
+                _export_thread.start()
+
+
+def _export_loop():
+    global _dropped
+    last_warning = 0.0
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < EXPORT_BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if TRACE_FILE:
+                _write_file(batch)
+            if TRACE_COLLECTOR_URL:
+                _post_collector(batch)
+        except Exception as e:
+            logger.warning("Export de %d spans impossible : %s", len(batch), e)
+        # Un warning par minute au plus : sous forte charge, la file déborde en continu
+        if _dropped and time.monotonic() - last_warning > 60:
+            logger.warning("%d spans perdus (file d'export pleine)", _dropped)
+            _dropped = 0
+            last_warning = time.monotonic()
+        for _ in batch:
+            _queue.task_done()
+
+
+def _write_file(batch):
+    data = ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in batch).encode()
+    # Un seul write() en O_APPEND : les lignes des différents workers ne se mélangent pas
+    fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _post_collector(batch):
+    request = urllib.request.Request(TRACE_COLLECTOR_URL, data=json.dumps(batch).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=5) as response:
+        response.read()
+
+
+def flush():
+    """Attend que les spans terminés soient exportés (fin d'un script, benchmark)"""
+    if _export_thread is not None and _export_thread.is_alive():
+        _queue.join()
@@ -0,0 +1,115 @@
+import os
+import sys
+import click
+from flask import Flask, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Le dossier 'common' (code partagé entre services) est à côté des services en local,
+# et copié à côté de app.py dans l'image Docker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth import issue_token, AUTH_TOKEN_TTL
+from common.database import engine_options, upgrade_schema
+from common.health import register_health_routes
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+
+app = Flask(__name__)
+
+# --- CONFIGURATION ---
+db_url = os.environ.get('DATABASE_URL', 'sqlite:///auth.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("mysql://", "mysql+pymysql://")
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool de connexions (MySQL) / WAL et busy_timeout (SQLite) : variables DB_* et SQLITE_*, voir common/database.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+db = SQLAlchemy(app)
+
+# Sondes Kubernetes : /healthz (processus vivant) et /readyz (BDD joignable)
+register_health_routes(app, ready_check=lambda: db.session.execute(text('SELECT 1')))
+
+# Latence par route, requêtes SQL par requête (warning si N+1), exposées sur /metrics
+init_metrics(app)
+# Span par requête (suite de la trace de l'appelant) et par requête SQL
+init_tracing(app, 'auth')
+
+# --- MODÈLE (BDD) ---
+# Seul service qui connaît les mots de passe : les autres ne voient que le jeton signé
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    is_admin = db.Column(db.Boolean, default=False, nullable=False)
+
+def user_to_dict(user):
+    return {'id': user.id, 'username': user.username, 'is_admin': user.is_admin}
+
+# --- INITIALISATION ---
+# Schéma et premier admin créés par `flask --app app init-db` (initContainer Kubernetes), jamais à l'import
+def init_db():
+    for change in upgrade_schema(db):
+        print(f"Schéma : {change}")
+    # Premier admin créé UNIQUEMENT si la base est vide (équivalent de /init-admin de la v1)
+    if not User.query.first():
+        password = os.environ.get('AUTH_ADMIN_PASSWORD', 'admin123')
+        db.session.add(User(username='admin', password=generate_password_hash(password), is_admin=True))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Un autre pod l'a créé en même temps
+            db.session.rollback()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée les tables et le premier admin (sans effet si c'est déjà fait)."""
+    init_db()
+    print("✅ Base Auth initialisée.")
+
+@app.cli.command('issue-service-token')
+@click.argument('name')
+@click.option('--days', type=float, default=365, help='Durée de validité du jeton')
+def issue_service_token_command(name, days):
+    """Jeton de service longue durée, ex. pour l'agent des PC : issue-service-token agent"""
+    print(issue_token(f"service:{name}", name, ttl=days * 86400))
+
+# --- ROUTES API (JSON) ---
+
+@app.route('/auth/login', methods=['POST'])
+def login():
+    """Vérifie le mot de passe et renvoie un jeton signé (id + rôle) valable AUTH_TOKEN_TTL secondes"""
+    data = request.get_json(silent=True) or {}
+    user = User.query.filter_by(username=data.get('username')).first()
+
+    if not user or not check_password_hash(user.password, data.get('password') or ''):
+        return jsonify({'error': 'Identifiant ou mot de passe incorrect.'}), 401
+
+    return jsonify({
+        'token': issue_token(user.id, user.username, user.is_admin),
+        'expires_in': int(AUTH_TOKEN_TTL),
+        'user': user_to_dict(user),
+    })
+
+@app.route('/auth/register', methods=['POST'])
+def register():
+    """Crée un compte utilisateur (jamais admin)"""
+    data = request.get_json(silent=True) or {}
+    username, password = data.get('username'), data.get('password')
+    if not username or not password:
+        return jsonify({'error': 'username et password sont obligatoires'}), 400
+
+    user = User(username=username, password=generate_password_hash(password), is_admin=False)
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': "Ce nom d'utilisateur est déjà pris."}), 400
+    return jsonify(user_to_dict(user)), 201
+
+if __name__ == '__main__':
+    # En local (python app.py), on initialise la base au démarrage
+    with app.app_context():
+        init_db()
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1,9 +1,35 @@
 import os
-import requests
-from datetime import datetime
+import sys
+import hashlib
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
 import pytz
-from flask import Flask, jsonify, request
+import requests
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, case, func, insert, select, text, update
+import click
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+# Le dossier 'common' (code partagé entre services) est à côté des services en local,
+# et copié à côté de app.py dans l'image Docker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.service_client import get_client
+from common.auth import require_auth, require_admin, service_auth_headers
+from common.availability import AvailabilityIndex
+from common.cache import TTLCache
+from common.database import engine_options, replica_binds, init_read_replica, read_replica, RecentWrites, \
+    RoutingSession, upgrade_schema
+from common.health import register_health_routes
+from common.metrics import init_metrics
+from common.tracing import init_tracing, current_traceparent, span
+from common.export import EXPORT_FORMATS, parse_date_range, stream_rows, export_filename
+from tariff import Tariff
+from analytics import OccupancyAnalytics, AnalyticsPending
 
 app = Flask(__name__)
 
@@ -12,54 +38,524 @@ app = Flask(__name__)
 db_url = os.environ.get('DATABASE_URL', 'sqlite:///billing.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("mysql://", "mysql+pymysql://")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool de connexions (MySQL) / WAL et busy_timeout (SQLite) : variables DB_* et SQLITE_*, voir common/database.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# Réplica MySQL optionnel (DATABASE_READ_URL) : les routes @read_replica y lisent
+app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_READ_URL'))
 
 # URL du Service Inventory (pour lui donner des ordres)
 INVENTORY_API_URL = os.environ.get('INVENTORY_API_URL', 'http://host.docker.internal:5002')
+inventory = get_client(INVENTORY_API_URL, 'Inventory')
 
-# Configuration Métier
-PRIX_PAR_HEURE = 5.0
+# Outbox : livraison des ordres occupy/release à l'Inventory en arrière-plan. Un lot ne dépasse jamais
+# la limite de POST /machines/status de l'Inventory (même variable MAX_BULK_MACHINES des deux côtés)
+MAX_BULK_MACHINES = int(os.environ.get('MAX_BULK_MACHINES', 1000))
+OUTBOX_BATCH_SIZE = min(int(os.environ.get('OUTBOX_BATCH_SIZE', 100)), MAX_BULK_MACHINES)
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 5))
+OUTBOX_MAX_BACKOFF = float(os.environ.get('OUTBOX_MAX_BACKOFF', 300))
+# Ordres réclamés par un worker : repris par un autre après ce délai s'il meurt pendant la livraison
+OUTBOX_CLAIM_TIMEOUT = float(os.environ.get('OUTBOX_CLAIM_TIMEOUT', 60))
+
+# Configuration Métier : grille tarifaire (catégories de PC, happy hours, arrondi, minimum), voir tariff.py
+tariff = Tariff.load()
+REPRICE_CHUNK_SIZE = int(os.environ.get('REPRICE_CHUNK_SIZE', 50000))
+# Démarrage / arrêt groupé (tournoi, fermeture de salle) : PC au maximum par requête
+MAX_BATCH_SESSIONS = int(os.environ.get('MAX_BATCH_SESSIONS', 500))
 TZ_QUEBEC = pytz.timezone('America/Montreal')
+# Réservations : durée maximale d'un créneau (borne aussi les recherches de conflit dans l'index BDD),
+# et délai avant un créneau pendant lequel le PC n'accepte plus de session sans réservation
+MAX_RESERVATION_DURATION = timedelta(hours=float(os.environ.get('MAX_RESERVATION_HOURS', 12)))
+RESERVATION_GUARD = timedelta(minutes=float(os.environ.get('RESERVATION_GUARD_MINUTES', 30)))
+RESERVATION_SYNC_INTERVAL = float(os.environ.get('RESERVATION_SYNC_INTERVAL', 2))
+# Session arrêtée (et facturée) quand son PC est inactif depuis ce délai, d'après ses battements (0 : jamais)
+IDLE_STOP_MINUTES = float(os.environ.get('IDLE_STOP_MINUTES', 15))
+IDLE_SWEEP_INTERVAL = float(os.environ.get('IDLE_SWEEP_INTERVAL', 60))
+# Statistiques d'occupation (GET /sessions/analytics) : sessions lues par paquets, jours clos gardés en cache
+ANALYTICS_CHUNK_SIZE = int(os.environ.get('ANALYTICS_CHUNK_SIZE', 50000))
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 3600))
+MAX_ANALYTICS_DAYS = int(os.environ.get('MAX_ANALYTICS_DAYS', 3 * 366))
+# Calcul des jours clos manquants par requête (bien sous le timeout gunicorn), la suite à la requête suivante
+ANALYTICS_BUDGET_SECONDS = float(os.environ.get('ANALYTICS_BUDGET_SECONDS', 10))
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+# Après une écriture, le même client (claim 'sub' du jeton) lit le primaire pendant READ_YOUR_WRITES_SECONDS
+init_read_replica(app, RecentWrites(key=lambda: g.get('claims', {}).get('sub')))
+
+# Sondes Kubernetes : /healthz (processus vivant) et /readyz (BDD joignable)
+register_health_routes(app, ready_check=lambda: db.session.execute(text('SELECT 1')))
 
-db = SQLAlchemy(app)
+# Latence par route, requêtes SQL par requête (warning si N+1), exposées sur /metrics
+init_metrics(app)
+# Span par requête (suite de la trace de l'appelant) et par requête SQL
+init_tracing(app, 'billing')
 
 # --- MODÈLE (BDD) ---
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     machine_id = db.Column(db.Integer, nullable=False) # On stocke juste l'ID, pas l'objet Machine complet
+    user_id = db.Column(db.Integer, nullable=True) # Claim 'sub' du jeton de celui qui a démarré (NULL : sessions d'avant l'auth)
     start_time = db.Column(db.DateTime, default=datetime.now)
-    end_time = db.Column(db.DateTime, nullable=True)
+    end_time = db.Column(db.DateTime, nullable=True, index=True) # Index : filtres par période (export)
     total_price = db.Column(db.Float, default=0.0)
 
+    # = machine_id tant que la session est ouverte, NULL une fois terminée :
+    # l'index unique garantit au plus UNE session ouverte par PC (index partiel portable SQLite/MySQL)
+    open_machine_id = db.Column(db.Integer, db.Computed("CASE WHEN end_time IS NULL THEN machine_id END"),
+                                unique=True)
+
+    # Historique et export d'un utilisateur non admin : ses sessions terminées uniquement
+    __table_args__ = (
+        db.Index('ix_session_user_end', 'user_id', 'end_time'),
+        # Rythme des démarrages (GET /sessions/start-rate, autoscaler du pool de PC virtuels)
+        db.Index('ix_session_start', 'start_time'),
+    )
+
+# Cumul du chiffre d'affaires par jour et par PC, mis à jour à chaque fin de session
+# (total de la caisse pour les admins ; le total d'un utilisateur se calcule sur ses sessions)
+class DailyRevenue(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    machine_id = db.Column(db.Integer, nullable=False)
+    session_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'machine_id', name='uq_daily_revenue_day_machine'),
+    )
+
+def add_to_daily_revenue(session):
+    """Ajoute une session terminée au cumul de son jour de fin (sans commit)."""
+    increment_daily_revenue(session.end_time.date(), session.machine_id, 1, session.total_price)
+
+def increment_daily_revenue(day, machine_id, count, revenue):
+    key = {'day': day, 'machine_id': machine_id}
+    increment = {
+        DailyRevenue.session_count: DailyRevenue.session_count + count,
+        DailyRevenue.revenue: DailyRevenue.revenue + revenue,
+    }
+
+    if DailyRevenue.query.filter_by(**key).update(increment, synchronize_session=False):
+        return
+
+    # Première session du jour sur ce PC (un autre worker peut l'insérer en même temps)
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyRevenue(session_count=count, revenue=revenue, **key))
+    except IntegrityError:
+        DailyRevenue.query.filter_by(**key).update(increment, synchronize_session=False)
+
+def add_batch_to_daily_revenue(day, revenue_by_machine):
+    """Cumul d'un arrêt groupé (sans commit) : 1 UPDATE multi-lignes + 1 INSERT, au lieu de 2 requêtes par PC.
+
+    revenue_by_machine = {machine_id: chiffre d'affaires}, une session par PC.
+    """
+    existing = {machine_id for (machine_id,) in db.session.query(DailyRevenue.machine_id).filter(
+        DailyRevenue.day == day, DailyRevenue.machine_id.in_(revenue_by_machine))}
+    table = DailyRevenue.__table__
+    if existing:
+        db.session.execute(
+            table.update().where(table.c.day == day, table.c.machine_id == bindparam('b_machine_id'))
+            .values(session_count=table.c.session_count + 1, revenue=table.c.revenue + bindparam('b_revenue')),
+            [{'b_machine_id': machine_id, 'b_revenue': revenue_by_machine[machine_id]} for machine_id in existing]
+        )
+
+    missing = [machine_id for machine_id in revenue_by_machine if machine_id not in existing]
+    if not missing:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(DailyRevenue), [
+                {'day': day, 'machine_id': machine_id, 'session_count': 1, 'revenue': revenue_by_machine[machine_id]}
+                for machine_id in missing
+            ])
+    except IntegrityError:
+        # Un autre worker a créé une des lignes entre-temps : on repasse PC par PC
+        for machine_id in missing:
+            increment_daily_revenue(day, machine_id, 1, revenue_by_machine[machine_id])
+
+def rebuild_daily_revenue(start=None, end=None):
+    """Recalcule le cumul à partir des sessions terminées, pour tous les jours ou ceux de [start, end] (sans commit)."""
+    day = func.date(Session.end_time)
+    query = db.session.query(
+        day, Session.machine_id, func.count(Session.id), func.coalesce(func.sum(Session.total_price), 0.0)
+    ).filter(Session.end_time != None)
+    stale = DailyRevenue.query
+    if start:
+        query = query.filter(Session.end_time >= datetime.combine(start.date(), datetime.min.time()))
+        stale = stale.filter(DailyRevenue.day >= start.date())
+    if end:
+        query = query.filter(Session.end_time <= datetime.combine(end.date(), datetime.max.time()))
+        stale = stale.filter(DailyRevenue.day <= end.date())
+    stale.delete(synchronize_session=False)
+    rows = query.group_by(day, Session.machine_id)
+
+    for raw_day, machine_id, count, revenue in rows:
+        # SQLite renvoie la date sous forme de texte
+        if isinstance(raw_day, str):
+            raw_day = datetime.strptime(raw_day, '%Y-%m-%d').date()
+        db.session.add(DailyRevenue(day=raw_day, machine_id=machine_id, session_count=count, revenue=revenue))
+
+# Statistiques d'occupation d'un jour clos (analytics.py), calculées une seule fois à partir des sessions
+class DailyAnalytics(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    data = db.Column(db.LargeBinary(length=2 ** 24), nullable=False) # DayStats.to_bytes() (MEDIUMBLOB en MySQL)
+
+# Ordres à envoyer à l'Inventory, écrits dans la MÊME transaction que la Session :
+# si le Billing plante après le commit, l'ordre n'est pas perdu et sera livré au redémarrage
+class OutboxCommand(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    command = db.Column(db.String(20), nullable=False) # 'occupy' ou 'release'
+    machine_id = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    # Trace de la requête qui a créé l'ordre : la livraison (plus tard, dans un autre thread) y est rattachée
+    traceparent = db.Column(db.String(55), nullable=True)
+    # Lot en cours de livraison par un worker (voir dispatch_outbox_batch)
+    claim_token = db.Column(db.String(36), nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_outbox_pending', 'delivered_at', 'next_attempt_at'),
+        db.Index('ix_outbox_machine_pending', 'machine_id', 'delivered_at'),
+    )
+
+# Réservation d'un PC sur un créneau (soirée, tournoi), en heure locale comme les sessions.
+# Jamais deux réservations actives qui se chevauchent sur un même PC (vérifié à la création)
+class Reservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='booked', nullable=False) # booked, cancelled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Relu par l'index des disponibilités des autres workers (changements depuis leur dernière synchro)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False,
+                           index=True)
+
+    __table_args__ = (
+        # Conflits sur un PC : parcours d'index borné (début entre start - durée max et end)
+        db.Index('ix_reservation_machine_start', 'machine_id', 'start_time'),
+        db.Index('ix_reservation_user_start', 'user_id', 'start_time'),
+    )
+
+# Une ligne par PC déjà réservé une fois : verrouillée le temps de créer une réservation sur ce PC
+# (le Billing n'a pas de table des PC dont il pourrait verrouiller les lignes)
+class ReservationLock(db.Model):
+    machine_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+def reprice_sessions(start=None, end=None, chunk_size=REPRICE_CHUNK_SIZE):
+    """Recalcule avec la grille actuelle le prix des sessions terminées entre start et end (sans commit).
+
+    Par paquets de `chunk_size` sessions (pagination par id) : 1 SELECT, 1 calcul NumPy pour tout le paquet,
+    puis 1 UPDATE groupé des seuls prix qui changent. Renvoie (sessions relues, sessions modifiées).
+    """
+    query = db.session.query(Session.id, Session.machine_id, Session.start_time, Session.end_time,
+                             Session.total_price).filter(Session.end_time != None)
+    if start:
+        query = query.filter(Session.end_time >= start)
+    if end:
+        query = query.filter(Session.end_time <= end)
+
+    seen = changed = 0
+    last_id = 0
+    while True:
+        rows = query.filter(Session.id > last_id).order_by(Session.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        seen += len(rows)
+
+        ids, machine_ids, starts, ends, old_prices = zip(*rows)
+        prices = tariff.price_batch(machine_ids, starts, ends)
+        modified = np.abs(prices - np.array(old_prices, dtype=float)) >= 0.005
+        if modified.any():
+            ids = np.array(ids)[modified].tolist()
+            db.session.execute(update(Session), [
+                {'id': session_id, 'total_price': price} for session_id, price in zip(ids, prices[modified].tolist())
+            ])
+            changed += len(ids)
+    return seen, changed
+
+@app.cli.command('reprice-sessions')
+@click.option('--from', 'raw_from', help="AAAA-MM-JJ (fin de session à partir de ce jour)")
+@click.option('--to', 'raw_to', help="AAAA-MM-JJ (fin de session jusqu'à ce jour inclus)")
+def reprice_sessions_command(raw_from, raw_to):
+    """Re-tarifie les sessions terminées d'une période (après une correction de la grille)."""
+    start, end = parse_date_range(raw_from, raw_to)
+    seen, changed = reprice_sessions(start, end)
+    rebuild_daily_revenue(start, end)
+    forget_analytics(start, end)
+    db.session.commit()
+    print(f"✅ {seen} sessions relues, {changed} prix corrigés, cumul journalier reconstruit.")
+
+@app.cli.command('rebuild-revenue')
+def rebuild_revenue_command():
+    """Reconstruit la table DailyRevenue à partir des sessions existantes."""
+    rebuild_daily_revenue()
+    db.session.commit()
+    print("✅ Cumul du chiffre d'affaires reconstruit.")
+
 # --- INITIALISATION ---
-with app.app_context():
-    db.create_all()
+# Tables créées par `flask --app app init-db` (initContainer Kubernetes), pas à l'import de chaque worker
+def init_db():
+    for change in upgrade_schema(db):
+        print(f"Schéma : {change}")
+    # Base d'avant le cumul journalier : le chiffre d'affaires ne lit que DailyRevenue, on le remplit une fois
+    if DailyRevenue.query.first() is None and Session.query.filter(Session.end_time != None).first() is not None:
+        rebuild_daily_revenue()
+        db.session.commit()
+        print("Cumul du chiffre d'affaires reconstruit à partir des sessions existantes.")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée les tables manquantes et ajoute les colonnes apparues depuis (sans effet si c'est déjà fait)."""
+    init_db()
+    print("✅ Base Billing initialisée.")
+
+# --- OUTBOX : LIVRAISON DES ORDRES À L'INVENTORY ---
+
+_outbox_wakeup = threading.Event()
+_outbox_thread = None
+_outbox_lock = threading.Lock()
+
+def wake_outbox_dispatcher():
+    """Démarre le thread de livraison (une fois par worker) et le réveille tout de suite"""
+    global _outbox_thread
+    if _outbox_thread is None or not _outbox_thread.is_alive():
+        with _outbox_lock:
+            if _outbox_thread is None or not _outbox_thread.is_alive():
+                _outbox_thread = threading.Thread(target=_outbox_loop, name='outbox-dispatcher', daemon=True)
+                _outbox_thread.start()
+    _outbox_wakeup.set()
+
+def _outbox_loop():
+    while True:
+        _outbox_wakeup.wait(OUTBOX_POLL_INTERVAL)
+        _outbox_wakeup.clear()
+        try:
+            with app.app_context():
+                while dispatch_outbox_batch() == OUTBOX_BATCH_SIZE:
+                    pass
+        except Exception as e:
+            print(f"Attention: erreur du dispatcher outbox: {e}")
+
+def dispatch_outbox_batch():
+    """Livre un lot d'ordres en attente. Renvoie le nombre d'ordres lus.
+
+    Les ordres occupy/release fixent un état : pour chaque PC, seul le plus récent compte.
+    On envoie donc uniquement le dernier ordre de chaque PC, les précédents sont marqués comme remplacés,
+    et tout le lot part dans une seule requête vers l'Inventory (fermeture de salle = 1 appel, pas 200).
+
+    Aucun verrou n'est tenu pendant l'appel HTTP : le lot est d'abord réclamé dans une transaction courte
+    (claim_token, prochain essai repoussé de OUTBOX_CLAIM_TIMEOUT), puis livré, puis le résultat est écrit.
+    Un worker qui meurt en pleine livraison ne retarde ses ordres que de OUTBOX_CLAIM_TIMEOUT secondes.
+    """
+    now = datetime.utcnow()
+    token, ready = claim_outbox_commands(now)
+    if not ready:
+        return 0
+
+    # Dernier ordre en attente de chaque PC (même s'il n'est pas encore prêt à être renvoyé)
+    newest = dict(db.session.query(OutboxCommand.machine_id, func.max(OutboxCommand.id)).filter(
+        OutboxCommand.delivered_at == None,
+        OutboxCommand.machine_id.in_({c.machine_id for c in ready})
+    ).group_by(OutboxCommand.machine_id).all())
+    db.session.commit()
+
+    commands = [command for command in ready if command.id == newest.get(command.machine_id)]
+    replaced = [command for command in ready if command.id != newest.get(command.machine_id)]
+    results = {command.id: {'delivered_at': now, 'last_error': 'remplacé par un ordre plus récent'}
+               for command in replaced}
+    if commands:
+        results.update(deliver_outbox_commands(commands, now))
+    save_outbox_results(token, results)
+    return len(ready)
+
+def claim_outbox_commands(now):
+    """Réclame (et commite) jusqu'à OUTBOX_BATCH_SIZE ordres prêts. Renvoie (jeton, lignes réclamées)."""
+    ids = [command_id for (command_id,) in db.session.query(OutboxCommand.id).filter(
+        OutboxCommand.delivered_at == None,
+        OutboxCommand.next_attempt_at <= now
+    ).order_by(OutboxCommand.id).limit(OUTBOX_BATCH_SIZE)]
+    if not ids:
+        db.session.commit()
+        return None, []
+
+    # UPDATE conditionnel : un ordre réclamé entre-temps par un autre worker n'est plus prêt, il est laissé
+    token = str(uuid.uuid4())
+    db.session.execute(
+        update(OutboxCommand).where(OutboxCommand.id.in_(ids), OutboxCommand.delivered_at == None,
+                                    OutboxCommand.next_attempt_at <= now)
+        .values(claim_token=token, next_attempt_at=now + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)),
+        execution_options={'synchronize_session': False})
+    db.session.commit()
+
+    ready = db.session.query(OutboxCommand.id, OutboxCommand.command, OutboxCommand.machine_id,
+                             OutboxCommand.idempotency_key, OutboxCommand.attempts, OutboxCommand.traceparent) \
+        .filter(OutboxCommand.claim_token == token).order_by(OutboxCommand.id).all()
+    db.session.commit()
+    return token, ready
+
+def save_outbox_results(token, results):
+    """Écrit {id: colonnes} sur les ordres encore réclamés par `token` (un autre worker a pu les reprendre)"""
+    table = OutboxCommand.__table__
+    # Un UPDATE (executemany) par jeu de colonnes : ordres livrés d'un côté, à renvoyer de l'autre
+    groups = {}
+    for command_id, values in results.items():
+        row = {'b_' + column: value for column, value in values.items()}
+        groups.setdefault(tuple(sorted(values)), []).append({'b_id': command_id, **row})
+    for columns, rows in groups.items():
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('b_id'), table.c.claim_token == token)
+            .values(claim_token=None, **{column: bindparam('b_' + column) for column in columns}), rows)
+    db.session.commit()
+
+def deliver_outbox_commands(commands, now):
+    """Livre les ordres (un seul par PC) en UNE requête POST /machines/status, quel que soit leur nombre.
+    Renvoie {id: colonnes à écrire} : livré (delivered_at) ou prochain essai (attempts, next_attempt_at)."""
+    payload = {
+        'occupy': [c.machine_id for c in commands if c.command == 'occupy'],
+        'release': [c.machine_id for c in commands if c.command == 'release'],
+    }
+    # Le même lot rejoué porte la même clé : l'Inventory renvoie la réponse déjà calculée
+    batch_key = hashlib.sha1(','.join(c.idempotency_key for c in commands).encode()).hexdigest()
+    # Ordres d'une même requête (démarrage groupé...) : la livraison est rattachée à sa trace
+    traceparents = {c.traceparent for c in commands}
+    traceparent = traceparents.pop() if len(traceparents) == 1 else None
+
+    with span('outbox deliver', traceparent=traceparent, commands=len(commands)) as delivery:
+        try:
+            response = inventory.post("/machines/status", json=payload,
+                                      headers={'Idempotency-Key': batch_key, **service_auth_headers('billing')})
+            if response.status_code == 200:
+                result = response.json()
+                # PC déjà occupé ou supprimé : rien de plus à faire, comme les 400 / 404 des routes PC par PC
+                refused = {machine_id: 'PC déjà occupé' for machine_id in result.get('conflicts', [])}
+                refused.update({machine_id: 'PC introuvable' for machine_id in result.get('not_found', [])})
+                return {c.id: {'delivered_at': now, 'last_error': refused.get(c.machine_id)} for c in commands}
+            error = f"HTTP {response.status_code}"
+            if response.status_code == 400:
+                # Lot refusé en bloc (limite de taille changée d'un côté...) : on ne perd aucun ordre,
+                # chacun repart par la route PC par PC, qui ne refuse que ce PC-là
+                print(f"Attention: lot de {len(commands)} ordres refusé par l'Inventory ({response.text[:200]}), "
+                      "livraison PC par PC")
+                return deliver_outbox_one_by_one(commands, now)
+        except Exception as e:
+            error = str(e)
+        delivery.status = 'error'
+
+    # Échec : nouvel essai plus tard, chaque ordre avec son backoff
+    print(f"Attention: {len(commands)} ordres pour l'Inventory non livrés ({error}), nouvel essai plus tard")
+    return {command.id: outbox_retry(command, error, now) for command in commands}
+
+def deliver_outbox_one_by_one(commands, now):
+    """Livre chaque ordre par POST /machines/<id>/occupy|release (sa propre clé d'idempotence)"""
+    results = {}
+    for command in commands:
+        try:
+            response = inventory.post(f"/machines/{command.machine_id}/{command.command}",
+                                      headers={'Idempotency-Key': command.idempotency_key,
+                                               **service_auth_headers('billing')})
+        except Exception as e:
+            results[command.id] = outbox_retry(command, str(e), now)
+            continue
+        if response.status_code == 200:
+            results[command.id] = {'delivered_at': now, 'last_error': None}
+        elif response.status_code == 404:
+            results[command.id] = {'delivered_at': now, 'last_error': 'PC introuvable'}
+        elif response.status_code == 400 and command.command == 'occupy':
+            results[command.id] = {'delivered_at': now, 'last_error': 'PC déjà occupé'}
+        else:
+            results[command.id] = outbox_retry(command, f"HTTP {response.status_code}", now)
+    return results
+
+def outbox_retry(command, error, now):
+    """Colonnes d'un ordre non livré : nouvel essai plus tard (backoff exponentiel avec jitter)"""
+    attempts = command.attempts + 1
+    delay = min(OUTBOX_MAX_BACKOFF, 2 ** attempts) * random.uniform(0.5, 1.0)
+    return {'attempts': attempts, 'last_error': error[:255], 'next_attempt_at': now + timedelta(seconds=delay)}
+
+@app.before_request
+def _start_outbox_dispatcher():
+    # Au démarrage d'un worker, on livre aussi les ordres restés en attente (crash, Inventory indisponible...)
+    if _outbox_thread is None:
+        wake_outbox_dispatcher()
 
 # --- LOGIQUE MÉTIER ---
 
+# Essais de POST /instances/acquire (le client HTTP ne rejoue jamais un POST : c'est la clé qui le permet)
+ACQUIRE_ATTEMPTS = int(os.environ.get('ACQUIRE_ATTEMPTS', 3))
+
 @app.route('/sessions/start', methods=['POST'])
+@require_auth
 def start_session():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     machine_id = data.get('machine_id')
-    
-    # 1. COMMUNICATION INTER-SERVICE : On dit à l'Inventory "Occupe ce PC !"
-    # Si l'Inventory dit non (400), on arrête tout.
-    try:
-        response = requests.post(f"{INVENTORY_API_URL}/machines/{machine_id}/occupy")
+    virtual = bool(data.get('virtual'))
+    if not virtual and not isinstance(machine_id, int):
+        return jsonify({'error': 'machine_id (entier) attendu'}), 400
+
+    if virtual:
+        # Cloud gaming : l'Inventory attribue (et occupe) un PC virtuel déjà démarré, pas d'ordre "occupy".
+        # Même Idempotency-Key à chaque essai : après un timeout, la relance récupère l'instance déjà attribuée
+        headers = {**service_auth_headers('billing'), 'Idempotency-Key': str(uuid.uuid4())}
+        for attempt in range(ACQUIRE_ATTEMPTS):
+            try:
+                response = inventory.post('/instances/acquire', headers=headers)
+                break
+            except requests.exceptions.RequestException:
+                if attempt == ACQUIRE_ATTEMPTS - 1:
+                    # Une instance attribuée sans session est rendue au pool par le gestionnaire (voir Inventory)
+                    return jsonify({'error': "Service Inventory indisponible"}), 503
         if response.status_code != 200:
-            return jsonify({'error': 'Impossible de réserver la machine (déjà prise ?)'}), 400
-    except Exception as e:
-        return jsonify({'error': f'Erreur de connexion avec Inventory: {str(e)}'}), 500
+            # Pool vide : on relaie le délai conseillé, une instance démarre pour cette demande
+            retry_after = response.headers.get('Retry-After')
+            reply = jsonify({'error': "Aucun PC virtuel prêt, réessayez dans quelques secondes"})
+            if retry_after:
+                reply.headers['Retry-After'] = retry_after
+            return reply, 503
+        machine_id = response.json()['machine_id']
+    else:
+        # Pas de session (ni d'ordre "occupy") sur un PC que l'Inventory ne connaît pas
+        try:
+            if unknown_machines([machine_id]):
+                return jsonify({'error': 'PC introuvable'}), 404
+        except Exception as e:
+            return jsonify({'error': f'Inventory indisponible : {e}'}), 503
+    # Un PC réservé par quelqu'un d'autre (en cours ou bientôt) reste libre pour sa réservation
+    if not virtual and reserved_machine_ids([machine_id], except_user=g.claims['sub']):
+        return jsonify({'error': 'PC réservé par un autre client sur ce créneau'}), 409
 
-    # 2. Si l'Inventory est OK, on crée la session chez nous
+    # 1. On crée la session ET l'ordre "Occupe ce PC !" dans la même transaction.
+    # L'index unique refuse une 2e session ouverte sur le même PC (c'est le Billing qui fait foi).
     now_quebec = datetime.now(TZ_QUEBEC).replace(tzinfo=None) # On simplifie pour SQLite
-    new_session = Session(machine_id=machine_id, start_time=now_quebec)
-    
+    new_session = Session(machine_id=machine_id, user_id=g.claims['sub'], start_time=now_quebec)
     db.session.add(new_session)
-    db.session.commit()
+    if not virtual:
+        db.session.add(OutboxCommand(command='occupy', machine_id=machine_id, traceparent=current_traceparent()))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if virtual:
+            # Le PC virtuel vient de nous être attribué : on le rend au pool
+            db.session.add(OutboxCommand(command='release', machine_id=machine_id, traceparent=current_traceparent()))
+            db.session.commit()
+            wake_outbox_dispatcher()
+        return jsonify({'error': 'Impossible de réserver la machine (déjà prise ?)'}), 400
+
+    # 2. COMMUNICATION INTER-SERVICE : l'ordre est livré à l'Inventory en arrière-plan
+    wake_outbox_dispatcher()
     
-    return jsonify({'message': 'Session démarrée', 'session_id': new_session.id})
+    return jsonify({'message': 'Session démarrée', 'session_id': new_session.id, 'machine_id': machine_id})
 
 @app.route('/sessions/stop/<int:machine_id>', methods=['POST'])
+@require_auth
 def stop_session(machine_id):
     # 1. On cherche la session active pour ce PC
     active_session = Session.query.filter_by(machine_id=machine_id, end_time=None).first()
@@ -69,21 +565,24 @@ def stop_session(machine_id):
         
     # 2. Calcul du prix
     now_quebec = datetime.now(TZ_QUEBEC).replace(tzinfo=None)
-    active_session.end_time = now_quebec
     
-    duration = active_session.end_time - active_session.start_time
+    duration = now_quebec - active_session.start_time
     hours = duration.total_seconds() / 3600
-    price = round(hours * PRIX_PAR_HEURE, 2)
-    active_session.total_price = price
+    price = tariff.price(machine_id, active_session.start_time, now_quebec)
 
-    # 3. COMMUNICATION INTER-SERVICE : On dit à l'Inventory "Libère ce PC !"
-    try:
-        requests.post(f"{INVENTORY_API_URL}/machines/{machine_id}/release")
-    except Exception as e:
-        # On loggue l'erreur mais on ne plante pas la facturation (l'argent d'abord !)
-        print(f"Attention: Impossible de libérer la machine dans l'inventaire: {e}")
+    # UPDATE conditionnel : si deux "stop" arrivent en même temps, un seul ferme (et facture) la session
+    closed = Session.query.filter_by(id=active_session.id, end_time=None) \
+        .update({'end_time': now_quebec, 'total_price': price}, synchronize_session='evaluate')
+    if not closed:
+        db.session.rollback()
+        return jsonify({'error': 'Aucune session active trouvée'}), 404
 
+    # 3. COMMUNICATION INTER-SERVICE : l'ordre "Libère ce PC !" part avec le commit de la facture
+    # (si l'Inventory est indisponible, il sera relivré plus tard : le PC ne reste plus bloqué)
+    db.session.add(OutboxCommand(command='release', machine_id=machine_id, traceparent=current_traceparent()))
+    add_to_daily_revenue(active_session)
     db.session.commit()
+    wake_outbox_dispatcher()
     
     return jsonify({
         'message': 'Session terminée', 
@@ -91,15 +590,459 @@ def stop_session(machine_id):
         'duration_hours': round(hours, 2)
     })
     
+# --- DÉMARRAGE / ARRÊT GROUPÉ ---
+# Tournoi (30 PC d'un coup), fermeture de salle : 1 requête, 1 commit, 1 appel à l'Inventory (via l'outbox)
+
+def batch_machine_ids():
+    """Liste d'ids du body {"machine_ids": [...]} sans doublons, ou None si invalide"""
+    machine_ids = (request.get_json(silent=True) or {}).get('machine_ids')
+    if not isinstance(machine_ids, list) or not machine_ids or not all(isinstance(i, int) for i in machine_ids):
+        return None
+    machine_ids = list(dict.fromkeys(machine_ids))
+    return machine_ids if len(machine_ids) <= MAX_BATCH_SESSIONS else None
+
+def start_sessions(machine_ids, user_id):
+    """Ouvre une session sur chaque PC libre (sans commit). Renvoie ([(session id, PC)], PC déjà pris ou réservés)."""
+    busy = {machine_id for (machine_id,) in db.session.query(Session.machine_id).filter(
+        Session.machine_id.in_(machine_ids), Session.end_time == None)}
+    busy |= reserved_machine_ids(machine_ids, except_user=user_id)
+    free = [machine_id for machine_id in machine_ids if machine_id not in busy]
+    now_quebec = datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+    traceparent = current_traceparent()
+
+    def add(ids):
+        # INSERT multi-lignes (add_all ferait un INSERT par session, à cause de la colonne calculée)
+        with db.session.begin_nested():
+            db.session.execute(insert(Session), [
+                {'machine_id': machine_id, 'user_id': user_id, 'start_time': now_quebec} for machine_id in ids
+            ])
+            db.session.execute(insert(OutboxCommand), [
+                {'command': 'occupy', 'machine_id': machine_id, 'traceparent': traceparent} for machine_id in ids
+            ])
+
+    started = free
+    if free:
+        try:
+            add(free)
+        except IntegrityError:
+            # Un autre worker a démarré un de ces PC entre-temps : on reprend PC par PC pour trouver lequel
+            started = []
+            for machine_id in free:
+                try:
+                    add([machine_id])
+                    started.append(machine_id)
+                except IntegrityError:
+                    busy.add(machine_id)
+
+    sessions = db.session.query(Session.id, Session.machine_id).filter(
+        Session.machine_id.in_(started), Session.end_time == None).all() if started else []
+    return sessions, sorted(busy)
+
+def stop_sessions(query):
+    """Termine les sessions ouvertes de `query` (sans commit) : prix calculés en un seul passage NumPy,
+    1 UPDATE pour toutes les sessions, cumul journalier groupé. Renvoie [(session id, PC, prix)]."""
+    rows = query.filter(Session.end_time == None) \
+        .with_entities(Session.id, Session.machine_id, Session.start_time).with_for_update().all()
+    if not rows:
+        return []
+
+    now_quebec = datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+    ids, machine_ids, starts = zip(*rows)
+    prices = tariff.price_batch(machine_ids, starts, [now_quebec] * len(rows)).tolist()
+
+    # UPDATE conditionnel (end_time IS NULL) : une session arrêtée en même temps par un "stop" seul
+    # n'est ni refermée ni facturée deux fois
+    closed = db.session.execute(
+        update(Session).where(Session.id.in_(ids), Session.end_time == None)
+        .values(end_time=now_quebec, total_price=case(dict(zip(ids, prices)), value=Session.id)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    stopped = list(zip(ids, machine_ids, prices))
+    if closed != len(ids):
+        still_ours = {session_id for (session_id,) in db.session.query(Session.id).filter(
+            Session.id.in_(ids), Session.end_time == now_quebec)}
+        stopped = [row for row in stopped if row[0] in still_ours]
+    if not stopped:
+        return []
+
+    traceparent = current_traceparent()
+    db.session.execute(insert(OutboxCommand), [
+        {'command': 'release', 'machine_id': machine_id, 'traceparent': traceparent} for _, machine_id, _ in stopped
+    ])
+    add_batch_to_daily_revenue(now_quebec.date(), {machine_id: price for _, machine_id, price in stopped})
+    return stopped
+
+def stopped_response(stopped, requested=()):
+    stopped_machines = {machine_id for _, machine_id, _ in stopped}
+    return jsonify({
+        'message': f'{len(stopped)} sessions terminées',
+        'stopped': [{'session_id': session_id, 'machine_id': machine_id, 'price': price}
+                    for session_id, machine_id, price in stopped],
+        'total_price': round(sum(price for _, _, price in stopped), 2),
+        'not_running': [machine_id for machine_id in requested if machine_id not in stopped_machines],
+    })
+
+@app.route('/sessions/start-batch', methods=['POST'])
+@require_auth
+def start_sessions_batch():
+    """Démarre une session sur plusieurs PC. Body : {"machine_ids": [1, 2, 3]}"""
+    machine_ids = batch_machine_ids()
+    if machine_ids is None:
+        return jsonify({'error': f'machine_ids doit être une liste de 1 à {MAX_BATCH_SESSIONS} entiers'}), 400
+
+    try:
+        not_found = unknown_machines(machine_ids)
+    except Exception as e:
+        return jsonify({'error': f'Inventory indisponible : {e}'}), 503
+
+    sessions, unavailable = start_sessions([m for m in machine_ids if m not in not_found], g.claims['sub'])
+    db.session.commit()
+    if sessions:
+        wake_outbox_dispatcher()
+
+    return jsonify({
+        'message': f'{len(sessions)} sessions démarrées',
+        'started': [{'session_id': session_id, 'machine_id': machine_id} for session_id, machine_id in sessions],
+        'unavailable': unavailable,
+        'not_found': sorted(not_found),
+    })
+
+@app.route('/sessions/stop-batch', methods=['POST'])
+@require_auth
+def stop_sessions_batch():
+    """Arrête et facture les sessions de plusieurs PC. Body : {"machine_ids": [1, 2, 3]}"""
+    machine_ids = batch_machine_ids()
+    if machine_ids is None:
+        return jsonify({'error': f'machine_ids doit être une liste de 1 à {MAX_BATCH_SESSIONS} entiers'}), 400
+
+    stopped = stop_sessions(Session.query.filter(Session.machine_id.in_(machine_ids)))
+    db.session.commit()
+    if stopped:
+        wake_outbox_dispatcher()
+    return stopped_response(stopped, machine_ids)
+
+@app.route('/sessions/stop-all', methods=['POST'])
+@require_admin
+def stop_all_sessions():
+    """Fermeture de la salle : arrête et facture TOUTES les sessions en cours"""
+    stopped = stop_sessions(Session.query)
+    db.session.commit()
+    if stopped:
+        wake_outbox_dispatcher()
+    return stopped_response(stopped)
+
+# --- ARRÊT DES SESSIONS ABANDONNÉES ---
+# L'Inventory reçoit les battements des PC (inactivité, session Windows) ; toutes les IDLE_SWEEP_INTERVAL secondes,
+# chaque worker lui demande les PC inactifs et arrête leurs sessions par stop_sessions (même tarif qu'un "stop").
+# Plusieurs workers peuvent balayer en même temps : l'UPDATE conditionnel ne ferme et ne facture qu'une fois.
+
+_sweeper_thread = None
+_sweeper_lock = threading.Lock()
+
+@app.before_request
+def _start_idle_sweeper():
+    global _sweeper_thread
+    if IDLE_STOP_MINUTES <= 0 or _sweeper_thread is not None:
+        return
+    with _sweeper_lock:
+        if _sweeper_thread is None:
+            _sweeper_thread = threading.Thread(target=_sweeper_loop, name='idle-sweeper', daemon=True)
+            _sweeper_thread.start()
+
+def _sweeper_loop():
+    while True:
+        # Décalage aléatoire : les workers ne balayent pas tous au même moment
+        time.sleep(IDLE_SWEEP_INTERVAL * random.uniform(0.8, 1.2))
+        try:
+            with app.app_context():
+                stopped = sweep_idle_sessions()
+            if stopped:
+                print(f"Sessions abandonnées arrêtées : PC {', '.join(str(m) for _, m, _ in stopped)}")
+        except Exception as e:
+            print(f"Attention: erreur du balayage des sessions inactives: {e}")
+
+def sweep_idle_sessions(idle_minutes=None):
+    """Arrête et facture les sessions ouvertes depuis plus de `idle_minutes` sur un PC inactif depuis autant.
+    Renvoie [(session id, PC, prix)]."""
+    idle = timedelta(minutes=IDLE_STOP_MINUTES if idle_minutes is None else idle_minutes)
+    # Une session plus récente que le délai n'est pas concernée (l'inactivité date d'avant le client)
+    cutoff = datetime.now(TZ_QUEBEC).replace(tzinfo=None) - idle
+    candidates = Session.query.filter(Session.end_time == None, Session.start_time <= cutoff)
+    if not candidates.with_entities(Session.id).first():
+        return []
+
+    response = inventory.get('/machines/heartbeats', params={'idle_seconds': idle.total_seconds()},
+                             headers=service_auth_headers('billing'))
+    if response.status_code != 200:
+        raise RuntimeError(f"Inventory : HTTP {response.status_code}")
+    idle_machines = [beat['machine_id'] for beat in response.json()]
+    if not idle_machines:
+        return []
+
+    stopped = stop_sessions(candidates.filter(Session.machine_id.in_(idle_machines)))
+    db.session.commit()
+    if stopped:
+        wake_outbox_dispatcher()
+    return stopped
+
+# --- RÉSERVATIONS ---
+# Index en mémoire des créneaux réservés (common/availability.py) : conflits et PC libres en O(log n) par PC,
+# sans requête SQL. Il peut avoir RESERVATION_SYNC_INTERVAL secondes de retard sur les autres workers :
+# toute écriture (réservation, démarrage de session) revérifie le créneau en BDD.
+
+# Une transaction commitée juste après la lecture précédente peut porter un updated_at un peu plus ancien
+RESERVATION_SYNC_MARGIN = timedelta(seconds=30)
+
+def local_now():
+    return datetime.now(TZ_QUEBEC).replace(tzinfo=None)
+
+def load_reservations(since):
+    """Lignes pour l'index : réservations modifiées depuis `since` (None = toutes celles à venir)"""
+    token = datetime.utcnow()
+    query = db.session.query(Reservation.id, Reservation.machine_id, Reservation.user_id, Reservation.start_time,
+                             Reservation.end_time, Reservation.status)
+    if since is None:
+        query = query.filter(Reservation.status == 'booked', Reservation.end_time > local_now())
+    else:
+        query = query.filter(Reservation.updated_at >= since - RESERVATION_SYNC_MARGIN)
+    rows = [(reservation_id, machine_id, user_id, start, end, status == 'booked')
+            for reservation_id, machine_id, user_id, start, end, status in query]
+    return rows, token
+
+availability = AvailabilityIndex(load_reservations, now=local_now, sync_interval=RESERVATION_SYNC_INTERVAL)
+
+# Ordre du parc (pour "N PC voisins"), tel que donné par l'Inventory
+machine_order_cache = TTLCache(maxsize=1, ttl=float(os.environ.get('MACHINE_ORDER_CACHE_TTL', 30)))
+
+def reserved_machine_ids(machine_ids, start=None, end=None, except_user=None):
+    """PC de `machine_ids` dont une réservation active chevauche [start, end), lus en BDD.
+
+    Par défaut : le créneau qui commence maintenant (réservation en cours ou qui débute dans RESERVATION_GUARD).
+    Le début est borné par la durée maximale : parcours d'index court, quel que soit l'historique du PC.
+    """
+    if start is None:
+        start = local_now()
+        end = start + RESERVATION_GUARD
+    query = db.session.query(Reservation.machine_id).filter(
+        Reservation.machine_id.in_(machine_ids), Reservation.status == 'booked',
+        Reservation.start_time > start - MAX_RESERVATION_DURATION, Reservation.start_time < end,
+        Reservation.end_time > start)
+    if except_user is not None:
+        query = query.filter(Reservation.user_id != except_user)
+    return {machine_id for (machine_id,) in query}
+
+def lock_reservation_machines(machine_ids):
+    """Sérialise les réservations d'un même PC (sans commit) : la ligne ReservationLock de chaque PC, créée au
+    besoin, est modifiée et reste donc verrouillée jusqu'au commit (verrou de ligne MySQL, verrou d'écriture SQLite).
+    À appeler en début de transaction, avant de relire les réservations : une réservation concurrente sur l'un
+    de ces PC attend notre commit, puis voit notre créneau. Ids triés : pas d'interblocage entre deux lots."""
+    machine_ids = sorted(machine_ids)
+    bump = {'version': ReservationLock.version + 1}
+    locked = ReservationLock.query.filter(ReservationLock.machine_id.in_(machine_ids)) \
+        .update(bump, synchronize_session=False)
+    if locked == len(machine_ids):
+        return
+    # Première réservation de certains PC : on crée leur ligne (lecture verrouillante, pas d'instantané périmé)
+    existing = {machine_id for (machine_id,) in db.session.query(ReservationLock.machine_id)
+                .filter(ReservationLock.machine_id.in_(machine_ids)).with_for_update()}
+    missing = [machine_id for machine_id in machine_ids if machine_id not in existing]
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(ReservationLock), [{'machine_id': m, 'version': 1} for m in missing])
+    except IntegrityError:
+        # Créées au même moment par une autre réservation, commitée pendant notre attente : on les verrouille
+        ReservationLock.query.filter(ReservationLock.machine_id.in_(missing)) \
+            .update(bump, synchronize_session=False)
+
+def parse_reservation_window(data):
+    """(début, fin) en heure locale depuis {"start": "2024-06-01T19:00", "end": "2024-06-01T23:00"}, ou ValueError"""
+    try:
+        start, end = datetime.fromisoformat(data.get('start')), datetime.fromisoformat(data.get('end'))
+    except (TypeError, ValueError):
+        raise ValueError("start et end attendus au format AAAA-MM-JJTHH:MM")
+    # Heure avec fuseau : convertie en heure locale, comme les sessions
+    start, end = [t.astimezone(TZ_QUEBEC).replace(tzinfo=None) if t.tzinfo else t for t in (start, end)]
+    if end <= start:
+        raise ValueError("end doit être après start")
+    if end - start > MAX_RESERVATION_DURATION:
+        raise ValueError(f"Créneau de {MAX_RESERVATION_DURATION.total_seconds() / 3600:g} h au maximum")
+    if end <= local_now():
+        raise ValueError("Créneau déjà passé")
+    return start, end
+
+def reservation_to_dict(reservation):
+    return {'id': reservation.id, 'machine_id': reservation.machine_id, 'user_id': reservation.user_id,
+            'start_time': reservation.start_time.isoformat(), 'end_time': reservation.end_time.isoformat()}
+
+def machine_order():
+    """Ids des PC dans l'ordre du parc (cache), depuis l'Inventory"""
+    machine_ids = machine_order_cache.get('machines')
+    if machine_ids is None:
+        response = inventory.get("/machines")
+        if response.status_code != 200:
+            raise RuntimeError(f"Inventory : HTTP {response.status_code}")
+        machine_ids = sorted(m['id'] for m in response.json())
+        machine_order_cache.set('machines', machine_ids)
+    return machine_ids
+
+# Ids inconnus de l'Inventory : une rafale de requêtes sur un faux PC ne recharge pas la liste à chaque fois
+unknown_machine_cache = TTLCache(maxsize=10000, ttl=float(os.environ.get('UNKNOWN_MACHINE_CACHE_TTL', 5)))
+
+def unknown_machines(machine_ids):
+    """Ids de `machine_ids` inconnus de l'Inventory (ensemble vide si tous existent).
+    La liste des PC en cache est rechargée une fois si un id n'y figure pas (PC ajouté depuis)."""
+    unknown = set(machine_ids).difference(machine_order())
+    if unknown and not all(unknown_machine_cache.get(machine_id) for machine_id in unknown):
+        machine_order_cache.invalidate('machines')
+        unknown.difference_update(machine_order())
+        for machine_id in unknown:
+            unknown_machine_cache.set(machine_id, True)
+    return unknown
+
+@app.route('/reservations', methods=['POST'])
+@require_auth
+def create_reservations():
+    """Réserve un créneau sur un ou plusieurs PC (tout ou rien).
+    Body : {"machine_ids": [1, 2], "start": "2024-06-01T19:00", "end": "2024-06-01T23:00"}"""
+    machine_ids = batch_machine_ids()
+    if machine_ids is None:
+        return jsonify({'error': f'machine_ids doit être une liste de 1 à {MAX_BATCH_SESSIONS} entiers'}), 400
+    try:
+        start, end = parse_reservation_window(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 1. Refus immédiat d'après l'index (pas de SQL), 2. PC verrouillés jusqu'au commit puis créneau revérifié en BDD
+    # (la transaction de lecture de l'index est close d'abord : la relecture voit les réservations commitées entre-temps)
+    availability.sync()
+    conflicts = {machine_id for machine_id in machine_ids if not availability.is_free(machine_id, start, end)}
+    if not conflicts:
+        db.session.commit()
+        lock_reservation_machines(machine_ids)
+        conflicts = reserved_machine_ids(machine_ids, start, end)
+    # Un créneau qui commence tout de suite ne prend pas un PC déjà en session
+    if not conflicts and start < local_now() + RESERVATION_GUARD:
+        conflicts = {machine_id for (machine_id,) in db.session.query(Session.machine_id).filter(
+            Session.machine_id.in_(machine_ids), Session.end_time == None)}
+    if conflicts:
+        db.session.rollback()
+        return jsonify({'error': 'Créneau déjà pris sur certains PC', 'conflicts': sorted(conflicts)}), 409
+
+    reservations = [Reservation(machine_id=machine_id, user_id=g.claims['sub'], start_time=start, end_time=end)
+                    for machine_id in machine_ids]
+    db.session.add_all(reservations)
+    db.session.flush()
+    created = [reservation_to_dict(r) for r in reservations]
+    db.session.commit()
+    for r in created:
+        availability.add(r['id'], r['machine_id'], r['user_id'], start, end)
+
+    return jsonify({'message': f'{len(created)} PC réservés', 'reservations': created}), 201
+
+@app.route('/reservations', methods=['GET'])
+@require_auth
+def get_reservations():
+    """Réservations à venir (toutes pour un admin, les siennes sinon). Optionnel : ?machine_id=N"""
+    query = Reservation.query.filter(Reservation.status == 'booked', Reservation.end_time > local_now())
+    if not g.claims.get('adm'):
+        query = query.filter(Reservation.user_id == g.claims['sub'])
+    machine_id = request.args.get('machine_id', type=int)
+    if machine_id is not None:
+        query = query.filter(Reservation.machine_id == machine_id)
+    return jsonify([reservation_to_dict(r) for r in query.order_by(Reservation.start_time, Reservation.machine_id)])
+
+@app.route('/reservations/<int:id>', methods=['DELETE'])
+@require_auth
+def cancel_reservation(id):
+    """Annule une réservation (la sienne, ou n'importe laquelle pour un admin)"""
+    reservation = db.session.get(Reservation, id)
+    if reservation is None or reservation.status != 'booked':
+        return jsonify({'error': 'Réservation introuvable'}), 404
+    if reservation.user_id != g.claims['sub'] and not g.claims.get('adm'):
+        return jsonify({'error': 'Réservation d\'un autre client'}), 403
+
+    Reservation.query.filter_by(id=id, status='booked').update({'status': 'cancelled'}, synchronize_session=False)
+    db.session.commit()
+    availability.remove(id)
+    return jsonify({'message': 'Réservation annulée'})
+
+@app.route('/reservations/availability', methods=['GET'])
+@require_auth
+def get_availability():
+    """PC libres sur un créneau, et les ?count=N premiers PC voisins libres : ?start=&end=&count=N"""
+    try:
+        start, end = parse_reservation_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    count = request.args.get('count', type=int)
+
+    try:
+        machine_ids = machine_order()
+    except Exception as e:
+        return jsonify({'error': f'Inventory indisponible : {e}'}), 503
+
+    # PC en session : pris si le créneau commence tout de suite
+    in_session = set()
+    if start < local_now() + RESERVATION_GUARD:
+        in_session = {machine_id for (machine_id,) in db.session.query(Session.machine_id).filter(
+            Session.end_time == None)}
+
+    availability.sync()
+    free = [machine_id for machine_id in availability.free_machines(machine_ids, start, end)
+            if machine_id not in in_session]
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'free': free,
+        'adjacent': availability.find_adjacent(machine_ids, count, start, end, in_session) if count else None,
+    })
+
+@app.route('/sessions/active', methods=['GET'])
+@require_auth
+def get_active_sessions():
+    """Renvoie les sessions en cours (pour afficher l'heure de début sur le dashboard)"""
+    sessions = Session.query.filter(Session.end_time == None).all()
+    return jsonify([
+        {'id': s.id, 'machine_id': s.machine_id, 'start_time': s.start_time.isoformat()}
+        for s in sessions
+    ])
+
+MAX_START_RATE_MINUTES = 24 * 60
+
+@app.route('/sessions/start-rate', methods=['GET'])
+@require_auth
+def get_start_rate():
+    """Démarrages de session par minute, minutes complètes seulement, de la plus ancienne à la plus récente
+    (?minutes=30). Lu par le gestionnaire du pool de PC virtuels (Inventory) pour prévoir la demande."""
+    minutes = request.args.get('minutes', 30, type=int)
+    if not 1 <= minutes <= MAX_START_RATE_MINUTES:
+        return jsonify({'error': f"minutes : entre 1 et {MAX_START_RATE_MINUTES}"}), 400
+
+    end = datetime.now(TZ_QUEBEC).replace(tzinfo=None, second=0, microsecond=0)
+    start = end - timedelta(minutes=minutes)
+    counts = [0] * minutes
+    for (start_time,) in db.session.query(Session.start_time) \
+            .filter(Session.start_time >= start, Session.start_time < end):
+        counts[int((start_time - start).total_seconds() // 60)] += 1
+    return jsonify({'start': start.isoformat(), 'bucket_seconds': 60, 'counts': counts})
+
 @app.route('/sessions/history', methods=['GET'])
+@require_auth
+@read_replica
 def get_history():
-    """Renvoie toutes les sessions terminées et le total"""
+    """Renvoie les sessions terminées et le total (toutes pour un admin, les siennes sinon)"""
     # On récupère les sessions qui ont une date de fin (donc payées)
     # Triées par la plus récente en premier
-    sessions = Session.query.filter(Session.end_time != None).order_by(Session.end_time.desc()).all()
-    
-    # Calcul du chiffre d'affaires total
-    total_income = sum(s.total_price for s in sessions)
+    query = Session.query.filter(Session.end_time != None)
+
+    if g.claims.get('adm'):
+        # Calcul du chiffre d'affaires total (lu dans le cumul journalier, pas recalculé en Python)
+        total_income = db.session.query(func.coalesce(func.sum(DailyRevenue.revenue), 0.0)).scalar()
+    else:
+        query = query.filter(Session.user_id == g.claims['sub'])
+        total_income = query.with_entities(func.coalesce(func.sum(Session.total_price), 0.0)).scalar()
+
+    sessions = query.order_by(Session.end_time.desc()).all()
     
     session_list = []
     for s in sessions:
@@ -117,6 +1060,164 @@ def get_history():
         'sessions': session_list
     })
 
+@app.route('/sessions/export', methods=['GET'])
+@require_auth
+@read_replica
+def export_sessions():
+    """Export comptable des sessions terminées, en flux : ?from=&to=&format=csv|ndjson&gzip=1
+
+    Mémoire constante quel que soit le nombre de lignes (curseur côté serveur + envoi par blocs).
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format doit valoir csv ou ndjson'}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    try:
+        start, end = parse_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Format de date attendu : AAAA-MM-JJ'}), 400
+
+    columns = ['id', 'machine_id', 'user_id', 'start_time', 'end_time', 'total_price']
+    query = db.session.query(Session.id, Session.machine_id, Session.user_id, Session.start_time, Session.end_time,
+                             Session.total_price).filter(Session.end_time != None)
+    if not g.claims.get('adm'):
+        query = query.filter(Session.user_id == g.claims['sub'])
+    if start:
+        query = query.filter(Session.end_time >= start)
+    if end:
+        query = query.filter(Session.end_time <= end)
+    rows = query.order_by(Session.end_time, Session.id).execution_options(yield_per=1000)
+
+    filename = export_filename('sessions', start, end, fmt, compress)
+    return Response(
+        stream_with_context(stream_rows(rows, columns, fmt, compress)),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/sessions/revenue', methods=['GET'])
+@require_admin
+@read_replica
+def get_revenue():
+    """Chiffre d'affaires par jour (optionnel : ?from=AAAA-MM-JJ&to=AAAA-MM-JJ&machine_id=N)"""
+    query = db.session.query(
+        DailyRevenue.day,
+        func.sum(DailyRevenue.session_count),
+        func.sum(DailyRevenue.revenue)
+    )
+
+    try:
+        if request.args.get('from'):
+            query = query.filter(DailyRevenue.day >= datetime.strptime(request.args['from'], '%Y-%m-%d').date())
+        if request.args.get('to'):
+            query = query.filter(DailyRevenue.day <= datetime.strptime(request.args['to'], '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'error': 'Format de date attendu : AAAA-MM-JJ'}), 400
+
+    machine_id = request.args.get('machine_id', type=int)
+    if machine_id is not None:
+        query = query.filter(DailyRevenue.machine_id == machine_id)
+
+    days = [
+        {'day': day.isoformat(), 'session_count': int(count), 'revenue': round(revenue, 2)}
+        for day, count, revenue in query.group_by(DailyRevenue.day).order_by(DailyRevenue.day)
+    ]
+
+    return jsonify({
+        'total_income': round(sum(d['revenue'] for d in days), 2),
+        'days': days
+    })
+
+# --- STATISTIQUES D'OCCUPATION ---
+# Heatmap par PC et par heure, sessions simultanées, CA par heure (analytics.py) : les sessions sont balayées
+# en NumPy par paquets de ANALYTICS_CHUNK_SIZE lignes, chaque jour clos une seule fois (table DailyAnalytics)
+
+def load_analytics_sessions(start, end=None):
+    """Paquets de lignes (machine_id, start_time, end_time, total_price) des sessions qui chevauchent [start, end)
+    (end None : jusqu'à maintenant)"""
+    columns = (Session.machine_id, Session.start_time, Session.end_time, Session.total_price)
+    # Deux requêtes plutôt qu'un OR : terminées après start (index sur end_time), puis celles en cours.
+    # Sans fin de période, pas de filtre sur start_time : SQLite choisirait ix_session_start, toute la table
+    for overlapping in (Session.end_time > start, Session.end_time == None):
+        query = select(*columns).where(overlapping)
+        if end is not None:
+            query = query.where(Session.start_time < end)
+        result = db.session.execute(query.execution_options(yield_per=ANALYTICS_CHUNK_SIZE))
+        yield from result.partitions()
+
+def load_analytics_days(first, last):
+    rows = db.session.query(DailyAnalytics.day, DailyAnalytics.data) \
+        .filter(DailyAnalytics.day >= first, DailyAnalytics.day <= last)
+    return {day: data for day, data in rows}
+
+def save_analytics_days(blocks):
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(DailyAnalytics), [{'day': day, 'data': data} for day, data in blocks.items()])
+        db.session.commit()
+    except IntegrityError:
+        # Un autre worker a figé ces jours en même temps : mêmes sessions, même résultat
+        db.session.rollback()
+
+def forget_analytics(start=None, end=None):
+    """Oublie les jours figés de [start, end] (tous si None), après une correction des sessions (sans commit).
+    Les caches des autres workers se vident au plus tard après ANALYTICS_CACHE_TTL secondes."""
+    stale = DailyAnalytics.query
+    if start:
+        stale = stale.filter(DailyAnalytics.day >= start.date())
+    if end:
+        stale = stale.filter(DailyAnalytics.day <= end.date())
+    stale.delete(synchronize_session=False)
+    analytics.cache.clear()
+
+analytics = OccupancyAnalytics(load_analytics_sessions, load_analytics_days, save_analytics_days, now=local_now,
+                               cache=TTLCache(maxsize=MAX_ANALYTICS_DAYS + 1, ttl=ANALYTICS_CACHE_TTL))
+
+@app.cli.command('rebuild-analytics')
+@click.option('--from', 'raw_from', help="AAAA-MM-JJ (premier jour, défaut : 365 jours avant aujourd'hui)")
+@click.option('--to', 'raw_to', help="AAAA-MM-JJ (dernier jour inclus, défaut : hier)")
+def rebuild_analytics_command(raw_from, raw_to):
+    """Recalcule et fige les statistiques d'occupation d'une période (après un import de sessions)."""
+    start, end = parse_date_range(raw_from, raw_to)
+    now = local_now()
+    last = end.date() if end else now.date() - timedelta(days=1)
+    first = start.date() if start else last - timedelta(days=364)
+    forget_analytics(datetime.combine(first, datetime.min.time()), datetime.combine(last, datetime.min.time()))
+    db.session.commit()
+    days = analytics.days(first, min(last, now.date()), now)
+    print(f"✅ Statistiques d'occupation recalculées sur {len(days)} jours.")
+
+@app.route('/sessions/analytics', methods=['GET'])
+@require_admin
+@read_replica
+def get_analytics():
+    """Occupation du parc (?from=AAAA-MM-JJ&to=AAAA-MM-JJ, défaut : les 30 derniers jours) : taux d'utilisation
+    par PC et par heure, sessions simultanées, CA par heure de fin, durée moyenne des sessions.
+    202 {"status": "computing", "done": N, "total": M} si les jours clos ne sont pas encore tous calculés
+    (ANALYTICS_BUDGET_SECONDS par requête) : rappeler après Retry-After, le calcul reprend où il s'est arrêté."""
+    today = local_now().date()
+    try:
+        last = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else today
+        first = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') \
+            else last - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Format de date attendu : AAAA-MM-JJ'}), 400
+    if first > min(last, today):
+        return jsonify({'error': 'Période vide (from après to ou dans le futur)'}), 400
+    if (last - first).days >= MAX_ANALYTICS_DAYS:
+        return jsonify({'error': f"Période limitée à {MAX_ANALYTICS_DAYS} jours"}), 400
+
+    try:
+        return jsonify(analytics.report(first, last, budget=ANALYTICS_BUDGET_SECONDS))
+    except AnalyticsPending as e:
+        response = jsonify({'status': 'computing', 'done': e.done, 'total': e.total})
+        response.headers['Retry-After'] = '1'
+        return response, 202
+
 if __name__ == '__main__':
+    # En local (python app.py), on crée les tables au démarrage comme avant
+    with app.app_context():
+        init_db()
     # On lance sur le port 5000 interne
     app.run(host='0.0.0.0', port=5000, debug=True)
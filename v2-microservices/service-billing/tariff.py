@@ -0,0 +1,126 @@
+"""Moteur de tarification du Billing : tarif horaire par catégorie de PC, happy hours,
+arrondi de la durée à la minute et minimum de facturation.
+
+    tariff = Tariff.load()                                  # TARIFF_FILE (JSON) ou grille par défaut
+    price = tariff.price(machine_id, start, end)            # une session (fin de session)
+    prices = tariff.price_batch(machine_ids, starts, ends)  # des millions de sessions (re-tarification)
+
+Les dates sont des heures locales naïves, comme Session.start_time / end_time.
+Une session seule passe par le même calcul vectorisé (lot de taille 1) : même arrondi partout.
+
+Exemple de TARIFF_FILE :
+    {
+      "rounding_minutes": 1,
+      "default_class": "standard",
+      "classes": {"standard": {"hourly_rate": 5.0},
+                  "gaming": {"hourly_rate": 8.0, "minimum_charge": 2.0}},
+      "machines": {"12": "gaming", "13": "gaming"},
+      "happy_hours": [{"days": [0, 1, 2, 3, 4], "start": "14:00", "end": "17:00", "discount": 0.5}]
+    }
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_TARIFF = {
+    'rounding_minutes': 1,  # durée facturée arrondie à la minute supérieure
+    'default_class': 'standard',
+    'classes': {
+        'standard': {'hourly_rate': 5.0, 'minimum_charge': 0.0},
+    },
+    'machines': {},  # catégorie par id de PC (les autres PC sont dans default_class)
+    'happy_hours': [],  # days : 0 = lundi ... 6 = dimanche ; discount : 0.5 = -50 %
+}
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+# Les minutes sont comptées depuis un lundi 00:00 (5 janvier 1970) : un multiple de 7 jours = même jour de semaine
+_MONDAY = np.datetime64('1970-01-05T00:00:00', 'us')
+_MONDAY_DATETIME = datetime(1970, 1, 5)
+
+
+class Tariff:
+
+    def __init__(self, config):
+        self.config = config
+        self.rounding = float(config.get('rounding_minutes', 1))
+
+        names = list(config['classes'])
+        self._class_index = {name: i for i, name in enumerate(names)}
+        self._rates = np.array([config['classes'][name]['hourly_rate'] / 60 for name in names])  # par minute
+        self._minimums = np.array([config['classes'][name].get('minimum_charge', 0.0) for name in names])
+        self._default_class = self._class_index[config.get('default_class', names[0])]
+        self._machine_class = {
+            int(machine_id): self._class_index[name] for machine_id, name in config.get('machines', {}).items()
+        }
+
+        # Happy hours à plat : (début en minutes depuis lundi 00:00, durée, remise), une entrée par jour
+        self._windows = []
+        for happy_hour in config.get('happy_hours', []):
+            start, end = _parse_time(happy_hour['start']), _parse_time(happy_hour['end'])
+            length = (end - start) % DAY_MINUTES or DAY_MINUTES  # 22:00 -> 02:00 passe minuit
+            for day in happy_hour.get('days', range(7)):
+                self._windows.append((day * DAY_MINUTES + start, length, float(happy_hour['discount'])))
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.environ.get('TARIFF_FILE')
+        if not path:
+            return cls(DEFAULT_TARIFF)
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def price(self, machine_id, start, end):
+        """Prix d'une session (float arrondi au centime)"""
+        return float(self.price_batch([machine_id], [start], [end])[0])
+
+    def price_batch(self, machine_ids, starts, ends):
+        """Prix de N sessions d'un coup (tableau NumPy). starts / ends : séquences de datetimes ou datetime64."""
+        start = _minutes_since_monday(starts)
+        end = _minutes_since_monday(ends)
+        duration = np.maximum(end - start, 0.0)
+
+        billed = duration
+        if self.rounding > 0:
+            # 1e-9 : une durée pile sur la minute ne doit pas passer à la suivante à cause des flottants
+            billed = np.ceil(duration / self.rounding - 1e-9) * self.rounding
+
+        # Minutes passées dans chaque happy hour = W(fin) - W(début), W(t) = minutes de fenêtre écoulées jusqu'à t
+        discounted = np.zeros_like(duration)
+        for window_start, length, discount in self._windows:
+            overlap = _window_minutes(end, window_start, length) - _window_minutes(start, window_start, length)
+            discounted += discount * overlap
+
+        classes = self.classes_of(machine_ids)
+        charge = np.round(self._rates[classes] * (billed - discounted), 2)
+        return np.maximum(charge, self._minimums[classes])
+
+    def classes_of(self, machine_ids):
+        """Index de catégorie de chaque PC (une recherche par PC distinct, pas par session)"""
+        machine_ids = np.asarray(machine_ids)
+        if not self._machine_class:
+            return np.full(machine_ids.shape, self._default_class)
+        unique_ids, inverse = np.unique(machine_ids, return_inverse=True)
+        unique_classes = np.array([self._machine_class.get(int(i), self._default_class) for i in unique_ids])
+        return unique_classes[inverse]
+
+
+def _parse_time(raw):
+    hours, minutes = raw.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _minutes_since_monday(times):
+    if isinstance(times, np.ndarray) and times.dtype.kind == 'M':
+        return (times.astype('datetime64[us]') - _MONDAY).astype(np.int64) / 60e6
+    # Datetimes Python (lignes SQL) : fromiter est ~5x plus rapide que np.array(times, dtype='datetime64')
+    return np.fromiter(((t - _MONDAY_DATETIME).total_seconds() for t in times),
+                       dtype=np.float64, count=len(times)) / 60.0
+
+
+def _window_minutes(t, window_start, length):
+    """Minutes de la fenêtre hebdomadaire [window_start, window_start + length[ écoulées entre le lundi de référence et t"""
+    shifted = t - window_start
+    return np.floor(shifted / WEEK_MINUTES) * length + np.clip(np.mod(shifted, WEEK_MINUTES), 0, length)
@@ -1,49 +1,231 @@
 import os
-import requests
+import sys
+import queue
 import random
-from flask import Flask, render_template, redirect, url_for, request, flash
-from datetime import datetime
+import functools
+from flask import Flask, Response, g, render_template, redirect, url_for, request, flash, stream_with_context
+
+# Le dossier 'common' (code partagé entre services) est à côté des services en local,
+# et copié à côté de app.py dans l'image Docker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.service_client import get_client
+from common.cache import TTLCache
+from common.auth import verify_token, auth_headers, service_auth_headers, InvalidToken, AUTH_TOKEN_TTL
+from common.feed import MachineFeed, sse_message, sse_unavailable
+from common.health import register_health_routes
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from pages import index_context, history_context, analytics_context
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dev-key-gateway'
 
+# Sondes Kubernetes : pas de vérification des autres services (une panne de l'Inventory
+# ne doit pas sortir le Gateway du Service : il affiche déjà un message d'erreur)
+register_health_routes(app)
+
+# Latence par route et des appels à Inventory / Billing / Auth, exposées sur /metrics
+init_metrics(app, sql=False)
+# Trace de chaque action (traceparent transmis à Billing / Inventory / Auth)
+init_tracing(app, 'gateway', sql=False)
+
 INVENTORY_API_URL = os.environ.get('INVENTORY_API_URL', 'http://host.docker.internal:5002')
 BILLING_API_URL = os.environ.get('BILLING_API_URL', 'http://host.docker.internal:5004')
+AUTH_API_URL = os.environ.get('AUTH_API_URL', 'http://host.docker.internal:5006')
+
+# Clients HTTP partagés (pool keep-alive, timeouts, retries, disjoncteur)
+inventory = get_client(INVENTORY_API_URL, 'Inventory')
+billing = get_client(BILLING_API_URL, 'Billing')
+auth = get_client(AUTH_API_URL, 'Auth')
+# Rapport d'occupation : le Billing calcule les jours pas encore figés (ANALYTICS_BUDGET_SECONDS par requête, puis 202)
+ANALYTICS_TIMEOUT = (billing.timeout[0], float(os.environ.get('ANALYTICS_READ_TIMEOUT', 60)))
+
+# Dernière liste de PC reçue de l'Inventory, avec son ETag : on la redemande avec If-None-Match
+# et l'Inventory répond 304 (sans corps, sans SQL) tant que rien n'a changé
+machines_cache = TTLCache(maxsize=16, ttl=float(os.environ.get('MACHINE_LIST_CACHE_TTL', 300)))
+
+# --- AUTHENTIFICATION ---
+# Le jeton signé du service Auth est gardé dans un cookie et vérifié sur place à chaque requête
+# (pas d'appel au service Auth), puis transmis tel quel à Billing et Inventory
+AUTH_COOKIE = 'cybermanager_token'
+
+# Lecture de ses propres écritures : pendant quelques secondes après une action (POST), les pages demandent aux
+# services de lire la BDD primaire plutôt que le réplica, qui peut avoir un peu de retard (common/database.py)
+WROTE_COOKIE = 'cybermanager_wrote'
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+
+def read_your_writes_headers(cookies):
+    return {'X-Read-Your-Writes': '1'} if cookies.get(WROTE_COOKIE) else {}
+
+@app.after_request
+def _remember_write(response):
+    if request.method == 'POST' and g.get('user') is not None:
+        response.set_cookie(WROTE_COOKIE, '1', max_age=max(1, round(READ_YOUR_WRITES_SECONDS)),
+                            httponly=True, samesite='Lax')
+    return response
 
-class MockUser:
-    username = "Admin (Microservices)"
+class GatewayUser:
     is_authenticated = True
 
-@app.route('/')
-def index():
+    def __init__(self, claims):
+        self.id = claims['sub']
+        self.username = claims['name']
+        self.is_admin = claims.get('adm', False)
+
+def user_from_token(token):
+    """Utilisateur du jeton, ou None si absent / invalide / expiré"""
+    if not token:
+        return None
     try:
-        response = requests.get(f"{INVENTORY_API_URL}/machines")
-        if response.status_code == 200:
-            machines = response.json()
-        else:
-            machines = []
+        return GatewayUser(verify_token(token))
+    except InvalidToken:
+        return None
+
+def login_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.cookies.get(AUTH_COOKIE)
+        g.user = user_from_token(token)
+        if g.user is None:
+            return redirect(url_for('login'))
+        g.auth_headers = {**auth_headers(token), **read_your_writes_headers(request.cookies)}
+        return view(*args, **kwargs)
+    return wrapper
+
+def admin_required(view):
+    # Contrôle d'affichage : Inventory refuse de toute façon l'action sans le claim admin
+    @functools.wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not g.user.is_admin:
+            flash("Action non autorisée. Réservé aux administrateurs.", "error")
+            return redirect(url_for('index'))
+        return view(*args, **kwargs)
+    return wrapper
+
+def machines_request_headers():
+    cached = machines_cache.get('machines')
+    return {'If-None-Match': cached[0]} if cached else {}
+
+def machines_from_response(response):
+    """Liste des PC à partir d'une réponse 200 ou 304 de GET /machines (None si erreur)"""
+    if response.status_code == 304:
+        cached = machines_cache.get('machines')
+        if cached:
+            return cached[1]
+    elif response.status_code == 200:
+        machines = response.json()
+        etag = response.headers.get('ETag', '').strip('"')
+        if etag:
+            machines_cache.set('machines', (f'"{etag}"', machines))
+        return machines
+    return None
+
+def fetch_machines():
+    try:
+        response = inventory.get("/machines", headers={**machines_request_headers(),
+                                                        **read_your_writes_headers(request.cookies)})
+        machines = machines_from_response(response)
+        if machines is None and response.status_code == 304:
+            # Cache expiré entre l'envoi et la réponse : on redemande la liste complète
+            machines = machines_from_response(inventory.get("/machines"))
+        if machines is not None:
+            return machines
     except Exception as e:
         print(f"Erreur Inventory: {e}")
-        machines = []
+    return []
+
+def fetch_active_sessions(headers):
+    try:
+        response = billing.get("/sessions/active", headers=headers)
+        if response.status_code == 200:
+            return response.json()
+    except Exception as e:
+        print(f"Erreur Billing: {e}")
+    return []
+
+def feed_machines():
+    """Liste des PC poussée aux dashboards (statut + heure de début), sans avaler les erreurs"""
+    response = inventory.get("/machines", headers=machines_request_headers())
+    machines = machines_from_response(response)
+    if machines is None:
+        raise RuntimeError(f"Inventory : HTTP {response.status_code}")
+
+    # Thread du flux, hors requête : jeton de service du Gateway
+    context = index_context(machines, fetch_active_sessions(service_auth_headers('gateway')))
+    for m in context['machines']:
+        started_at = context['started_at'].get(m['id'])
+        m['started_at'] = started_at.strftime('%H:%M') if started_at else None
+    return context['machines']
+
+# Un seul flux par processus pour tous les dashboards ouverts (voir /events/machines)
+machine_feed = MachineFeed(feed_machines, interval=float(os.environ.get('MACHINE_FEED_INTERVAL', 5)))
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
 
-    return render_template('index.html', machines=machines, user=MockUser())
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if user_from_token(request.cookies.get(AUTH_COOKIE)):
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        credentials = {'username': request.form.get('username'), 'password': request.form.get('password')}
+        try:
+            response = auth.post("/auth/login", json=credentials)
+            if response.status_code == 200:
+                redirect_response = redirect(url_for('index'))
+                redirect_response.set_cookie(AUTH_COOKIE, response.json()['token'], max_age=int(AUTH_TOKEN_TTL),
+                                             httponly=True, samesite='Lax')
+                return redirect_response
+            flash('Identifiant ou mot de passe incorrect.', 'error')
+        except Exception as e:
+            flash(f"Service Auth indisponible : {e}", "error")
+
+    return render_template('login.html')
+
+@app.route('/')
+@login_required
+def index():
+    # Mode synchrone : les appels se font l'un après l'autre (voir async_app.py pour le mode parallèle)
+    context = index_context(fetch_machines(), fetch_active_sessions(g.auth_headers))
+    return render_template('index.html', user=g.user, **context)
 
 @app.route('/session/start/<int:machine_id>', methods=['POST'])
+@login_required
 def start_session_route(machine_id):
     try:
-        response = requests.post(f"{BILLING_API_URL}/sessions/start", json={'machine_id': machine_id})
+        response = billing.post("/sessions/start", json={'machine_id': machine_id}, headers=g.auth_headers)
         if response.status_code == 200:
             flash(f"Session démarrée sur le PC {machine_id}", "success")
+        elif response.status_code == 409:
+            flash(f"Erreur : {response.json().get('error', 'PC réservé')}", "error")
         else:
             flash("Erreur : Impossible de démarrer (La machine est peut être occupée ?)", "error")
     except Exception as e:
         flash(f"Erreur de connexion Billing: {str(e)}", "error")
+    machine_feed.notify() # Les dashboards ouverts reçoivent le changement
+    return redirect(url_for('index'))
+
+@app.route('/session/start-virtual', methods=['POST'])
+@login_required
+def start_virtual_session_route():
+    try:
+        response = billing.post("/sessions/start", json={'virtual': True}, headers=g.auth_headers)
+        if response.status_code == 200:
+            flash(f"Session démarrée sur le PC virtuel {response.json().get('machine_id')}", "success")
+        elif response.status_code == 503:
+            flash(f"Erreur : {response.json().get('error', 'Aucun PC virtuel prêt')}", "error")
+        else:
+            flash("Erreur : Impossible de démarrer un PC virtuel", "error")
+    except Exception as e:
+        flash(f"Erreur de connexion Billing: {str(e)}", "error")
+    machine_feed.notify()
     return redirect(url_for('index'))
 
 @app.route('/session/stop/<int:machine_id>', methods=['POST'])
+@login_required
 def stop_session_route(machine_id):
     try:
-        response = requests.post(f"{BILLING_API_URL}/sessions/stop/{machine_id}")
+        response = billing.post(f"/sessions/stop/{machine_id}", headers=g.auth_headers)
         if response.status_code == 200:
             data = response.json()
             flash(f"Session terminée ! Prix : {data.get('price')} $", "success")
@@ -51,24 +233,84 @@ def stop_session_route(machine_id):
             flash("Erreur lors de l'arrêt de la session", "error")
     except Exception as e:
         flash(f"Erreur de connexion Billing: {str(e)}", "error")
+    machine_feed.notify()
+    return redirect(url_for('index'))
+
+# --- DÉMARRAGE / ARRÊT GROUPÉ (PC cochés sur le dashboard) ---
+# Une seule requête au Billing, qui prévient l'Inventory en un seul appel (au lieu de 3 requêtes par PC)
+@app.route('/sessions/start-batch', methods=['POST'])
+@login_required
+def start_sessions_batch_route():
+    machine_ids = request.form.getlist('machine_ids', type=int)
+    if not machine_ids:
+        flash("Cochez au moins un PC.", "error")
+        return redirect(url_for('index'))
+    try:
+        response = billing.post("/sessions/start-batch", json={'machine_ids': machine_ids}, headers=g.auth_headers)
+        if response.status_code == 200:
+            data = response.json()
+            flash(f"{len(data['started'])} sessions démarrées", "success")
+            if data['unavailable']:
+                flash(f"PC déjà pris : {', '.join(map(str, data['unavailable']))}", "warning")
+        else:
+            flash(f"Erreur : {response.json().get('error', 'démarrage impossible')}", "error")
+    except Exception as e:
+        flash(f"Erreur de connexion Billing: {str(e)}", "error")
+    machine_feed.notify()
+    return redirect(url_for('index'))
+
+@app.route('/sessions/stop-batch', methods=['POST'])
+@login_required
+def stop_sessions_batch_route():
+    machine_ids = request.form.getlist('machine_ids', type=int)
+    if not machine_ids:
+        flash("Cochez au moins un PC.", "error")
+        return redirect(url_for('index'))
+    return stop_sessions_through_billing("/sessions/stop-batch", {'machine_ids': machine_ids})
+
+@app.route('/sessions/stop-all', methods=['POST'])
+@admin_required
+def stop_all_sessions_route():
+    # Fermeture de la salle
+    return stop_sessions_through_billing("/sessions/stop-all", None)
+
+def stop_sessions_through_billing(path, payload):
+    try:
+        response = billing.post(path, json=payload, headers=g.auth_headers)
+        if response.status_code == 200:
+            data = response.json()
+            flash(f"{len(data['stopped'])} sessions terminées ! Total : {data['total_price']} $", "success")
+        else:
+            flash(f"Erreur : {response.json().get('error', 'arrêt impossible')}", "error")
+    except Exception as e:
+        flash(f"Erreur de connexion Billing: {str(e)}", "error")
+    machine_feed.notify()
     return redirect(url_for('index'))
 
 # --- NOUVEAU : AJOUT DE PC ---
 @app.route('/machines/add', methods=['POST'])
+@admin_required
 def add_machine():
-    # Sécurité (simulée avec MockUser comme dans ton code actuel)
-    # Dans un vrai cas, on vérifierait current_user.is_admin ici
-    
+    count = request.form.get('count', 1, type=int)
+
     try:
         # 1. On envoie une requête POST vide (pas de 'json={"name":...}')
         # C'est l'Inventory qui va décider du nom
-        response = requests.post(f"{INVENTORY_API_URL}/machines")
+        # Plusieurs PC d'un coup (salle LAN) : une seule requête vers /machines/bulk
+        if count > 1:
+            response = inventory.post("/machines/bulk", json={'count': count}, headers=g.auth_headers)
+        else:
+            response = inventory.post("/machines", headers=g.auth_headers)
         
         if response.status_code == 201:
             data = response.json()
-            # 2. On récupère le nom que l'Inventory a choisi
-            created_name = data.get('name') 
-            flash(f"Nouvelle machine ajoutée : {created_name}", "success")
+            # 2. On récupère le(s) nom(s) que l'Inventory a choisi(s)
+            if count > 1:
+                names = [m['name'] for m in data.get('machines', [])]
+                flash(f"{len(names)} machines ajoutées : {names[0]} → {names[-1]}", "success")
+            else:
+                created_name = data.get('name') 
+                flash(f"Nouvelle machine ajoutée : {created_name}", "success")
         else:
             # Gestion d'erreur propre
             error_msg = response.json().get('error', 'Erreur inconnue')
@@ -77,14 +319,16 @@ def add_machine():
     except Exception as e:
         flash(f"Impossible de contacter le service Inventory : {e}", "error")
 
+    machine_feed.notify()
     return redirect(url_for('index'))
 
 # --- NOUVEAU : SUPPRESSION DE PC ---
 @app.route('/machines/delete/<int:machine_id>', methods=['POST'])
+@admin_required
 def delete_machine(machine_id):
     try:
         # On envoie la demande de suppression à l'Inventory
-        response = requests.delete(f"{INVENTORY_API_URL}/machines/{machine_id}")
+        response = inventory.delete(f"/machines/{machine_id}", headers=g.auth_headers)
         
         if response.status_code == 200:
             flash("PC supprimé avec succès.", "warning")
@@ -93,55 +337,91 @@ def delete_machine(machine_id):
     except Exception as e:
         flash(f"Impossible de contacter l'Inventory : {e}", "error")
 
+    machine_feed.notify()
     return redirect(url_for('index'))
 
+@app.route('/events/machines')
+@login_required
+def machine_events():
+    """Flux SSE : l'état des PC au départ, puis uniquement les PC qui changent"""
+    events = queue.Queue(maxsize=100)
+    push = events.put_nowait
+    snapshot = machine_feed.subscribe(push)
+    if snapshot is None:
+        machine_feed.unsubscribe(push)
+        return Response(sse_unavailable(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    def stream():
+        try:
+            yield sse_message('snapshot', snapshot)
+            while True:
+                try:
+                    deltas = events.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_message('machines', deltas)
+        finally:
+            machine_feed.unsubscribe(push)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/history')
+@login_required
 def history():
     try:
-        # 1. On interroge le Service Billing
-        response = requests.get(f"{BILLING_API_URL}/sessions/history")
+        # 1. On interroge le Service Billing (il filtre selon le jeton : tout pour un admin, ses sessions sinon)
+        response = billing.get("/sessions/history", headers=g.auth_headers)
         
         if response.status_code == 200:
-            data = response.json()
-            sessions = data.get('sessions', [])
-            total_income = data.get('total_income', 0)
-            
-            # 2. TRAITEMENT DES DONNÉES
-            # On doit reconvertir les chaînes de caractères en objets Date pour le HTML
-            for s in sessions:
-                # Conversion string ISO -> objet datetime
-                if s['start_time']:
-                    s['start_time'] = datetime.fromisoformat(s['start_time'])
-                if s['end_time']:
-                    s['end_time'] = datetime.fromisoformat(s['end_time'])
-                
-                # Astuce Microservices :
-                # Comme on a décidé que ID 17 = "PC-17", on recrée le nom ici
-                # (Ça évite de devoir interroger l'Inventory pour chaque ligne)
-                s['machine_name'] = f"PC-{s['machine_id']}"
-
+            # 2. TRAITEMENT DES DONNÉES (dates + noms des PC venant de l'Inventory)
+            context = history_context(response.json(), fetch_machines())
         else:
             flash("Erreur lors de la récupération de l'historique.", "error")
-            sessions = []
-            total_income = 0
+            context = history_context({}, [])
 
     except Exception as e:
         flash(f"Service Billing indisponible : {e}", "error")
-        sessions = []
-        total_income = 0
+        context = history_context({}, [])
 
-    return render_template('history.html', sessions=sessions, total_income=total_income, user=MockUser())
+    return render_template('history.html', user=g.user, **context)
+
+@app.route('/analytics')
+@admin_required
+def analytics():
+    """Occupation du parc calculée par le Billing (?from=AAAA-MM-JJ&to=AAAA-MM-JJ, défaut : 30 derniers jours)"""
+    params = {key: request.args[key] for key in ('from', 'to') if request.args.get(key)}
+    try:
+        response = billing.get("/sessions/analytics", params=params, headers=g.auth_headers,
+                               timeout=ANALYTICS_TIMEOUT)
+        if response.status_code == 200:
+            context = analytics_context(response.json(), fetch_machines())
+            return render_template('analytics.html', user=g.user, **context)
+        if response.status_code == 202:
+            # Premier rapport sur des années de sessions : calculé en plusieurs requêtes, la page se recharge
+            progress = response.json()
+            return render_template('analytics_pending.html', user=g.user, done=progress['done'],
+                                   total=progress['total'], retry_after=response.headers.get('Retry-After', 1))
+        flash(response.json().get('error', "Erreur lors du calcul des statistiques."), "error")
+    except Exception as e:
+        flash(f"Service Billing indisponible : {e}", "error")
+    return redirect(url_for('index'))
 
 @app.route('/logout')
 def logout():
-    flash("Déconnexion impossible : Compte démo.", "info")
-    return redirect(url_for('index'))
+    # Jeton sans état : on l'oublie côté navigateur, il expire de lui-même
+    response = redirect(url_for('login'))
+    response.delete_cookie(AUTH_COOKIE)
+    flash('Vous avez été déconnecté.', 'info')
+    return response
 
 @app.route('/reset')
+@admin_required
 def reset_db():
     try:
         # On envoie l'ordre de nettoyage à l'Inventory
-        response = requests.post(f"{INVENTORY_API_URL}/reset")
+        response = inventory.post("/reset", headers=g.auth_headers)
         
         if response.status_code == 200:
             flash("♻️ Le parc a été entièrement réinitialisé !", "success")
@@ -152,6 +432,7 @@ def reset_db():
         flash(f"Impossible de contacter l'Inventory : {e}", "error")
 
     # On recharge la page d'accueil
+    machine_feed.notify()
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
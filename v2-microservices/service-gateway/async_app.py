@@ -0,0 +1,204 @@
+"""Mode asynchrone du Gateway (ASGI).
+
+Les pages de lecture (dashboard et historique) interrogent Inventory et Billing EN PARALLÈLE
+(asyncio.gather) : la latence de la page = le service le plus lent, pas la somme des appels.
+Le flux SSE /events/machines est aussi servi ici (une coroutine par dashboard, pas un thread).
+Toutes les autres routes (actions, static...) sont servies par l'application Flask de app.py.
+
+Lancement :
+    uvicorn async_app:asgi_app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import functools
+import os
+import time
+
+from quart import Quart, flash, g, make_response, redirect, render_template, request
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+from app import (
+    app as flask_app, INVENTORY_API_URL, BILLING_API_URL, AUTH_COOKIE, user_from_token,
+    machines_request_headers, machines_from_response, machine_feed, SSE_KEEPALIVE, read_your_writes_headers,
+)
+from common.auth import auth_headers
+from common.feed import sse_message, sse_unavailable
+from common.metrics import record_request
+from common.tracing import start_span
+from common.async_service_client import AsyncServiceClient
+from pages import index_context, history_context
+
+app = Quart(__name__)
+# Même clé que Flask : les messages flash passent d'une application à l'autre (même cookie de session)
+app.config['SECRET_KEY'] = flask_app.config['SECRET_KEY']
+
+# Routes servies par Quart, le reste part vers Flask
+FAN_OUT_ROUTES = {'/', '/history', '/events/machines'}
+
+clients = {}
+
+
+@app.before_serving
+async def open_clients():
+    # Les clients httpx sont liés à la boucle asyncio du serveur : on les crée au démarrage
+    clients['inventory'] = AsyncServiceClient(INVENTORY_API_URL, 'Inventory')
+    clients['billing'] = AsyncServiceClient(BILLING_API_URL, 'Billing')
+
+
+@app.after_serving
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+
+
+# Mêmes métriques et traces que les routes Flask (/metrics est servi par Flask, même processus).
+# Pour le flux SSE, la durée mesurée est celle de l'ouverture du flux, pas de la connexion.
+# Le span de la requête est le parent des appels lancés par asyncio.gather (contextvars copiés par tâche).
+@app.before_request
+async def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.trace_span = start_span(f'{request.method} {request.path}', 'server',
+                              request.headers.get('traceparent'), method=request.method)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    record_request(request.method, route, response.status_code, time.perf_counter() - g.request_started)
+    g.trace_span.name = f'{request.method} {route}'
+    g.trace_span.set('status_code', response.status_code)
+    g.trace_span.finish('error' if response.status_code >= 500 else 'ok')
+    return response
+
+
+def login_required(view):
+    """Même contrôle que le login_required de app.py (jeton du cookie vérifié sur place)"""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        token = request.cookies.get(AUTH_COOKIE)
+        g.user = user_from_token(token)
+        if g.user is None:
+            return redirect('/login')
+        g.auth_headers = {**auth_headers(token), **read_your_writes_headers(request.cookies)}
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+async def fetch_json(service, path, default, headers=None):
+    """Renvoie (données, erreur) : en cas de problème, la valeur par défaut et l'exception"""
+    try:
+        response = await clients[service].get(path, headers=headers)
+        if response.status_code == 200:
+            return response.json(), None
+        return default, None
+    except Exception as e:
+        return default, e
+
+
+async def fetch_machines():
+    """GET /machines conditionnel (ETag) partagé avec le cache du Gateway synchrone"""
+    try:
+        response = await clients['inventory'].get('/machines', headers={**machines_request_headers(),
+                                                                        **read_your_writes_headers(request.cookies)})
+        machines = machines_from_response(response)
+        if machines is None and response.status_code == 304:
+            response = await clients['inventory'].get('/machines')
+            machines = machines_from_response(response)
+        return machines or [], None
+    except Exception as e:
+        return [], e
+
+
+@app.route('/')
+@login_required
+async def index():
+    (machines, inventory_error), (active_sessions, billing_error) = await asyncio.gather(
+        fetch_machines(),
+        fetch_json('billing', '/sessions/active', [], headers=g.auth_headers),
+    )
+    if inventory_error:
+        print(f"Erreur Inventory: {inventory_error}")
+    if billing_error:
+        print(f"Erreur Billing: {billing_error}")
+
+    context = index_context(machines, active_sessions)
+    return await render_template('index.html', user=g.user, **context)
+
+
+@app.route('/history')
+@login_required
+async def history():
+    (history_data, billing_error), (machines, _) = await asyncio.gather(
+        fetch_json('billing', '/sessions/history', None, headers=g.auth_headers),
+        fetch_machines(),
+    )
+
+    if billing_error:
+        await flash(f"Service Billing indisponible : {billing_error}", "error")
+        history_data = {}
+    elif history_data is None:
+        await flash("Erreur lors de la récupération de l'historique.", "error")
+        history_data = {}
+
+    context = history_context(history_data, machines)
+    return await render_template('history.html', user=g.user, **context)
+
+
+@app.route('/events/machines')
+@login_required
+async def machine_events():
+    """Flux SSE sans thread par client : le flux partagé pousse dans une asyncio.Queue par connexion"""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=100)
+
+    def put(deltas):
+        try:
+            events.put_nowait(deltas)
+        except asyncio.QueueFull:
+            machine_feed.unsubscribe(push)
+
+    def push(deltas):
+        # Appelé depuis le thread du flux : on repasse dans la boucle asyncio
+        loop.call_soon_threadsafe(put, deltas)
+
+    snapshot = await loop.run_in_executor(None, machine_feed.subscribe, push)
+    if snapshot is None:
+        machine_feed.unsubscribe(push)
+        return sse_unavailable(), {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+
+    async def stream():
+        try:
+            yield sse_message('snapshot', snapshot).encode()
+            while True:
+                try:
+                    deltas = await asyncio.wait_for(events.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield sse_message('machines', deltas).encode()
+        finally:
+            machine_feed.unsubscribe(push)
+
+    response = await make_response(stream(), {'Content-Type': 'text/event-stream',
+                                              'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.timeout = None
+    return response
+
+
+# Pont WSGI -> ASGI avec un pool de threads (a2wsgi s'il est installé, sinon celui de uvicorn).
+# WsgiToAsgi (asgiref) échouait sous requêtes concurrentes ("CurrentThreadExecutor already quit") et
+# faisait passer toutes les requêtes Flask par un seul thread.
+wsgi_fallback = WSGIMiddleware(flask_app, workers=int(os.environ.get('WSGI_THREADS', 10)))
+
+
+async def asgi_app(scope, receive, send):
+    """Point d'entrée ASGI : aiguille chaque requête vers Quart (fan-out) ou Flask (le reste)"""
+    if scope['type'] == 'lifespan' or (
+            scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] in FAN_OUT_ROUTES):
+        await app(scope, receive, send)
+    else:
+        await wsgi_fallback(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(asgi_app, host='0.0.0.0', port=5000)
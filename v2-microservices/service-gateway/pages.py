@@ -0,0 +1,49 @@
+"""Construction du contexte des pages HTML à partir des réponses des services.
+
+Partagé entre le Gateway synchrone (app.py) et le mode asynchrone (async_app.py) :
+seule la façon d'appeler les services change, pas ce qu'on affiche.
+"""
+from datetime import datetime
+
+
+def index_context(machines, active_sessions):
+    """machines : liste de l'Inventory, active_sessions : liste de /sessions/active du Billing"""
+    started_at = {}
+    for s in active_sessions:
+        started_at[s['machine_id']] = datetime.fromisoformat(s['start_time'])
+
+    # C'est le Billing qui fait foi : l'ordre "occupy" peut arriver à l'Inventory quelques ms plus tard
+    # (copie des dicts : la liste peut venir du cache du Gateway)
+    machines = [dict(m) for m in machines]
+    for m in machines:
+        if m['id'] in started_at:
+            m['status'] = 'occupied'
+
+    return {'machines': machines, 'started_at': started_at}
+
+
+def history_context(history, machines):
+    """history : réponse de /sessions/history, machines : liste de l'Inventory (pour les noms)"""
+    sessions = history.get('sessions', [])
+    names = {m['id']: m['name'] for m in machines}
+
+    # On doit reconvertir les chaînes de caractères en objets Date pour le HTML
+    for s in sessions:
+        if s['start_time']:
+            s['start_time'] = datetime.fromisoformat(s['start_time'])
+        if s['end_time']:
+            s['end_time'] = datetime.fromisoformat(s['end_time'])
+
+        # Le nom vient de l'Inventory (récupéré en même temps que l'historique)
+        # Si le PC a été supprimé depuis, on retombe sur la convention ID 17 = "PC-17"
+        s['machine_name'] = names.get(s['machine_id'], f"PC-{s['machine_id']}")
+
+    return {'sessions': sessions, 'total_income': history.get('total_income', 0)}
+
+
+def analytics_context(report, machines):
+    """report : réponse de /sessions/analytics du Billing, machines : liste de l'Inventory (pour les noms)"""
+    names = {m['id']: m['name'] for m in machines}
+    for m in report.get('machines', []):
+        m['machine_name'] = names.get(m['machine_id'], f"PC-{m['machine_id']}")
+    return {'report': report}
@@ -1,16 +1,75 @@
 import os
-from flask import Flask, jsonify, request
+import sys
+import hashlib
+import math
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import Flask, g, jsonify, request
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, insert, inspect, text
+from sqlalchemy.exc import IntegrityError
 import uuid
 
+# Le dossier 'common' (code partagé entre services) est à côté des services en local,
+# et copié à côté de app.py dans l'image Docker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.cache import TTLCache, InvalidationBus
+from common.auth import require_auth, require_admin, require_service, service_auth_headers
+from common.database import engine_options, replica_binds, init_read_replica, read_replica, RecentWrites, \
+    RoutingSession, upgrade_schema
+from common.health import register_health_routes
+from common import metrics
+from common.metrics import init_metrics
+from common.service_client import get_client
+from common.tracing import init_tracing
+from autoscaler import WarmPoolAutoscaler
+from heartbeats import HeartbeatBuffer
+from provisioning import load_provisioner
+
 app = Flask(__name__)
 
 # --- CONFIGURATION ---
 db_url = os.environ.get('DATABASE_URL', 'sqlite:///inventory.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("mysql://", "mysql+pymysql://")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool de connexions (MySQL) / WAL et busy_timeout (SQLite) : variables DB_* et SQLITE_*, voir common/database.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# Réplica MySQL optionnel (DATABASE_READ_URL) : les routes @read_replica y lisent
+app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_READ_URL'))
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+# Après une écriture, le même client (claim 'sub' du jeton) lit le primaire pendant READ_YOUR_WRITES_SECONDS
+init_read_replica(app, RecentWrites(key=lambda: g.get('claims', {}).get('sub')))
+
+# Sondes Kubernetes : /healthz (processus vivant) et /readyz (BDD joignable)
+register_health_routes(app, ready_check=lambda: db.session.execute(text('SELECT 1')))
+
+# Latence par route, requêtes SQL par requête (warning si N+1), exposées sur /metrics
+init_metrics(app)
+# Span par requête (suite de la trace de l'appelant) et par requête SQL
+init_tracing(app, 'inventory')
 
-db = SQLAlchemy(app)
+# Cache de la liste des PC et de chaque PC (par worker). Vidé à chaque modification, mais dans CE worker seulement :
+# le bus d'invalidation est en mémoire, les AUTRES workers gunicorn (et pods) ne le voient pas.
+# MACHINE_CACHE_TTL borne donc leur retard : garder quelques secondes.
+machine_cache = TTLCache(
+    maxsize=int(os.environ.get('MACHINE_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('MACHINE_CACHE_TTL', 2)),
+)
+invalidations = InvalidationBus()
+
+@invalidations.subscribe
+def _invalidate_machine_cache(machine_id):
+    if machine_id is None:
+        machine_cache.clear()
+    else:
+        machine_cache.invalidate('machines')
+        machine_cache.invalidate('machine_ids')
+        machine_cache.invalidate(('machine', machine_id))
 
 # --- MODÈLE (BDD) ---
 class Machine(db.Model):
@@ -18,98 +77,813 @@ class Machine(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False)
     status = db.Column(db.String(20), default='available')
 
+# PC virtuel (cloud gaming) : une VM chez le fournisseur, vue par le reste du système comme un PC (ligne Machine).
+# booting -> warm (PC 'available') -> assigned (PC 'occupied') -> recycling (PC 'maintenance') -> warm...
+# draining : instance chaude en trop, en cours de destruction
+class Instance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), unique=True, nullable=False)
+    provider_ref = db.Column(db.String(100), nullable=True) # Référence chez le fournisseur (NULL pendant le démarrage)
+    state = db.Column(db.String(20), default='booting', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    state_changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Idempotency-Key de la demande qui l'a obtenue : une demande rejouée (timeout du Billing) retrouve la même
+    acquire_key = db.Column(db.String(64), nullable=True, unique=True)
+
+    # Instance chaude la plus ancienne (attribution), instances à recycler / détruire
+    __table_args__ = (
+        db.Index('ix_instance_state_changed', 'state', 'state_changed_at'),
+    )
+
+# Dernier battement de chaque PC (agent sur le poste), écrit par lots (voir heartbeats.py). Pas de clé étrangère :
+# l'upsert groupé n'a rien à vérifier, les lectures font la jointure avec Machine
+class Heartbeat(db.Model):
+    machine_id = db.Column(db.Integer, primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False, index=True) # Index : PC hors ligne (gauge, liste)
+    logged_in = db.Column(db.Boolean, nullable=False, default=False)
+    idle_seconds = db.Column(db.Float, nullable=False, default=0.0) # Sans saisie (ou sans session Windows) depuis
+    cpu = db.Column(db.Float, nullable=True) # 0 à 1
+
+# Compteur persistant pour numéroter les PC (PC-1, PC-2...) : 1 UPDATE par création,
+# et la ligne reste verrouillée jusqu'au commit, donc pas de doublon entre workers gunicorn
+class Counter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# Réponses déjà envoyées, par clé d'idempotence (header Idempotency-Key) :
+# un appel rejoué (retry du Billing) renvoie la même réponse sans refaire l'action
+class IdempotencyKey(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    status_code = db.Column(db.Integer, nullable=True) # NULL = action faite, réponse pas encore enregistrée
+    body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)))
+
+def idempotent(view):
+    """Rend une route rejouable sans risque quand l'appelant envoie un header Idempotency-Key.
+
+    La clé est ajoutée à la session AVANT la route : elle est enregistrée par le commit de la route,
+    dans la même transaction que l'action (et disparaît avec un rollback).
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+
+        stored = db.session.get(IdempotencyKey, key[:64])
+        if stored is not None:
+            if stored.status_code is None:
+                return jsonify({'message': 'Requête déjà traitée'}), 200
+            return app.response_class(stored.body, status=stored.status_code, mimetype='application/json')
+
+        record = IdempotencyKey(key=key[:64])
+        db.session.add(record)
+        try:
+            # Insertion tout de suite : une requête parallèle avec la même clé (ex. deux workers Billing qui
+            # livrent le même lot) attend notre commit puis tombe ici, au lieu d'échouer au commit de la route
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'message': 'Requête déjà traitée'}), 200
+        response = app.make_response(view(*args, **kwargs))
+
+        if inspect(record).persistent:
+            record.status_code = response.status_code
+            record.body = response.get_data(as_text=True)
+            # Ménage de temps en temps (≈ 1 appel sur 100)
+            if random.random() < 0.01:
+                IdempotencyKey.query.filter(IdempotencyKey.created_at < datetime.utcnow() - IDEMPOTENCY_KEY_TTL) \
+                    .delete(synchronize_session=False)
+            db.session.commit()
+        return response
+    return wrapper
+
+MACHINE_COUNTER = 'machine'
+MAX_BULK_MACHINES = int(os.environ.get('MAX_BULK_MACHINES', 1000))
+
+def allocate_machine_numbers(count):
+    """Réserve `count` numéros de PC consécutifs (sans commit) et renvoie le range correspondant"""
+    increment = {Counter.value: Counter.value + count}
+    if not Counter.query.filter_by(name=MACHINE_COUNTER).update(increment):
+        # Premier appel : on démarre le compteur après le plus grand numéro existant
+        try:
+            with db.session.begin_nested():
+                db.session.add(Counter(name=MACHINE_COUNTER, value=highest_machine_number() + count))
+        except IntegrityError:
+            Counter.query.filter_by(name=MACHINE_COUNTER).update(increment)
+
+    last = db.session.query(Counter.value).filter_by(name=MACHINE_COUNTER).scalar()
+    return range(last - count + 1, last + 1)
+
+def highest_machine_number():
+    highest = 0
+    for (name,) in db.session.query(Machine.name).filter(Machine.name.like('PC-%')):
+        suffix = name[3:]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
 # --- INITIALISATION ---
-with app.app_context():
-    db.create_all()
+# Schéma et PC de départ créés par `flask --app app init-db` (initContainer Kubernetes), jamais à l'import :
+# un worker gunicorn qui démarre ne fait ni DDL ni requête de seed (et les workers ne se battent plus pour seeder)
+def init_db():
+    for change in upgrade_schema(db):
+        print(f"Schéma : {change}")
     # On crée 5 PC par défaut UNIQUEMENT si la base est vide
     if not Machine.query.first():
         for i in range(1, 6):
             db.session.add(Machine(name=f"PC-{i:02d}"))
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Un autre pod a seedé en même temps : ses PC suffisent
+            db.session.rollback()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée les tables et les PC par défaut (sans effet si c'est déjà fait)."""
+    init_db()
+    print("✅ Base Inventory initialisée.")
 
 # --- ROUTES API (JSON) ---
 
+def machine_to_dict(machine):
+    return {'id': machine.id, 'name': machine.name, 'status': machine.status}
+
 @app.route('/machines', methods=['GET'])
+@read_replica
 def get_machines():
-    """Renvoie la liste de tous les PC"""
-    machines = Machine.query.all()
-    return jsonify([{'id': m.id, 'name': m.name, 'status': m.status} for m in machines])
+    """Renvoie la liste de tous les PC (ETag : si rien n'a changé, 304 sans requête SQL)"""
+    # Client qui vient d'écrire : ni cache ni réplica (ils peuvent avoir un peu de retard), lecture du primaire
+    cached = machine_cache.get('machines') if g.read_replica else None
+    if cached is None:
+        machines = Machine.query.all()
+        body = app.json.dumps([machine_to_dict(m) for m in machines])
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        cached = (etag, body)
+        machine_cache.set('machines', cached)
+
+    etag, body = cached
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 @app.route('/machines/<int:id>', methods=['GET'])
+@read_replica
 def get_machine(id):
-    machine = Machine.query.get_or_404(id)
-    return jsonify({'id': machine.id, 'name': machine.name, 'status': machine.status})
+    data = machine_cache.get(('machine', id)) if g.read_replica else None
+    if data is None:
+        data = machine_to_dict(Machine.query.get_or_404(id))
+        machine_cache.set(('machine', id), data)
+    return jsonify(data)
 
 # --- NOUVEAU : Route pour AJOUTER un PC ---
+# Les routes d'écriture exigent un jeton signé (common/auth.py), vérifié sur place sans appel au service Auth :
+# admin pour modifier le parc, n'importe quel jeton valide (utilisateur ou service Billing) pour occuper/libérer
 @app.route('/machines', methods=['POST'])
+@require_admin
+@idempotent
 def create_machine():
-    """Crée un PC avec la logique : Nom = 'PC-' + (Nombre total + 1)"""
-    
-    # 1. On compte combien de machines existent DANS LA BDD
-    count = Machine.query.count()
-    
-    # 2. On génère le nom
-    # Note : Si tu as supprimé des PC, il peut y avoir des conflits (ex: PC-3 existe déjà)
-    # On fait une petite boucle de sécurité pour trouver le prochain numéro libre
-    next_id = count + 1
-    new_name = f"PC-{next_id}"
-    
-    while Machine.query.filter_by(name=new_name).first():
-        next_id += 1
-        new_name = f"PC-{next_id}"
-
-    # 3. On enregistre
-    new_machine = Machine(name=new_name, status='available')
-    
+    """Crée un PC avec la logique : Nom = 'PC-' + (prochain numéro du compteur)"""
     try:
+        # 1. On réserve un numéro (1 UPDATE, plus de boucle pour trouver un nom libre)
+        number = allocate_machine_numbers(1)[0]
+
+        # 2. On enregistre
+        new_machine = Machine(name=f"PC-{number}", status='available')
         db.session.add(new_machine)
         db.session.commit()
+        invalidations.publish(new_machine.id)
         
-        # 4. IMPORTANT : On renvoie le nom généré au Gateway
+        # 3. IMPORTANT : On renvoie le nom généré au Gateway
         return jsonify({
             'message': 'Machine created', 
             'id': new_machine.id, 
             'name': new_machine.name
         }), 201
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/machines/bulk', methods=['POST'])
+@require_admin
+@idempotent
+def create_machines_bulk():
+    """Crée N PC d'un coup (ex: salle LAN) : 1 transaction, 1 INSERT multi-lignes. Body : {"count": N}"""
+    count = (request.get_json(silent=True) or {}).get('count')
+    if not isinstance(count, int) or not 1 <= count <= MAX_BULK_MACHINES:
+        return jsonify({'error': f'count doit être un entier entre 1 et {MAX_BULK_MACHINES}'}), 400
+
+    try:
+        names = [f"PC-{number}" for number in allocate_machine_numbers(count)]
+        db.session.execute(insert(Machine).values([{'name': name, 'status': 'available'} for name in names]))
+        created = db.session.query(Machine.id, Machine.name).filter(Machine.name.in_(names)).order_by(Machine.id).all()
+        db.session.commit()
+        invalidations.publish(None)
+
+        return jsonify({
+            'message': f'{count} machines created',
+            'machines': [{'id': machine_id, 'name': name} for machine_id, name in created]
+        }), 201
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/machines/bulk', methods=['DELETE'])
+@require_admin
+def delete_machines_bulk():
+    """Supprime plusieurs PC en une requête. Body : {"ids": [1, 2, 3]}"""
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        return jsonify({'error': 'ids doit être une liste non vide d\'entiers'}), 400
+    if len(ids) > MAX_BULK_MACHINES:
+        return jsonify({'error': f'{MAX_BULK_MACHINES} PC au maximum par requête'}), 400
+
+    # Les PC virtuels appartiennent au pool (détruits par le gestionnaire, pas ici)
+    num_rows_deleted = Machine.query.filter(Machine.id.in_(ids), Machine.id.notin_(db.session.query(Instance.machine_id))) \
+        .delete(synchronize_session=False)
+    Heartbeat.query.filter(Heartbeat.machine_id.in_(ids), Heartbeat.machine_id.notin_(db.session.query(Machine.id))) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    invalidations.publish(None)
+    return jsonify({'message': f'{num_rows_deleted} machines deleted', 'deleted': num_rows_deleted}), 200
+
 # --- NOUVEAU : Route pour SUPPRIMER un PC ---
 @app.route('/machines/<int:id>', methods=['DELETE'])
+@require_admin
 def delete_machine(id):
     machine = Machine.query.get_or_404(id)
+    if db.session.query(Instance.id).filter_by(machine_id=id).first():
+        return jsonify({'error': 'PC virtuel : géré par le pool (POOL_MAX_SIZE)'}), 400
     db.session.delete(machine)
+    Heartbeat.query.filter_by(machine_id=id).delete(synchronize_session=False)
     db.session.commit()
+    invalidations.publish(id)
     return jsonify({'message': 'Machine deleted'}), 200
 
 @app.route('/machines/<int:id>/occupy', methods=['POST'])
+@require_service('billing')  # Sessions : seul le Billing change l'occupation
+@idempotent
 def occupy_machine(id):
-    machine = Machine.query.get_or_404(id)
-    if machine.status == 'occupied':
-        return jsonify({'error': 'Machine already occupied'}), 400
-    
-    machine.status = 'occupied'
+    # UPDATE conditionnel : un seul appel peut passer le PC de 'available' à 'occupied'
+    occupied = Machine.query.filter_by(id=id, status='available') \
+        .update({'status': 'occupied'}, synchronize_session=False)
     db.session.commit()
-    return jsonify({'message': f'{machine.name} is now occupied', 'status': 'occupied'})
+
+    if not occupied:
+        if db.session.get(Machine, id) is None:
+            return jsonify({'error': 'Machine not found'}), 404
+        return jsonify({'error': 'Machine already occupied'}), 400
+
+    if assign_instances([id]):
+        db.session.commit()
+    invalidations.publish(id)
+    return jsonify({'message': f'Machine {id} is now occupied', 'status': 'occupied'})
 
 @app.route('/machines/<int:id>/release', methods=['POST'])
+@require_service('billing')
+@idempotent
 def release_machine(id):
-    machine = Machine.query.get_or_404(id)
-    machine.status = 'available'
+    released = release_machines([id])
+    db.session.commit()
+
+    # Rien à libérer : soit le PC n'existe pas, soit il est déjà libre (on répond OK)
+    if not released and db.session.get(Machine, id) is None:
+        return jsonify({'error': 'Machine not found'}), 404
+
+    invalidations.publish(id)
+    return jsonify({'message': f'Machine {id} is now available', 'status': 'available'})
+
+@app.route('/machines/status', methods=['POST'])
+@require_service('billing')
+@idempotent
+def set_machines_status():
+    """Occupe / libère plusieurs PC en une requête (fermeture de salle, tournoi) : 1 transaction, 2 UPDATE.
+
+    Body : {"occupy": [1, 2], "release": [3]}. Même règles que /occupy et /release, PC par PC :
+    un PC déjà occupé va dans "conflicts", un PC inconnu dans "not_found", libérer un PC libre est OK.
+    """
+    data = request.get_json(silent=True) or {}
+    occupy, release = data.get('occupy', []), data.get('release', [])
+    if not all(isinstance(ids, list) and all(isinstance(i, int) for i in ids) for ids in (occupy, release)):
+        return jsonify({'error': 'occupy et release doivent être des listes d\'entiers'}), 400
+    if not occupy and not release:
+        return jsonify({'error': 'occupy ou release doit être une liste non vide'}), 400
+    if len(occupy) + len(release) > MAX_BULK_MACHINES:
+        return jsonify({'error': f'{MAX_BULK_MACHINES} PC au maximum par requête'}), 400
+    if set(occupy) & set(release):
+        return jsonify({'error': 'un PC ne peut pas être à la fois occupé et libéré'}), 400
+
+    # Verrou sur les lignes lues (MySQL) : l'état vu ici est celui que les UPDATE conditionnels vont modifier
+    current = dict(db.session.query(Machine.id, Machine.status)
+                   .filter(Machine.id.in_(occupy + release)).with_for_update().all())
+    to_occupy = [i for i in occupy if current.get(i) == 'available']
+    to_release = [i for i in release if current.get(i) == 'occupied']
+    if to_occupy:
+        Machine.query.filter(Machine.id.in_(to_occupy), Machine.status == 'available') \
+            .update({'status': 'occupied'}, synchronize_session=False)
+        assign_instances(to_occupy)
+    if to_release:
+        release_machines(to_release)
     db.session.commit()
-    return jsonify({'message': f'{machine.name} is now available', 'status': 'available'})
+
+    if to_occupy or to_release:
+        invalidations.publish(None)
+    return jsonify({
+        'occupied': to_occupy,
+        'released': [i for i in release if i in current],
+        'conflicts': [i for i in occupy if i in current and i not in to_occupy],
+        'not_found': [i for i in occupy + release if i not in current],
+    })
 
 @app.route('/reset', methods=['POST'])
+@require_admin
 def reset_inventory():
     """Supprime TOUTES les machines de la base de données"""
     try:
-        # Instruction SQL DELETE sans condition (tout supprimer)
+        # Instruction SQL DELETE sans condition (tout supprimer). Les VM des PC virtuels ne sont pas détruites
+        # chez le fournisseur : le gestionnaire du pool ne les retrouve plus (à faire seulement en développement)
+        db.session.query(Instance).delete()
+        db.session.query(Heartbeat).delete()
         num_rows_deleted = db.session.query(Machine).delete()
+        # La numérotation repart de PC-1
+        db.session.query(Counter).delete()
         db.session.commit()
+        invalidations.publish(None)
         return jsonify({'message': f'Reset successful. {num_rows_deleted} machines deleted.'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# --- BATTEMENTS DES PC ---
+# L'agent de chaque PC envoie son état toutes les quelques secondes (POST /machines/heartbeat). Rien n'est écrit
+# pendant la requête : le dernier état de chaque PC est gardé en mémoire et écrit par lots (heartbeats.py).
+# Le Billing lit les PC inactifs (GET /machines/heartbeats?idle_seconds=N) pour arrêter les sessions abandonnées.
+
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', 2))
+# Sans battement depuis ce délai : PC hors ligne (éteint, planté, agent arrêté)
+HEARTBEAT_OFFLINE_AFTER = timedelta(seconds=float(os.environ.get('HEARTBEAT_OFFLINE_AFTER', 30)))
+MAX_HEARTBEATS_PER_REQUEST = 1000
+
+HEARTBEATS_RECEIVED = metrics.Counter(
+    'heartbeats_received_total', "Battements de PC reçus (avant regroupement par PC).")
+HEARTBEAT_FLUSH_SECONDS = metrics.Histogram(
+    'heartbeat_flush_seconds', "Durée d'une écriture groupée des battements (upsert + commit).")
+HEARTBEAT_FLUSH_ROWS = metrics.Counter(
+    'heartbeat_flush_rows_total', "Lignes écrites par les écritures groupées (une par PC et par écriture).")
+
+def upsert_heartbeats(rows):
+    """INSERT ... ON CONFLICT (SQLite) / ON DUPLICATE KEY UPDATE (MySQL) de toutes les lignes en une requête.
+    Un état plus ancien que celui en BDD (écrit entre-temps par un autre worker) ne l'écrase pas."""
+    started = time.perf_counter()
+    values = [{'machine_id': machine_id, 'last_seen': datetime.utcfromtimestamp(at), 'logged_in': logged_in,
+               'idle_seconds': round(idle_seconds, 1), 'cpu': None if math.isnan(cpu) else round(cpu, 3)}
+              for machine_id, at, logged_in, idle_seconds, cpu in rows]
+    columns = ('logged_in', 'idle_seconds', 'cpu', 'last_seen')
+    with app.app_context():
+        if db.engine.dialect.name == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as upsert
+            stmt = upsert(Heartbeat)
+            newer = stmt.inserted.last_seen > Heartbeat.last_seen
+            # MySQL applique les affectations dans l'ordre : last_seen en dernier, après la comparaison
+            stmt = stmt.on_duplicate_key_update([
+                (column, func.if_(newer, stmt.inserted[column], Heartbeat.__table__.c[column])) for column in columns])
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+            stmt = upsert(Heartbeat)
+            stmt = stmt.on_conflict_do_update(index_elements=['machine_id'],
+                                              set_={column: stmt.excluded[column] for column in columns},
+                                              where=stmt.excluded.last_seen > Heartbeat.last_seen)
+        db.session.execute(stmt, values)
+        db.session.commit()
+    HEARTBEAT_FLUSH_SECONDS.observe(time.perf_counter() - started)
+    HEARTBEAT_FLUSH_ROWS.inc(len(values))
+
+heartbeats = HeartbeatBuffer(upsert_heartbeats, interval=HEARTBEAT_FLUSH_INTERVAL)
+
+def parse_heartbeat(data):
+    """(machine_id, logged_in, idle_seconds, cpu) d'un battement, ou None si invalide"""
+    if not isinstance(data, dict):
+        return None
+    machine_id, idle_seconds, cpu = data.get('machine_id'), data.get('idle_seconds', 0), data.get('cpu')
+    if not isinstance(machine_id, int) or not isinstance(idle_seconds, (int, float)) or idle_seconds < 0:
+        return None
+    if cpu is not None and not isinstance(cpu, (int, float)):
+        return None
+    return machine_id, bool(data.get('logged_in')), float(idle_seconds), float('nan') if cpu is None else float(cpu)
+
+def known_machine_ids():
+    """Ids de tous les PC (cache par worker, rechargé une fois si un id n'y est pas : PC créé sur un autre worker)"""
+    ids = machine_cache.get('machine_ids')
+    if ids is None:
+        ids = frozenset(machine_id for (machine_id,) in db.session.query(Machine.id))
+        machine_cache.set('machine_ids', ids)
+    return ids
+
+@app.route('/machines/heartbeat', methods=['POST'])
+@require_service('agent')
+def machine_heartbeat():
+    """Battement d'un PC : {"machine_id": 1, "logged_in": true, "idle_seconds": 12, "cpu": 0.35},
+    ou plusieurs d'un coup (relais d'une salle) : {"heartbeats": [...]}. 202, sans requête SQL la plupart du temps.
+
+    Réservé à l'agent des PC (jeton de service "agent", voir issue-service-token du service Auth) : un client
+    ne peut pas faire passer un PC pour actif ou inactif. Les battements de PC inconnus sont ignorés (not_found)."""
+    data = request.get_json(silent=True) or {}
+    beats = data['heartbeats'] if isinstance(data.get('heartbeats'), list) else [data]
+    if len(beats) > MAX_HEARTBEATS_PER_REQUEST:
+        return jsonify({'error': f'Maximum {MAX_HEARTBEATS_PER_REQUEST} battements par requête'}), 400
+    parsed = [parse_heartbeat(beat) for beat in beats]
+    if not parsed or None in parsed:
+        return jsonify({'error': 'machine_id (entier), idle_seconds (>= 0) et cpu (nombre) attendus'}), 400
+
+    known = known_machine_ids()
+    if any(beat[0] not in known for beat in parsed):
+        machine_cache.invalidate('machine_ids')
+        known = known_machine_ids()
+    not_found = sorted({beat[0] for beat in parsed if beat[0] not in known})
+    parsed = [beat for beat in parsed if beat[0] in known]
+    if not parsed:
+        return jsonify({'error': 'PC introuvable', 'not_found': not_found}), 404
+
+    heartbeats.start()
+    for machine_id, logged_in, idle_seconds, cpu in parsed:
+        heartbeats.record(machine_id, logged_in, idle_seconds, cpu)
+    HEARTBEATS_RECEIVED.inc(len(parsed))
+    return jsonify({'accepted': len(parsed), 'not_found': not_found}), 202
+
+@app.route('/machines/heartbeats', methods=['GET'])
+@require_auth
+def get_heartbeats():
+    """Dernier état des PC qui envoient des battements (état écrit en BDD : jusqu'à HEARTBEAT_FLUSH_INTERVAL
+    de retard). ?idle_seconds=N : seulement les PC en ligne sans activité depuis au moins N secondes."""
+    min_idle = request.args.get('idle_seconds', type=float)
+    now = datetime.utcnow()
+    query = db.session.query(Heartbeat).join(Machine, Machine.id == Heartbeat.machine_id)
+    if min_idle is not None:
+        # Un PC hors ligne n'est pas "inactif" : on ne sait pas ce qui s'y passe
+        query = query.filter(Heartbeat.last_seen >= now - HEARTBEAT_OFFLINE_AFTER)
+    result = []
+    for beat in query.order_by(Heartbeat.machine_id):
+        # Inactif depuis = inactivité au dernier battement + temps écoulé depuis
+        idle = beat.idle_seconds + max(0.0, (now - beat.last_seen).total_seconds())
+        if min_idle is not None and idle < min_idle:
+            continue
+        result.append({
+            'machine_id': beat.machine_id,
+            'last_seen': beat.last_seen.isoformat(),
+            'logged_in': beat.logged_in,
+            'idle_seconds': round(idle, 1),
+            'cpu': beat.cpu,
+            'online': now - beat.last_seen < HEARTBEAT_OFFLINE_AFTER,
+        })
+    return jsonify(result)
+
+def _offline_machines():
+    since = datetime.utcnow() - HEARTBEAT_OFFLINE_AFTER
+    return [((), db.session.query(func.count(Heartbeat.machine_id)).filter(Heartbeat.last_seen < since).scalar())]
+
+metrics.register_gauge(
+    'machines_offline', "PC qui envoyaient des battements et n'en envoient plus (HEARTBEAT_OFFLINE_AFTER).",
+    _offline_machines)
+
+# --- POOL DE PC VIRTUELS (CLOUD GAMING) ---
+# Un client qui demande un PC virtuel reçoit une instance déjà démarrée (POST /instances/acquire) au lieu d'attendre
+# le démarrage d'une VM. Le pool est entretenu par UN processus, `flask --app app instance-pool` (un seul conteneur,
+# voir kubernetes/inventory.yaml) : démarrer, recycler ou détruire une VM prend des secondes, jamais dans un worker.
+
+BILLING_API_URL = os.environ.get('BILLING_API_URL', 'http://host.docker.internal:5004')
+POOL_RECONCILE_INTERVAL = float(os.environ.get('POOL_RECONCILE_INTERVAL', 5))
+POOL_HISTORY_MINUTES = int(os.environ.get('POOL_HISTORY_MINUTES', 30))
+POOL_MAX_INSTANCES = int(os.environ.get('POOL_MAX_INSTANCES', 200))
+# Une instance chaude en trop n'est détruite qu'après ce délai sans client (pas de yo-yo entre deux passes)
+POOL_SCALE_DOWN_DELAY = timedelta(seconds=float(os.environ.get('POOL_SCALE_DOWN_DELAY', 300)))
+# Instance attribuée sans session ouverte au Billing depuis ce délai (réponse perdue, Billing en panne) : rendue au pool
+POOL_ORPHAN_GRACE = timedelta(seconds=float(os.environ.get('POOL_ORPHAN_GRACE_SECONDS', 120)))
+# Démarrages en échec (API du fournisseur, quota) : pause avant de redemander, doublée à chaque échec
+POOL_BOOT_MAX_BACKOFF = float(os.environ.get('POOL_BOOT_MAX_BACKOFF', 300))
+INSTANCE_MISS_COUNTER = 'instance_miss'
+
+INSTANCE_ACQUIRES = metrics.Counter(
+    'instance_acquire_total', "Demandes de PC virtuel (hit : instance chaude disponible, miss : il faut en démarrer une).",
+    ('result',))
+
+def assign_instances(machine_ids, acquire_key=None):
+    """PC virtuels parmi ces PC qui viennent d'être occupés : instance attribuée (sans commit). Renvoie leur nombre."""
+    return Instance.query.filter(Instance.machine_id.in_(machine_ids), Instance.state == 'warm') \
+        .update({'state': 'assigned', 'state_changed_at': datetime.utcnow(), 'acquire_key': acquire_key},
+                synchronize_session=False)
+
+def release_machines(machine_ids):
+    """Libère ces PC (sans commit) et renvoie le nombre de PC libérés. Un PC physique redevient 'available',
+    un PC virtuel passe en 'maintenance' le temps que le gestionnaire du pool remette sa VM à zéro."""
+    virtual = {machine_id for (machine_id,) in db.session.query(Instance.machine_id)
+               .filter(Instance.machine_id.in_(machine_ids))}
+    released = 0
+    for ids, status in (([i for i in machine_ids if i not in virtual], 'available'), (list(virtual), 'maintenance')):
+        if ids:
+            released += Machine.query.filter(Machine.id.in_(ids), Machine.status == 'occupied') \
+                .update({'status': status}, synchronize_session=False)
+    if virtual:
+        Instance.query.filter(Instance.machine_id.in_(virtual), Instance.state == 'assigned') \
+            .update({'state': 'recycling', 'state_changed_at': datetime.utcnow(), 'acquire_key': None},
+                    synchronize_session=False)
+    return released
+
+def count_instance_miss():
+    """+1 au compteur des demandes non servies (sans commit) : le gestionnaire démarre une instance par demande"""
+    increment = {Counter.value: Counter.value + 1}
+    if Counter.query.filter_by(name=INSTANCE_MISS_COUNTER).update(increment):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(Counter(name=INSTANCE_MISS_COUNTER, value=1))
+    except IntegrityError:
+        Counter.query.filter_by(name=INSTANCE_MISS_COUNTER).update(increment)
+
+def acquired_instance(key):
+    """PC virtuel déjà attribué à cette Idempotency-Key (réponse de /instances/acquire), ou None"""
+    row = db.session.query(Machine.id, Machine.name).join(Instance, Instance.machine_id == Machine.id) \
+        .filter(Instance.acquire_key == key, Instance.state == 'assigned').first()
+    return row and {'machine_id': row.id, 'name': row.name, 'status': 'occupied'}
+
+@app.route('/instances/acquire', methods=['POST'])
+@require_service('billing')
+def acquire_instance():
+    """Attribue un PC virtuel déjà démarré : le plus ancien du pool chaud, occupé par UPDATE conditionnel.
+    503 si le pool est vide (une instance est alors démarrée pour cette demande : réessayer après Retry-After).
+
+    Avec un header Idempotency-Key, une demande rejouée renvoie le PC déjà attribué au lieu d'en prendre un 2e
+    (pas de @idempotent : un 503 ne doit pas être rejoué, la relance doit pouvoir obtenir une instance)."""
+    key = (request.headers.get('Idempotency-Key') or '')[:64] or None
+    if key:
+        already = acquired_instance(key)
+        if already:
+            return jsonify(already)
+    tried = []
+    for _ in range(3):
+        # SKIP LOCKED (MySQL) : deux demandes simultanées ne se disputent pas la même instance
+        candidate = db.session.query(Instance.machine_id) \
+            .filter(Instance.state == 'warm', Instance.machine_id.notin_(tried)) \
+            .order_by(Instance.state_changed_at).limit(1).with_for_update(skip_locked=True).scalar()
+        if candidate is None:
+            break
+        tried.append(candidate)
+        if Machine.query.filter_by(id=candidate, status='available').update({'status': 'occupied'},
+                                                                             synchronize_session=False):
+            assign_instances([candidate], acquire_key=key)
+            name = db.session.query(Machine.name).filter_by(id=candidate).scalar()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Même clé rejouée en parallèle : l'autre demande a eu son instance, on renvoie la sienne
+                db.session.rollback()
+                already = acquired_instance(key)
+                if already:
+                    return jsonify(already)
+                raise
+            invalidations.publish(candidate)
+            INSTANCE_ACQUIRES.labels('hit').inc()
+            return jsonify({'machine_id': candidate, 'name': name, 'status': 'occupied'})
+
+    count_instance_miss()
+    db.session.commit()
+    INSTANCE_ACQUIRES.labels('miss').inc()
+    response = jsonify({'error': 'Aucun PC virtuel prêt, démarrage en cours'})
+    response.headers['Retry-After'] = str(int(POOL_RECONCILE_INTERVAL) + 1)
+    return response, 503
+
+class InstancePool:
+    """Gestionnaire du pool, une passe par reconcile() :
+    - garde autoscaler.target() instances chaudes ou en démarrage (+ une par demande non servie) ;
+    - recycle les instances rendues, détruit les instances chaudes en trop (après POOL_SCALE_DOWN_DELAY) ;
+    - rend au pool les instances attribuées sans session au Billing (si active_machines est fourni).
+    Les appels au fournisseur tournent dans un pool de threads ; les lignes Instance / Machine suivent l'état."""
+
+    def __init__(self, provisioner, autoscaler, demand, workers=8, max_instances=POOL_MAX_INSTANCES,
+                 scale_down_delay=POOL_SCALE_DOWN_DELAY, active_machines=None, orphan_grace=POOL_ORPHAN_GRACE,
+                 boot_max_backoff=POOL_BOOT_MAX_BACKOFF):
+        self.provisioner = provisioner
+        self.autoscaler = autoscaler
+        self.demand = demand  # () -> démarrages de session par intervalle, du plus ancien au plus récent
+        self.active_machines = active_machines  # () -> PC ayant une session ouverte (None : pas de ménage)
+        self.max_instances = max_instances
+        self.scale_down_delay = scale_down_delay
+        self.orphan_grace = orphan_grace
+        self.boot_max_backoff = boot_max_backoff
+        self.target = autoscaler.min_size
+        self._boot_failures = 0  # démarrages en échec d'affilée
+        self._boot_retry_at = 0.0  # time.monotonic() : pas de nouveau démarrage avant
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='instance-pool')
+        self._busy = set()  # instances dont une opération est en cours dans ce processus
+        self._busy_lock = threading.Lock()
+        self._misses_seen = None
+
+    def recover(self):
+        """Au démarrage du gestionnaire : les démarrages lancés par le processus précédent sont perdus"""
+        lost = [(instance_id, machine_id) for instance_id, machine_id in
+                db.session.query(Instance.id, Instance.machine_id).filter(Instance.state == 'booting')]
+        if lost:
+            Instance.query.filter(Instance.id.in_([i for i, _ in lost])).delete(synchronize_session=False)
+            Machine.query.filter(Machine.id.in_([m for _, m in lost])).delete(synchronize_session=False)
+        self._misses_seen = self._misses()
+        db.session.commit()
+
+    def reconcile(self):
+        try:
+            self.target = self.autoscaler.target(self.demand())
+        except Exception as e:
+            # Billing indisponible : on garde la dernière cible
+            print(f"Attention: rythme des sessions illisible ({e}), cible inchangée ({self.target})")
+
+        states = dict(db.session.query(Instance.state, func.count(Instance.id)).group_by(Instance.state).all())
+        misses = self._misses() - (self._misses_seen or 0)
+        self._misses_seen += misses
+        # Une demande non servie attend une instance : elle s'ajoute à la cible de cette passe. Le client rappelle
+        # après Retry-After (> une passe) : ses relances trouvent l'instance déjà en démarrage, sans en relancer
+        missing = max(0, self.target + misses - states.get('warm', 0) - states.get('booting', 0))
+        missing = min(missing, self.max_instances - sum(states.values()))
+        if missing > 0 and time.monotonic() >= self._boot_retry_at:
+            self._boot(missing)
+
+        self._scale_down(states.get('warm', 0) - self.target)
+        if self.active_machines is not None:
+            self._release_orphans()
+        for state, task in (('recycling', self._recycle), ('draining', self._destroy)):
+            for (instance_id,) in db.session.query(Instance.id).filter(Instance.state == state):
+                self._submit(instance_id, task)
+        db.session.commit()
+        return self.target
+
+    def run(self, interval=POOL_RECONCILE_INTERVAL):
+        with app.app_context():
+            self.recover()
+        while True:
+            try:
+                with app.app_context():
+                    self.reconcile()
+            except Exception as e:
+                print(f"Attention: erreur du gestionnaire de pool: {e}")
+            time.sleep(interval)
+
+    def _misses(self):
+        return db.session.query(Counter.value).filter_by(name=INSTANCE_MISS_COUNTER).scalar() or 0
+
+    def _boot(self, count):
+        machines = [Machine(name=f"VM-{uuid.uuid4().hex[:8]}", status='maintenance') for _ in range(count)]
+        db.session.add_all(machines)
+        db.session.flush()
+        instances = [Instance(machine_id=machine.id, state='booting') for machine in machines]
+        db.session.add_all(instances)
+        db.session.flush()
+        instance_ids = [instance.id for instance in instances]
+        db.session.commit()
+        for instance_id in instance_ids:
+            self._submit(instance_id, self._start)
+
+    def _scale_down(self, extra):
+        if extra <= 0:
+            return
+        idle_since = datetime.utcnow() - self.scale_down_delay
+        candidates = db.session.query(Instance.id, Instance.machine_id) \
+            .filter(Instance.state == 'warm', Instance.state_changed_at < idle_since) \
+            .order_by(Instance.state_changed_at).limit(extra).all()
+        for instance_id, machine_id in candidates:
+            # Un client peut la prendre au même moment : seul l'UPDATE conditionnel décide
+            if Machine.query.filter_by(id=machine_id, status='available') \
+                    .update({'status': 'maintenance'}, synchronize_session=False):
+                self._set_state(instance_id, 'warm', 'draining')
+        db.session.commit()
+
+    def _release_orphans(self):
+        """Instances attribuées depuis orphan_grace sans session ouverte : la réponse de /instances/acquire
+        s'est perdue (timeout) ou le Billing n'a pas pu créer la session. Elles partent au recyclage."""
+        assigned_before = datetime.utcnow() - self.orphan_grace
+        candidates = [machine_id for (machine_id,) in db.session.query(Instance.machine_id)
+                      .filter(Instance.state == 'assigned', Instance.state_changed_at < assigned_before)]
+        if not candidates:
+            return
+        try:
+            active = set(self.active_machines())
+        except Exception as e:
+            # Billing indisponible : on ne rend rien sans savoir
+            print(f"Attention: sessions ouvertes illisibles ({e}), pas de ménage des instances attribuées")
+            return
+        orphans = [machine_id for machine_id in candidates if machine_id not in active]
+        if orphans and release_machines(orphans):
+            db.session.commit()
+            invalidations.publish(None)
+            print(f"Attention: {len(orphans)} PC virtuel(s) attribué(s) sans session, rendu(s) au pool")
+
+    def _submit(self, instance_id, task):
+        with self._busy_lock:
+            if instance_id in self._busy:
+                return
+            self._busy.add(instance_id)
+        self._executor.submit(self._run_task, instance_id, task)
+
+    def _run_task(self, instance_id, task):
+        try:
+            task(instance_id)
+        except Exception as e:
+            print(f"Attention: instance {instance_id} : {e}")
+        finally:
+            with self._busy_lock:
+                self._busy.discard(instance_id)
+
+    def _row(self, instance_id, state):
+        """(référence, PC) de l'instance si elle est dans cet état, sinon (None, None). Ferme la session."""
+        with app.app_context():
+            row = db.session.query(Instance.provider_ref, Instance.machine_id) \
+                .filter_by(id=instance_id, state=state).first()
+        return row or (None, None)
+
+    def _set_state(self, instance_id, old, new, **values):
+        return Instance.query.filter_by(id=instance_id, state=old) \
+            .update({'state': new, 'state_changed_at': datetime.utcnow(), **values}, synchronize_session=False)
+
+    def _start(self, instance_id):
+        try:
+            ref = self.provisioner.create()
+        except Exception:
+            # Rien n'a démarré : on oublie l'instance (sinon elle compte dans les "en démarrage" pour toujours)
+            # et on attend avant de redemander, la passe suivante relance les démarrages manquants
+            with app.app_context():
+                machine_id = db.session.query(Instance.machine_id).filter_by(id=instance_id, state='booting').scalar()
+                if machine_id is not None:
+                    Instance.query.filter_by(id=instance_id).delete(synchronize_session=False)
+                    Machine.query.filter_by(id=machine_id).delete(synchronize_session=False)
+                    db.session.commit()
+            self._boot_failures += 1
+            self._boot_retry_at = time.monotonic() + min(self.boot_max_backoff, 2 ** self._boot_failures)
+            raise
+        self._boot_failures = 0
+        with app.app_context():
+            if self._set_state(instance_id, 'booting', 'warm', provider_ref=ref):
+                machine_id = db.session.query(Instance.machine_id).filter_by(id=instance_id).scalar()
+                Machine.query.filter_by(id=machine_id).update({'status': 'available'}, synchronize_session=False)
+                db.session.commit()
+                return
+        # Ligne supprimée pendant le démarrage (remise à zéro du parc) : la VM ne sert à personne
+        self.provisioner.destroy(ref)
+
+    def _recycle(self, instance_id):
+        ref, machine_id = self._row(instance_id, 'recycling')
+        if ref is None:
+            return
+        self.provisioner.recycle(ref)
+        with app.app_context():
+            if self._set_state(instance_id, 'recycling', 'warm'):
+                Machine.query.filter_by(id=machine_id, status='maintenance') \
+                    .update({'status': 'available'}, synchronize_session=False)
+            db.session.commit()
+
+    def _destroy(self, instance_id):
+        ref, machine_id = self._row(instance_id, 'draining')
+        if machine_id is None:
+            return
+        if ref is not None:
+            self.provisioner.destroy(ref)
+        with app.app_context():
+            Instance.query.filter_by(id=instance_id).delete(synchronize_session=False)
+            Machine.query.filter_by(id=machine_id).delete(synchronize_session=False)
+            db.session.commit()
+
+billing = get_client(BILLING_API_URL, 'Billing')
+
+def fetch_session_starts():
+    """Démarrages de session par minute sur les POOL_HISTORY_MINUTES dernières minutes (service Billing)"""
+    response = billing.get('/sessions/start-rate', params={'minutes': POOL_HISTORY_MINUTES},
+                           headers=service_auth_headers('inventory'))
+    if response.status_code != 200:
+        raise RuntimeError(f"Billing : HTTP {response.status_code}")
+    return response.json()['counts']
+
+def fetch_active_machines():
+    """PC qui ont une session ouverte (service Billing)"""
+    response = billing.get('/sessions/active', headers=service_auth_headers('inventory'))
+    if response.status_code != 200:
+        raise RuntimeError(f"Billing : HTTP {response.status_code}")
+    return [session['machine_id'] for session in response.json()]
+
+@app.cli.command('instance-pool')
+def instance_pool_command():
+    """Entretient le pool de PC virtuels (un seul processus pour tout le service)."""
+    provisioner = load_provisioner()
+    # Temps de démarrage d'une VM : celui du fournisseur simulé, ou POOL_BOOT_SECONDS pour un vrai fournisseur
+    boot_seconds = float(os.environ.get('POOL_BOOT_SECONDS', getattr(provisioner, 'boot_seconds', 60)))
+    pool = InstancePool(provisioner, WarmPoolAutoscaler.from_env(boot_seconds), fetch_session_starts,
+                        active_machines=fetch_active_machines)
+    print(f"✅ Pool de PC virtuels : {type(provisioner).__name__}, démarrage ~{boot_seconds:g}s, "
+          f"passe toutes les {POOL_RECONCILE_INTERVAL:g}s.")
+    pool.run()
+
 if __name__ == '__main__':
+    # En local (python app.py), on initialise la base au démarrage comme avant
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,58 @@
+"""Taille du pool chaud de PC virtuels, prévue d'après le rythme récent des démarrages de session.
+
+    autoscaler = WarmPoolAutoscaler.from_env(boot_seconds=30)
+    target = autoscaler.target([3, 4, 4, 6, 9])   # démarrages par intervalle, du plus ancien au plus récent
+
+Un client qui demande un PC virtuel est servi tout de suite si une instance démarrée l'attend, sinon il
+attend un démarrage complet. Le pool doit donc couvrir les demandes qui arrivent pendant le temps de
+démarrer une nouvelle instance :
+- démarrages par intervalle lissés par Holt (niveau + tendance) : une montée en charge (ouverture, tournoi)
+  est anticipée d'un démarrage, au lieu d'être suivie avec du retard ;
+- demande attendue pendant un démarrage : D = débit prévu x boot_seconds ;
+- arrivées ~ Poisson : cible = D + z·√D (z = 1.65 : ~95 % des demandes servies sans attente), bornée.
+
+Variables d'environnement : POOL_MIN_SIZE (1), POOL_MAX_SIZE (50), POOL_SAFETY_Z (1.65),
+POOL_DEMAND_SHARE (1.0 : part des démarrages de session qui demandent un PC virtuel).
+"""
+import math
+import os
+
+
+class WarmPoolAutoscaler:
+
+    def __init__(self, boot_seconds, bucket_seconds=60.0, min_size=1, max_size=50, z=1.65, demand_share=1.0,
+                 alpha=0.5, beta=0.3):
+        self.boot_seconds = boot_seconds
+        self.bucket_seconds = bucket_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self.z = z
+        self.demand_share = demand_share
+        self.alpha = alpha  # poids du dernier intervalle dans le niveau
+        self.beta = beta    # poids de la dernière variation dans la tendance
+
+    @classmethod
+    def from_env(cls, boot_seconds, bucket_seconds=60.0):
+        return cls(boot_seconds, bucket_seconds,
+                   min_size=int(os.environ.get('POOL_MIN_SIZE', 1)),
+                   max_size=int(os.environ.get('POOL_MAX_SIZE', 50)),
+                   z=float(os.environ.get('POOL_SAFETY_Z', 1.65)),
+                   demand_share=float(os.environ.get('POOL_DEMAND_SHARE', 1.0)))
+
+    def forecast(self, counts):
+        """Débit prévu (demandes par seconde) quand une instance lancée maintenant sera prête"""
+        if not counts:
+            return 0.0
+        level, trend = float(counts[0]), 0.0
+        for count in counts[1:]:
+            previous = level
+            level = self.alpha * count + (1 - self.alpha) * (level + trend)
+            trend = self.beta * (level - previous) + (1 - self.beta) * trend
+        ahead = self.boot_seconds / self.bucket_seconds  # en intervalles
+        return max(0.0, level + trend * ahead) * self.demand_share / self.bucket_seconds
+
+    def target(self, counts):
+        """Nombre d'instances chaudes (prêtes ou en démarrage) à garder"""
+        expected = self.forecast(counts) * self.boot_seconds
+        size = math.ceil(expected + self.z * math.sqrt(expected)) if expected > 0 else 0
+        return max(self.min_size, min(self.max_size, size))
@@ -0,0 +1,105 @@
+"""Battements des PC (agent sur chaque poste) : dernier état en mémoire, écrit en BDD par lots.
+
+    heartbeats = HeartbeatBuffer(upsert_heartbeats, interval=2.0)
+    heartbeats.record(machine_id, logged_in=True, idle_seconds=12.0, cpu=0.35)   # aucune requête SQL
+    heartbeats.start()                                                           # thread d'écriture du worker
+
+1 000 PC x 1 battement toutes les 5 s = 200 écritures/s si chaque requête fait son commit. Ici chaque
+worker garde le dernier état de chaque PC dans des tableaux NumPy (une ligne par PC, ~20 octets) : plusieurs
+battements d'un même PC entre deux écritures n'en font qu'une, et le thread d'écriture envoie toutes les
+lignes modifiées en un seul upsert toutes les `interval` secondes.
+Un worker arrêté perd au plus `interval` secondes de battements : le battement suivant les remplace.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class HeartbeatTable:
+    """Dernier état connu de chaque PC : colonnes NumPy, une ligne par PC (machine_id -> ligne)"""
+
+    def __init__(self, capacity=1024):
+        self._rows = {}
+        self.machine_ids = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)  # time.time()
+        self.idle_seconds = np.zeros(capacity, dtype=np.float32)
+        self.cpu = np.zeros(capacity, dtype=np.float32)  # NaN : non fourni
+        self.logged_in = np.zeros(capacity, dtype=np.bool_)
+        self.dirty = np.zeros(capacity, dtype=np.bool_)  # modifiée depuis la dernière écriture
+
+    def update(self, machine_id, at, logged_in, idle_seconds, cpu):
+        row = self._rows.get(machine_id)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self.machine_ids):
+                self._grow()
+            self._rows[machine_id] = row
+            self.machine_ids[row] = machine_id
+        elif at < self.last_seen[row]:
+            return  # arrivé dans le désordre : l'état plus récent est déjà là
+        self.last_seen[row] = at
+        self.logged_in[row] = logged_in
+        self.idle_seconds[row] = idle_seconds
+        self.cpu[row] = cpu
+        self.dirty[row] = True
+
+    def take_dirty(self):
+        """Lignes modifiées depuis le dernier appel, [(machine_id, last_seen, logged_in, idle, cpu)]"""
+        rows = np.flatnonzero(self.dirty[:len(self._rows)])
+        self.dirty[rows] = False
+        return list(zip(self.machine_ids[rows].tolist(), self.last_seen[rows].tolist(),
+                        self.logged_in[rows].tolist(), self.idle_seconds[rows].tolist(), self.cpu[rows].tolist()))
+
+    def _grow(self):
+        for name in ('machine_ids', 'last_seen', 'idle_seconds', 'cpu', 'logged_in', 'dirty'):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros_like(column)]))
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class HeartbeatBuffer:
+
+    def __init__(self, flush, interval=2.0):
+        # flush(lignes) : écrit les lignes de take_dirty() en BDD (appelé hors du verrou, depuis le thread d'écriture)
+        self.flush = flush
+        self.interval = interval  # 0 : écriture à chaque battement (pas de thread)
+        self.table = HeartbeatTable()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, machine_id, logged_in, idle_seconds, cpu, at=None):
+        with self._lock:
+            self.table.update(machine_id, time.time() if at is None else at, logged_in, idle_seconds, cpu)
+        if self.interval <= 0:
+            self.flush_now()
+
+    def flush_now(self):
+        """Écrit les lignes en attente. Renvoie leur nombre."""
+        with self._flush_lock:  # une écriture à la fois, dans l'ordre des battements
+            with self._lock:
+                rows = self.table.take_dirty()
+            if rows:
+                self.flush(rows)
+            return len(rows)
+
+    def start(self):
+        """Démarre le thread d'écriture (une fois par worker)"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='heartbeat-flush', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush_now()
+            except Exception as e:
+                # Lignes perdues pour cette fois : les battements suivants les remplacent
+                print(f"Attention: écriture des battements impossible: {e}")
@@ -0,0 +1,90 @@
+"""Provisioners de PC virtuels (cloud gaming) : créer, recycler et détruire une instance.
+
+    provisioner = load_provisioner()        # PROVISIONER : "fake" (défaut) ou "module:Classe"
+    ref = provisioner.create()              # bloque jusqu'à ce que la VM soit prête (démarrage complet)
+    provisioner.recycle(ref)                # remise à zéro entre deux clients (disque, session Windows...)
+    provisioner.destroy(ref)
+
+Les appels sont bloquants : le gestionnaire du pool (app.py, commande `flask --app app instance-pool`)
+les lance dans ses propres threads, jamais pendant une requête HTTP.
+Un vrai fournisseur (API du cloud) s'ajoute en sous-classant Provisioner, puis PROVISIONER=module:Classe.
+"""
+import abc
+import importlib
+import os
+import random
+import threading
+import time
+import uuid
+
+
+class Provisioner(abc.ABC):
+    """Une exception (API du fournisseur indisponible, quota...) fait échouer l'opération : le gestionnaire
+    du pool oublie l'instance qui démarrait et en redemande une plus tard."""
+
+    @abc.abstractmethod
+    def create(self):
+        """Démarre une instance et renvoie sa référence chez le fournisseur, une fois qu'elle est prête"""
+
+    @abc.abstractmethod
+    def recycle(self, ref):
+        """Remet l'instance dans l'état d'une instance neuve (entre deux clients)"""
+
+    @abc.abstractmethod
+    def destroy(self, ref):
+        """Détruit l'instance (plus facturée)"""
+
+
+class FakeProvisioner(Provisioner):
+    """Fournisseur simulé pour le développement et les benchmarks : pas de VM, seulement les délais.
+
+    FAKE_BOOT_SECONDS (30), FAKE_RECYCLE_SECONDS (5), FAKE_JITTER (0.2 = ±20 %).
+    Compte les secondes-instance facturables (création -> destruction), comme un fournisseur cloud.
+    """
+
+    def __init__(self, boot_seconds=None, recycle_seconds=None, jitter=None):
+        self.boot_seconds = float(os.environ.get('FAKE_BOOT_SECONDS', 30)) if boot_seconds is None else boot_seconds
+        self.recycle_seconds = float(os.environ.get('FAKE_RECYCLE_SECONDS', 5)) \
+            if recycle_seconds is None else recycle_seconds
+        self.jitter = float(os.environ.get('FAKE_JITTER', 0.2)) if jitter is None else jitter
+        self._started = {}  # ref -> démarrage (instances vivantes)
+        self._billed = 0.0  # secondes-instance des instances détruites
+        self._lock = threading.Lock()
+
+    def _wait(self, seconds):
+        time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def create(self):
+        ref = f"fake-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._started[ref] = time.monotonic()  # facturée dès la demande, démarrage compris
+        self._wait(self.boot_seconds)
+        return ref
+
+    def recycle(self, ref):
+        self._wait(self.recycle_seconds)
+
+    def destroy(self, ref):
+        with self._lock:
+            started = self._started.pop(ref, None)
+            if started is not None:
+                self._billed += time.monotonic() - started
+
+    @property
+    def alive(self):
+        return len(self._started)
+
+    def instance_seconds(self):
+        """Secondes-instance facturées jusqu'ici (instances détruites + vivantes)"""
+        now = time.monotonic()
+        with self._lock:
+            return self._billed + sum(now - started for started in self._started.values())
+
+
+def load_provisioner(name=None):
+    """Provisioner choisi par PROVISIONER : "fake" ou "paquet.module:Classe" (constructeur sans argument)"""
+    name = name or os.environ.get('PROVISIONER', 'fake')
+    if name == 'fake':
+        return FakeProvisioner()
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
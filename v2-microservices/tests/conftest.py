@@ -0,0 +1,70 @@
+"""Services chargés pour les tests : chaque app.py est importé sous un nom unique (inventory_app, billing_app),
+avec sa propre base SQLite temporaire. Un service n'est chargé qu'une fois par session pytest (configuration
+lue à l'import, métriques Prometheus enregistrées une seule fois) : chaque test prend ses propres PC."""
+import functools
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)  # common, benchmarks
+
+from benchmarks.stubs import start_stub_server
+
+
+def load_service(service, **env):
+    """Importe service-<service>/app.py avec ces variables d'environnement et crée son schéma"""
+    directory = os.path.join(ROOT, f'service-{service}')
+    os.environ.update(env)
+    sys.path.insert(0, directory)  # modules locaux du service (analytics, autoscaler...)
+    name = f'{service}_app'
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    with module.app.app_context():
+        module.init_db()
+    return module
+
+
+class InventoryStub:
+    """Faux Inventory pour le Billing : routes fixées par test, requêtes reçues enregistrées"""
+
+    def __init__(self):
+        self.routes = {}  # dict lu par le serveur à chaque requête
+        self.requests = []  # (méthode, chemin, corps JSON)
+        self.server = start_stub_server(self.routes)
+
+    def reset(self, routes):
+        """routes = {chemin: payload JSON ou callable(handler) -> (statut, corps)}"""
+        self.requests.clear()
+        self.routes.clear()
+        self.routes.update({path: functools.partial(self._record, path, reply) for path, reply in routes.items()})
+
+    def _record(self, path, reply, handler):
+        self.requests.append((handler.command, path, json.loads(handler.body) if handler.body else None))
+        return reply(handler) if callable(reply) else (200, reply)
+
+
+@pytest.fixture(scope='session')
+def inventory(tmp_path_factory):
+    return load_service('inventory', DATABASE_URL=f"sqlite:///{tmp_path_factory.mktemp('inventory')}/inventory.db")
+
+
+@pytest.fixture(scope='session')
+def inventory_stub():
+    stub = InventoryStub()
+    yield stub
+    stub.server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def billing(tmp_path_factory, inventory_stub):
+    module = load_service('billing', DATABASE_URL=f"sqlite:///{tmp_path_factory.mktemp('billing')}/billing.db",
+                          INVENTORY_API_URL=inventory_stub.server.url)
+    # Les tests livrent l'outbox eux-mêmes (dispatch_outbox_batch), sans le thread de fond
+    module.wake_outbox_dispatcher = lambda: None
+    return module
@@ -0,0 +1,105 @@
+"""Statistiques d'occupation (service-billing/analytics.py) : balayage des sessions et calcul par paquets
+de jours clos sous budget de temps (AnalyticsPending, puis reprise)."""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from common.auth import auth_headers, issue_token
+from common.cache import TTLCache
+
+NOW = datetime(2025, 3, 10, 12, 0)
+
+
+class Store:
+    """Sessions et jours figés en mémoire, à la place de la BDD"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions  # (machine_id, start_time, end_time, total_price)
+        self.days = {}
+        self.saves = []
+        self.loads = 0
+
+    def load_sessions(self, start, end=None):
+        self.loads += 1
+        yield [s for s in self.sessions if (s[2] is None or s[2] > start) and (end is None or s[1] < end)]
+
+    def load_days(self, first, last):
+        return {day: data for day, data in self.days.items() if first <= day <= last}
+
+    def save_days(self, blocks):
+        self.saves.append(sorted(blocks))
+        self.days.update(blocks)
+
+
+@pytest.fixture
+def analytics_module(billing):
+    return billing.OccupancyAnalytics, billing.AnalyticsPending
+
+
+def make(analytics_module, store, chunk_days=31):
+    OccupancyAnalytics, _ = analytics_module
+    return OccupancyAnalytics(store.load_sessions, store.load_days, store.save_days, now=lambda: NOW,
+                              cache=TTLCache(1000, 3600), chunk_days=chunk_days)
+
+
+def test_report_sweeps_sessions(analytics_module):
+    store = Store([
+        (1, datetime(2025, 3, 8, 10, 0), datetime(2025, 3, 8, 12, 0), 5.0),
+        (2, datetime(2025, 3, 8, 11, 0), datetime(2025, 3, 8, 11, 30), 2.5),
+        (1, datetime(2025, 3, 9, 23, 0), datetime(2025, 3, 10, 1, 0), 4.0),  # à cheval sur minuit
+    ])
+    report = make(analytics_module, store).report(date(2025, 3, 8), date(2025, 3, 10))
+
+    assert report['sessions'] == 3
+    assert report['revenue'] == 11.5
+    assert report['concurrency']['peak'] == 2
+    assert report['concurrency']['peak_at'] == '2025-03-08T11:00:00'
+    assert {m['machine_id']: m['busy_hours'] for m in report['machines']} == {1: 4.0, 2: 0.5}
+    assert [d['busy_hours'] for d in report['daily']] == [2.5, 1.0, 1.0]
+    assert [d['sessions'] for d in report['daily']] == [2, 0, 1]
+
+
+def test_closed_days_are_computed_in_chunks_and_resumed(analytics_module):
+    _, AnalyticsPending = analytics_module
+    store = Store([(1, datetime(2025, 3, day, 9, 0), datetime(2025, 3, day, 10, 0), 1.0) for day in range(1, 10)])
+    analytics = make(analytics_module, store, chunk_days=3)
+
+    # Budget nul : un paquet par appel, progression comptée sur les 9 jours clos
+    progress = []
+    while True:
+        try:
+            report = analytics.report(date(2025, 3, 1), date(2025, 3, 10), budget=0)
+            break
+        except AnalyticsPending as e:
+            progress.append((e.done, e.total))
+    assert progress == [(3, 9), (6, 9)]
+    assert [len(days) for days in store.saves] == [3, 3, 3]
+    assert report['sessions'] == 9
+
+    # Un autre worker (cache vide) relit les jours figés en BDD : seul le jour en cours relit les sessions
+    store.loads = 0
+    assert make(analytics_module, store).report(date(2025, 3, 1), date(2025, 3, 10))['sessions'] == 9
+    assert store.loads == 1
+
+
+def test_route_answers_202_until_computed(billing, monkeypatch):
+    monkeypatch.setattr(billing, 'ANALYTICS_BUDGET_SECONDS', 0)
+    monkeypatch.setattr(billing.analytics, 'chunk_days', 5)
+    today = billing.local_now().date()
+    with billing.app.app_context():
+        billing.forget_analytics()
+        billing.db.session.commit()
+    client = billing.app.test_client()
+    headers = auth_headers(issue_token('1', 'admin', is_admin=True))
+    # Jours tous clos (hier reste ouvert quelques minutes après minuit)
+    url = f"/sessions/analytics?from={today - timedelta(days=12)}&to={today - timedelta(days=2)}"
+
+    pending = client.get(url, headers=headers)
+    assert pending.status_code == 202
+    assert pending.headers['Retry-After'] == '1'
+    assert pending.get_json() == {'status': 'computing', 'done': 5, 'total': 11}
+    assert client.get(url, headers=headers).get_json()['done'] == 10
+
+    final = client.get(url, headers=headers)
+    assert final.status_code == 200
+    assert len(final.get_json()['daily']) == 11
@@ -0,0 +1,83 @@
+"""Outbox du Billing : ordres occupy/release livrés par lots à l'Inventory (ici un faux Inventory)."""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def outbox(billing, inventory_stub):
+    """Outbox vide ; renvoie une fonction qui ajoute des ordres [(commande, PC)] et rend leurs ids"""
+    with billing.app.app_context():
+        billing.OutboxCommand.query.delete()
+        billing.db.session.commit()
+
+    def add(*commands):
+        with billing.app.app_context():
+            rows = [billing.OutboxCommand(command=command, machine_id=machine_id) for command, machine_id in commands]
+            billing.db.session.add_all(rows)
+            billing.db.session.commit()
+            return [row.id for row in rows]
+    return add
+
+
+def dispatch(billing):
+    with billing.app.app_context():
+        return billing.dispatch_outbox_batch()
+
+
+def commands(billing):
+    with billing.app.app_context():
+        return {c.id: c for c in billing.OutboxCommand.query.all()}
+
+
+def test_one_request_per_batch_with_newest_command_per_machine(billing, inventory_stub, outbox):
+    inventory_stub.reset({'/machines/status': {'conflicts': [], 'not_found': [3]}})
+    occupy_1, occupy_2, release_1, occupy_3 = outbox(('occupy', 1), ('occupy', 2), ('release', 1), ('occupy', 3))
+
+    assert dispatch(billing) == 4
+    assert inventory_stub.requests == [('POST', '/machines/status', {'occupy': [2, 3], 'release': [1]})]
+
+    rows = commands(billing)
+    assert all(row.delivered_at is not None and row.claim_token is None for row in rows.values())
+    assert rows[occupy_1].last_error == 'remplacé par un ordre plus récent'
+    assert rows[occupy_2].last_error is None and rows[release_1].last_error is None
+    assert rows[occupy_3].last_error == 'PC introuvable'
+    assert dispatch(billing) == 0
+
+
+def test_batch_size_is_capped(billing, inventory_stub, outbox, monkeypatch):
+    monkeypatch.setattr(billing, 'OUTBOX_BATCH_SIZE', 2)
+    inventory_stub.reset({'/machines/status': {'conflicts': [], 'not_found': []}})
+    outbox(*[('occupy', machine_id) for machine_id in range(10, 15)])
+
+    assert [dispatch(billing) for _ in range(4)] == [2, 2, 1, 0]
+    assert [len(body['occupy']) for _, _, body in inventory_stub.requests] == [2, 2, 1]
+
+
+def test_rejected_batch_falls_back_to_one_request_per_machine(billing, inventory_stub, outbox):
+    inventory_stub.reset({
+        '/machines/status': lambda handler: (400, {'error': 'Trop de PC'}),
+        '/machines/20/occupy': {'status': 'occupied'},
+        '/machines/21/occupy': lambda handler: (400, {'error': 'Machine already occupied'}),
+        '/machines/22/release': lambda handler: (404, {'error': 'Machine not found'}),
+    })
+    ids = outbox(('occupy', 20), ('occupy', 21), ('release', 22))
+
+    assert dispatch(billing) == 3
+    assert [path for _, path, _ in inventory_stub.requests] == [
+        '/machines/status', '/machines/20/occupy', '/machines/21/occupy', '/machines/22/release']
+    rows = commands(billing)
+    assert [rows[i].last_error for i in ids] == [None, 'PC déjà occupé', 'PC introuvable']
+    assert all(rows[i].delivered_at is not None for i in ids)
+
+
+def test_failed_delivery_is_retried_later(billing, inventory_stub, outbox):
+    inventory_stub.reset({'/machines/status': lambda handler: (500, {'error': 'boom'})})
+    [command_id] = outbox(('occupy', 30))
+
+    assert dispatch(billing) == 1
+    row = commands(billing)[command_id]
+    assert row.delivered_at is None and row.claim_token is None
+    assert row.attempts == 1 and row.last_error == 'HTTP 500'
+    assert row.next_attempt_at > datetime.utcnow()
+    assert dispatch(billing) == 0  # pas avant le backoff
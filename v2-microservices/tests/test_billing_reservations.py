@@ -0,0 +1,50 @@
+"""Réservations du Billing : un créneau déjà pris est refusé (409), même entre requêtes simultanées."""
+import threading
+from datetime import timedelta
+
+import pytest
+
+from common.auth import auth_headers, issue_token
+
+
+@pytest.fixture
+def book(billing):
+    start = billing.local_now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+
+    def book(user_id, machine_ids, hours=(0, 2)):
+        response = billing.app.test_client().post('/reservations', json={
+            'machine_ids': machine_ids,
+            'start': (start + timedelta(hours=hours[0])).isoformat(),
+            'end': (start + timedelta(hours=hours[1])).isoformat(),
+        }, headers=auth_headers(issue_token(str(user_id), f'client{user_id}')))
+        return response.status_code, response.get_json()
+    return book
+
+
+def test_overlapping_slot_is_refused(book):
+    assert book(1, [101, 102])[0] == 201
+
+    status, body = book(2, [102, 103], hours=(1, 3))
+    assert status == 409
+    assert body['conflicts'] == [102]
+
+    # Tout ou rien : le PC 103 n'a pas été réservé, et le créneau suivant est libre
+    assert book(2, [103], hours=(1, 3))[0] == 201
+    assert book(3, [101, 102], hours=(2, 4))[0] == 201
+
+
+def test_concurrent_bookings_keep_one_per_machine(billing, book, monkeypatch):
+    # Sans le refus immédiat de l'index en mémoire : seul le verrou en BDD départage les requêtes
+    monkeypatch.setattr(billing.availability, 'is_free', lambda *args: True)
+    statuses = []
+    threads = [threading.Thread(target=lambda user_id=user_id: statuses.append(book(user_id, [201, 202])[0]))
+               for user_id in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [409] * 7
+    with billing.app.app_context():
+        booked = billing.Reservation.query.filter(billing.Reservation.machine_id.in_([201, 202])).count()
+    assert booked == 2
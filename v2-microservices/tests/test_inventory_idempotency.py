@@ -0,0 +1,91 @@
+"""Header Idempotency-Key de l'Inventory : un appel rejoué (retry du Billing) ne refait pas l'action."""
+import uuid
+
+import pytest
+
+from common.auth import auth_headers, issue_token, service_auth_headers
+
+
+@pytest.fixture
+def client(inventory):
+    return inventory.app.test_client()
+
+
+@pytest.fixture
+def admin():
+    return auth_headers(issue_token('1', 'admin', is_admin=True))
+
+
+def keyed(headers):
+    return {**headers, 'Idempotency-Key': str(uuid.uuid4())}
+
+
+def create_machine(client, admin):
+    response = client.post('/machines', headers=admin)
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def test_create_replay_returns_same_machine(client, admin):
+    headers = keyed(admin)
+    first = client.post('/machines', headers=headers)
+    again = client.post('/machines', headers=headers)
+    assert first.status_code == again.status_code == 201
+    assert again.get_json() == first.get_json()
+    assert client.get(f"/machines/{first.get_json()['id'] + 1}", headers=admin).status_code == 404
+
+
+def test_occupy_replay_does_not_conflict(client, admin):
+    machine_id = create_machine(client, admin)
+    headers = keyed(service_auth_headers('billing'))
+    first = client.post(f'/machines/{machine_id}/occupy', headers=headers)
+    again = client.post(f'/machines/{machine_id}/occupy', headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.get_json() == first.get_json()
+
+    # Une autre demande (autre clé) voit bien le PC occupé
+    other = client.post(f'/machines/{machine_id}/occupy', headers=keyed(service_auth_headers('billing')))
+    assert other.status_code == 400
+
+
+def warm_instance(inventory):
+    with inventory.app.app_context():
+        machine = inventory.Machine(name=f"VM-{uuid.uuid4().hex[:8]}", status='available')
+        inventory.db.session.add(machine)
+        inventory.db.session.flush()
+        inventory.db.session.add(inventory.Instance(machine_id=machine.id, provider_ref='fake', state='warm'))
+        inventory.db.session.commit()
+        return machine.id
+
+
+def drain_warm_pool(inventory):
+    with inventory.app.app_context():
+        inventory.Instance.query.filter_by(state='warm').update({'state': 'draining'})
+        inventory.db.session.commit()
+
+
+def test_acquire_replay_returns_same_instance(inventory, client):
+    drain_warm_pool(inventory)
+    first_id, second_id = warm_instance(inventory), warm_instance(inventory)
+    headers = keyed(service_auth_headers('billing'))
+
+    first = client.post('/instances/acquire', headers=headers)
+    again = client.post('/instances/acquire', headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.get_json() == first.get_json()
+    assert first.get_json()['machine_id'] in (first_id, second_id)
+
+    other = client.post('/instances/acquire', headers=keyed(service_auth_headers('billing')))
+    assert other.get_json()['machine_id'] != first.get_json()['machine_id']
+
+
+def test_acquire_miss_is_not_replayed(inventory, client):
+    drain_warm_pool(inventory)
+    headers = keyed(service_auth_headers('billing'))
+    assert client.post('/instances/acquire', headers=headers).status_code == 503
+
+    # Instance prête entre-temps : la relance avec la même clé l'obtient (le 503 n'est pas rejoué)
+    machine_id = warm_instance(inventory)
+    retry = client.post('/instances/acquire', headers=headers)
+    assert retry.status_code == 200
+    assert retry.get_json()['machine_id'] == machine_id
@@ -0,0 +1,33 @@
+"""Le monolithe v1 garde une copie de certains modules v2 (pas de paquet partagé entre les deux images Docker).
+La version de v2 fait référence : la copie v1 doit rester identique, aux imports relatifs près."""
+import os
+import re
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# copie v1 -> référence v2
+SHARED = {
+    'app/events.py': 'common/feed.py',
+    'app/availability.py': 'common/availability.py',
+    'app/analytics.py': 'service-billing/analytics.py',
+    'app/database.py': 'common/database.py',
+    'app/export.py': 'common/export.py',
+    'app/cache.py': 'common/cache.py',
+    'app/metrics.py': 'common/metrics.py',
+}
+
+
+def read(*parts):
+    with open(os.path.join(ROOT, *parts), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('copy, reference', sorted(SHARED.items()))
+def test_v1_copy_matches_v2_reference(copy, reference):
+    header, _, body = read('v1-monolith', copy).partition('\n')
+    assert header.startswith(f'# Copie de v2-microservices/{reference} ')
+    reference_source = read('v2-microservices', reference)
+    expected = re.sub(r'^from common\.(\w+) import', r'from .\1 import', reference_source, flags=re.M)
+    assert body == expected, f"v1-monolith/{copy} a divergé de v2-microservices/{reference}"
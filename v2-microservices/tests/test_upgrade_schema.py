@@ -0,0 +1,31 @@
+"""init-db sur une base en service : upgrade_schema met le schéma d'origine au niveau des modèles"""
+import sqlite3
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+
+from common.database import upgrade_schema
+
+
+def test_upgrade_creates_missing_indexes(billing, tmp_path):
+    path = tmp_path / 'billing.db'
+    # Table session telle que créée par la première version du Billing : ni user_id, ni index
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE session (id INTEGER PRIMARY KEY, machine_id INTEGER NOT NULL, "
+                           "start_time DATETIME, end_time DATETIME, total_price FLOAT)")
+        connection.execute("INSERT INTO session (machine_id, start_time, end_time, total_price) "
+                           "VALUES (1, '2024-01-01 10:00:00', '2024-01-01 11:00:00', 2.5)")
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db = SQLAlchemy(app, metadata=billing.db.metadata)
+
+    with app.app_context():
+        changes = upgrade_schema(db)
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('session')}
+        assert upgrade_schema(db) == []  # idempotent
+
+    # Index sur des colonnes déjà présentes (start_time, end_time) comme sur la colonne ajoutée (user_id)
+    assert {'ix_session_start', 'ix_session_end_time', 'ix_session_user_end'} <= indexes
+    assert 'index ix_session_start créé' in changes
+    assert 'session.user_id ajoutée' in changes